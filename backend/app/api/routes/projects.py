@@ -1,17 +1,28 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, AsyncIterator
+import asyncio
+import json
 import uuid
 from loguru import logger
 
 try:  # when run from backend/
     from app.services.ai_agent import get_agent
+    from app.services.circuit_breaker import CircuitOpenError
+    from app.services.deadline import Deadline, DeadlineExceeded, request_deadline
+    from app.services.rate_limiter import RateLimitTimeout
+    from app.services.session_store import SessionConflictError
     from app.services.schema_generator import generate_all
     from app.models.deployment import DeploymentRequest, DeploymentResponse, DatabaseType
     from app.services.deployment.factory import DeploymentFactory
     from app.core.config import settings
 except ImportError:  # when run from repo root
     from backend.app.services.ai_agent import get_agent
+    from backend.app.services.circuit_breaker import CircuitOpenError
+    from backend.app.services.deadline import Deadline, DeadlineExceeded, request_deadline
+    from backend.app.services.rate_limiter import RateLimitTimeout
+    from backend.app.services.session_store import SessionConflictError
     from backend.app.services.schema_generator import generate_all
     from backend.app.models.deployment import DeploymentRequest, DeploymentResponse, DatabaseType
     from backend.app.services.deployment.factory import DeploymentFactory
@@ -75,6 +86,8 @@ class ChatNextResponse(BaseModel):
     prompt: str
     done: bool
     partial_spec: Dict[str, Any]
+    template: Optional[str] = None
+    budget: Optional[Dict[str, float]] = None
 
 
 class ChatFinishRequest(BaseModel):
@@ -84,13 +97,14 @@ class ChatFinishRequest(BaseModel):
 class ChatFinishResponse(BaseModel):
     project_id: str
     spec: Dict[str, Any]
+    usage: Optional[Dict[str, Any]] = None
 
 
 @router.post("/new_project/start", response_model=ChatStartResponse)
 async def chat_start(payload: ChatStartRequest):
     try:
         logger.info(f"Starting new session: name='{payload.name}', description='{payload.description}'")
-        out = get_agent().start_session(payload.name, payload.description)
+        out = await get_agent().start_session(payload.name, payload.description)
         logger.info(f"Session started successfully: session_id='{out.get('session_id')}'")
         return out
     except Exception as e:
@@ -99,8 +113,9 @@ async def chat_start(payload: ChatStartRequest):
 
 
 @router.post("/new_project/next", response_model=ChatNextResponse)
-async def chat_next(payload: ChatNextRequest):
+async def chat_next(payload: ChatNextRequest, x_request_timeout: Optional[str] = Header(None)):
     try:
+        deadline = request_deadline(x_request_timeout)
         # Validate input
         session_id_str = str(payload.session_id) if payload.session_id else ""
         answer_str = str(payload.answer) if payload.answer else ""
@@ -112,11 +127,23 @@ async def chat_next(payload: ChatNextRequest):
         
         logger.info(f"Calling agent_service.next_turn with session_id='{session_id_str}', answer='{answer_str[:100]}...'")
         try:
-            out = get_agent().next_turn(session_id_str, answer_str)
+            out = await get_agent().next_turn(session_id_str, answer_str, deadline=deadline)
             logger.info(f"agent_service.next_turn succeeded")
         except ValueError as ve:
             logger.error(f"agent_service.next_turn failed with ValueError: {ve}")
             raise HTTPException(status_code=400, detail=str(ve))
+        except SessionConflictError as ce:
+            logger.warning(f"agent_service.next_turn lost a concurrent update race: {ce}")
+            raise HTTPException(status_code=409, detail="Session was updated concurrently. Please retry.")
+        except RateLimitTimeout as rt:
+            logger.warning(f"agent_service.next_turn timed out in the model rate-limit queue: {rt}")
+            raise HTTPException(status_code=503, detail="AI service is busy. Please try again shortly.")
+        except CircuitOpenError as co:
+            logger.warning(f"agent_service.next_turn rejected: {co}")
+            raise _circuit_open(co)
+        except DeadlineExceeded as de:
+            logger.warning(f"agent_service.next_turn ran out of time: {de}")
+            raise _deadline_exceeded(deadline)
         except Exception as e:
             logger.exception(f"agent_service.next_turn failed: {e}")
             raise
@@ -143,15 +170,127 @@ async def chat_next(payload: ChatNextRequest):
         raise HTTPException(status_code=500, detail="AI service temporarily unavailable. Please try again.")
 
 
+@router.get("/new_project/stats")
+async def chat_stats():
+    """Session-store memory statistics, model token usage, compaction savings, suggestion-cache counters, model latency histograms, per-phase generation latency, rate-limit queue and circuit-breaker state."""
+    try:
+        agent = get_agent()
+        return {
+            "sessions": agent.session_stats(),
+            "usage": agent.usage_totals(),
+            "history_compaction": agent.compaction_totals(),
+            "suggestion_cache": agent.suggestion_cache_stats(),
+            "model_latency": agent.latency_stats(),
+            "generation_phases": agent.phase_stats(),
+            "rate_limit": agent.rate_limit_stats(),
+            "circuit_breaker": agent.circuit_stats(),
+            "llm": agent.llm_metrics(),
+        }
+    except Exception as e:
+        logger.exception("chat_stats failed")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _deadline_exceeded(deadline: Deadline) -> HTTPException:
+    """504 carrying how much of the request's time budget was used."""
+    return HTTPException(
+        status_code=504,
+        detail={"message": "AI service did not answer within the request time budget.", "budget": deadline.report()},
+    )
+
+
+def _circuit_open(error: CircuitOpenError) -> HTTPException:
+    """503 telling the client when the model provider will be tried again."""
+    return HTTPException(
+        status_code=503,
+        detail=str(error),
+        headers={"Retry-After": str(max(1, round(error.retry_after)))},
+    )
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    """Format one Server-Sent Events frame."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/new_project/next/stream")
+async def chat_next_stream(payload: ChatNextRequest, x_request_timeout: Optional[str] = Header(None)):
+    """Streaming variant of /new_project/next over Server-Sent Events.
+
+    Emits ``delta`` events with next_question text as it is generated, then a ``final`` event
+    with the same body as /new_project/next (prompt, done, partial_spec).
+    """
+    session_id_str = str(payload.session_id) if payload.session_id else ""
+    answer_str = str(payload.answer) if payload.answer else ""
+    if not session_id_str.strip() or not answer_str.strip():
+        raise HTTPException(status_code=400, detail="session_id and answer are required")
+    try:
+        deadline = request_deadline(x_request_timeout)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+
+    logger.info(f"Received chat_next_stream request: session_id='{session_id_str}', answer_length={len(answer_str)}")
+    events = get_agent().next_turn_stream(session_id_str, answer_str, deadline=deadline)
+    try:
+        # Pull the first event before responding so invalid sessions still map to a 400
+        first = await events.__anext__()
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    except SessionConflictError as ce:
+        logger.warning(f"chat_next_stream lost a concurrent update race: {ce}")
+        raise HTTPException(status_code=409, detail="Session was updated concurrently. Please retry.")
+    except RateLimitTimeout:
+        raise HTTPException(status_code=503, detail="AI service is busy. Please try again shortly.")
+    except CircuitOpenError as co:
+        raise _circuit_open(co)
+    except DeadlineExceeded:
+        raise _deadline_exceeded(deadline)
+    except Exception:
+        logger.exception("chat_next_stream failed")
+        raise HTTPException(status_code=500, detail="AI service temporarily unavailable. Please try again.")
+
+    async def event_source() -> AsyncIterator[str]:
+        yield _sse(first["event"], first["data"])
+        try:
+            async for item in events:
+                yield _sse(item["event"], item["data"])
+        except SessionConflictError:
+            logger.warning("chat_next_stream lost a concurrent update race")
+            yield _sse("error", {"detail": "Session was updated concurrently. Please retry.", "status": 409})
+        except RateLimitTimeout:
+            logger.warning("chat_next_stream timed out in the model rate-limit queue")
+            yield _sse("error", {"detail": "AI service is busy. Please try again shortly.", "status": 503})
+        except CircuitOpenError as co:
+            yield _sse("error", {"detail": str(co), "status": 503, "retry_after": round(co.retry_after)})
+        except DeadlineExceeded:
+            yield _sse("error", {
+                "detail": "AI service did not answer within the request time budget.",
+                "status": 504,
+                "budget": deadline.report(),
+            })
+        except Exception:
+            logger.exception("chat_next_stream failed mid-stream")
+            yield _sse("error", {"detail": "AI service temporarily unavailable. Please try again."})
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.post("/new_project/finish", response_model=ChatFinishResponse)
 async def chat_finish(payload: ChatFinishRequest):
     try:
-        out = get_agent().finalize(payload.session_id)
+        out = await get_agent().finalize(payload.session_id)
         spec = out.get("spec", {})
         
-        # Try to generate all schema formats, but don't fail if it doesn't work
+        # Artifacts are usually precomputed in the background once the conversation completed;
+        # otherwise generate them now (in a worker thread so the event loop stays free)
         try:
-            generated_schemas = generate_all(spec)
+            generated_schemas = out.get("artifacts")
+            if generated_schemas is None:
+                generated_schemas = await asyncio.to_thread(generate_all, spec)
             # Merge generated schemas into the spec
             final_spec = {**spec, **generated_schemas}
         except Exception as schema_error:
@@ -159,7 +298,7 @@ async def chat_finish(payload: ChatFinishRequest):
             # Return spec without generated schemas if generation fails
             final_spec = spec
         
-        return {"project_id": out["project_id"], "spec": final_spec}
+        return {"project_id": out["project_id"], "spec": final_spec, "usage": out.get("usage")}
     except ValueError as ve:
         raise HTTPException(status_code=400, detail=str(ve))
     except Exception as e:
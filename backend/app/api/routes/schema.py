@@ -1,14 +1,18 @@
 from fastapi import APIRouter, HTTPException
-from fastapi import Body
+from fastapi import Body, Header
 from loguru import logger
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 try:  # when run from backend/
-    from app.services.schema_generator import generate_all, validate_spec, to_postgres_sql
+    from app.services.schema_generator import generate_all
+    from app.services.spec_compiler import compile_spec
     from app.services import ai_agent
+    from app.services.deadline import request_deadline
 except ImportError:  # when run from repo root
-    from backend.app.services.schema_generator import generate_all, validate_spec, to_postgres_sql
+    from backend.app.services.schema_generator import generate_all
+    from backend.app.services.spec_compiler import compile_spec
     from backend.app.services import ai_agent
+    from backend.app.services.deadline import request_deadline
 
 router = APIRouter()
 
@@ -17,10 +21,10 @@ router = APIRouter()
 async def generate_schema(spec: Dict[str, Any] = Body(...)):
     """Generate database schema artifacts from a provided ProjectSpec-like dict."""
     try:
-        ok, errors = validate_spec(spec)
-        if not ok:
-            raise HTTPException(status_code=422, detail={"errors": errors})
-        artifacts = generate_all(spec)
+        compiled = compile_spec(spec)
+        if compiled.errors:
+            raise HTTPException(status_code=422, detail={"errors": compiled.errors})
+        artifacts = generate_all(compiled)
         return artifacts
     except HTTPException:
         raise
@@ -41,17 +45,13 @@ async def update_schema(request: Dict[str, Any] = Body(...)):
         
         logger.info(f"Updating schema for project {project_id}")
         
-        # Generate updated artifacts from the modified schema
-        try:
-            ok, errors = validate_spec(schema)
-            if not ok:
-                logger.warning(f"Schema validation errors: {errors}")
-                # Still process even with validation errors for manual edits
-        except Exception as e:
-            logger.warning(f"Could not validate schema: {e}")
+        # Generate updated artifacts from the modified schema (compiled once, validated and rendered from the same IR)
+        compiled = compile_spec(schema)
+        if compiled.errors:
+            logger.warning(f"Schema validation errors: {compiled.errors}")
         
         # Generate all artifacts from the updated schema
-        artifacts = generate_all(schema)
+        artifacts = generate_all(compiled)
         
         logger.info(f"Successfully updated schema for project {project_id}")
         
@@ -67,9 +67,17 @@ async def update_schema(request: Dict[str, Any] = Body(...)):
 
 
 @router.post("/suggestions")
-async def get_ai_suggestions(request: Dict[str, Any] = Body(...)):
-    """Get AI suggestions for improving the database schema."""
+async def get_ai_suggestions(request: Dict[str, Any] = Body(...), x_request_timeout: Optional[str] = Header(None)):
+    """Get AI suggestions for improving the database schema.
+
+    ``X-Request-Timeout`` (seconds) bounds the model call; when it runs out the fallback
+    suggestions are returned. ``budget`` reports how much of the time budget was used.
+    """
     try:
+        try:
+            deadline = request_deadline(x_request_timeout)
+        except ValueError as ve:
+            raise HTTPException(status_code=400, detail=str(ve))
         schema = request.get("schema")
         rejected_suggestions = request.get("rejected_suggestions", [])
         previously_suggested = request.get("previously_suggested", [])
@@ -77,16 +85,16 @@ async def get_ai_suggestions(request: Dict[str, Any] = Body(...)):
         if not schema:
             raise HTTPException(status_code=400, detail="Missing schema in request")
         
-        # Generate PostgreSQL SQL from the schema
-        postgres_sql = to_postgres_sql(schema)
-        
-        # Call AI agent to get suggestions
+        # Cached per schema + exclusion lists; SQL is only rendered and the model only called on a miss
         logger.info(f"Generating AI suggestions for schema improvements (rejected: {rejected_suggestions}, previously suggested: {previously_suggested})")
-        suggestions = ai_agent.agent_service.generate_schema_suggestions(postgres_sql, schema, rejected_suggestions, previously_suggested)
+        suggestions = await ai_agent.get_agent().suggest_for_schema(
+            schema, rejected_suggestions, previously_suggested, deadline=deadline,
+        )
         
         return {
             "option_1": suggestions.get("option_1"),
-            "option_2": suggestions.get("option_2")
+            "option_2": suggestions.get("option_2"),
+            "budget": deadline.report(),
         }
     except HTTPException:
         raise
@@ -51,9 +51,105 @@ class Settings(BaseSettings):
     # Other
     PASSWORD: Optional[str] = None
     
+    # Let the model answer edit turns with small spec_patch operations instead of full entities
+    AGENT_SPEC_PATCH_MODE: bool = False
+    
+    # Force tool use so the model's control/suggestion JSON arrives already parsed
+    AGENT_STRUCTURED_OUTPUT: bool = False
+    
+    # Answer a first turn that clearly describes a common domain (healthcare, e-commerce, ...)
+    # with a local template spec at once; the model refines it in the background
+    # Off by default: a wrong template answers the user with an unrelated schema
+    AGENT_DOMAIN_TEMPLATES: bool = False
+    AGENT_DOMAIN_TEMPLATE_THRESHOLD: float = 0.4
+    
+    # Fan-out: the done turn returns an entity outline, then field definitions are written per
+    # subdomain group (at most AGENT_FANOUT_GROUP_SIZE entities) in concurrent model calls
+    AGENT_FANOUT_MODE: bool = False
+    AGENT_FANOUT_GROUP_SIZE: int = 6
+    AGENT_FANOUT_MAX_TOKENS: int = 3000
+    
+    # Time budget for one chat/suggestion request (clients may send X-Request-Timeout, in seconds,
+    # up to the maximum); model attempts are cut to what is left and a spent budget answers 504
+    AGENT_REQUEST_TIMEOUT_SECONDS: float = 90.0
+    AGENT_REQUEST_TIMEOUT_MAX_SECONDS: float = 300.0
+    
+    # Per-phase generation profiles. Question turns (clarifying questions plus small spec deltas)
+    # can use a faster model; spec turns (completion, the AGENT_SPEC_PHASE_AFTER_TURNS-th answer
+    # on, "that's everything" answers, and edits after completion) get the large budget. The
+    # prompt asks the model to finish after one or two answers, so the spec phase starts at the
+    # second answer and the question budget stays large enough for a first answer that already
+    # completes the spec. Unset models mean ANTHROPIC_MODEL. A truncated question turn is
+    # retried on the spec profile.
+    AGENT_QUESTION_MODEL: Optional[str] = None
+    AGENT_QUESTION_MAX_TOKENS: int = 4000
+    AGENT_QUESTION_TIMEOUT_SECONDS: float = 30.0
+    AGENT_SPEC_MODEL: Optional[str] = None
+    AGENT_SPEC_MAX_TOKENS: int = 8000
+    AGENT_SPEC_TIMEOUT_SECONDS: float = 60.0
+    AGENT_SPEC_PHASE_AFTER_TURNS: int = 2
+    
+    # Hedging to ANTHROPIC_FALLBACK_MODEL: hedge once the primary exceeds its recent latency
+    # percentile (clamped to min/max delay); swap models after repeated timeouts
+    AGENT_HEDGE_PERCENTILE: float = 0.95
+    AGENT_HEDGE_MIN_DELAY_SECONDS: float = 2.0
+    AGENT_HEDGE_MAX_DELAY_SECONDS: float = 10.0
+    AGENT_HEDGE_MIN_SAMPLES: int = 20
+    AGENT_MODEL_SWAP_AFTER_TIMEOUTS: int = 2
+    AGENT_MODEL_FAILBACK_SECONDS: float = 300.0
+    
+    # Model client: "live" calls Anthropic, "record" also saves every call to
+    # AGENT_MODEL_CASSETTE_PATH, "replay" serves that cassette offline (recorded latency
+    # scaled by AGENT_REPLAY_TIME_SCALE, or a fixed AGENT_REPLAY_LATENCY_SECONDS)
+    AGENT_MODEL_CLIENT_MODE: str = "live"
+    AGENT_MODEL_CASSETTE_PATH: Optional[str] = None
+    AGENT_REPLAY_TIME_SCALE: float = 1.0
+    AGENT_REPLAY_LATENCY_SECONDS: Optional[float] = None
+    
+    # Anthropic HTTP connection pool (kept warm from startup) and SDK-level retries
+    ANTHROPIC_MAX_CONNECTIONS: int = 100
+    ANTHROPIC_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    ANTHROPIC_KEEPALIVE_EXPIRY_SECONDS: float = 30.0
+    ANTHROPIC_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    ANTHROPIC_MAX_RETRIES: int = 0
+    AGENT_WARMUP_ON_STARTUP: bool = True
+    
+    # Circuit breaker: fail fast (503) once AGENT_CIRCUIT_FAILURE_RATE of at least
+    # AGENT_CIRCUIT_MIN_CALLS calls in the window failed; probe again after OPEN_SECONDS
+    AGENT_CIRCUIT_FAILURE_RATE: float = 0.5
+    AGENT_CIRCUIT_MIN_CALLS: int = 10
+    AGENT_CIRCUIT_WINDOW_SECONDS: float = 60.0
+    AGENT_CIRCUIT_OPEN_SECONDS: float = 30.0
+    
+    # Client-side Anthropic rate limits per worker (0 = unlimited); interactive turns and
+    # suggestions give up with 503 after waiting AGENT_RATE_LIMIT_MAX_WAIT_SECONDS in the queue
+    ANTHROPIC_REQUESTS_PER_MINUTE: int = 0
+    ANTHROPIC_TOKENS_PER_MINUTE: int = 0
+    AGENT_RATE_LIMIT_MAX_WAIT_SECONDS: float = 30.0
+    
+    # Schema suggestion cache (per worker)
+    SUGGESTION_CACHE_MAX_ENTRIES: int = 256
+    SUGGESTION_CACHE_TTL_SECONDS: float = 900.0
+    
+    # Chat agent prompt size (estimated tokens of conversation history before older turns are summarized).
+    # Older turns are folded into the summary AGENT_HISTORY_KEEP_RECENT_MESSAGES at a time, so the
+    # summary only changes (and the prompt cache is only rewritten) once per chunk
+    AGENT_HISTORY_TOKEN_BUDGET: Optional[int] = 3000
+    AGENT_HISTORY_KEEP_RECENT_MESSAGES: int = 6
+    
     # Database
     DATABASE_URL: str = "sqlite+aiosqlite:///./shipdb.db"
     
+    # Chat sessions ("memory" keeps them per process; "sqlite" shares them via DATABASE_URL)
+    SESSION_BACKEND: str = "memory"
+    SESSION_FLUSH_INTERVAL_SECONDS: float = 0.05
+    SESSION_FLUSH_BATCH_SIZE: int = 100
+    SESSION_MAX_ENTRIES: int = 10000
+    SESSION_SHARDS: int = 16
+    SESSION_IDLE_TTL_SECONDS: float = 3600.0
+    SESSION_SWEEP_INTERVAL_SECONDS: float = 60.0
+    SESSION_COMPRESS_AFTER_TURNS: Optional[int] = 4
+    
     # Application settings
     DEBUG: Optional[str] = "false"
     LOG_LEVEL: Optional[str] = "INFO"
@@ -1,5 +1,6 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from loguru import logger
 
 try:
@@ -9,8 +10,10 @@ except ImportError:  # when run from repo root
 
 try:
     from app.api.routes import projects, schema, visualization
+    from app.services import ai_agent
 except ImportError:
     from backend.app.api.routes import projects, schema, visualization
+    from backend.app.services import ai_agent
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -34,6 +37,26 @@ app.include_router(schema.router, prefix="/api/schema", tags=["schema"])
 app.include_router(visualization.router, prefix="/api/visualization", tags=["visualization"])
 
 
+@app.on_event("startup")
+async def warm_agent():
+    """Build the chat agent and open its model-provider connection before the first request."""
+    if not getattr(settings, "AGENT_WARMUP_ON_STARTUP", True):
+        return
+    try:
+        agent = ai_agent.get_agent()
+    except RuntimeError as e:
+        logger.warning(f"Chat agent not warmed up: {e}")
+        return
+    await agent.warm_up()
+
+
+@app.on_event("shutdown")
+async def shutdown_agent():
+    """Stop background tasks owned by the chat agent."""
+    if ai_agent.agent_service is not None:
+        await ai_agent.agent_service.close()
+
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -50,6 +73,16 @@ async def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Model call counts, token usage, parse strategies and latency in Prometheus text format."""
+    try:
+        return PlainTextResponse(ai_agent.get_agent().metrics_text(), media_type="text/plain; version=0.0.4")
+    except RuntimeError as e:
+        # Agent not configured (no SDK or API key): nothing to report yet
+        raise HTTPException(status_code=503, detail=str(e))
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
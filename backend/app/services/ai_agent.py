@@ -1,10 +1,10 @@
+import asyncio
+import copy
 import json
-import math
-import re
 import threading
 import time
 from collections import Counter
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, AsyncIterator, Tuple
 from uuid import uuid4
 
 from loguru import logger
@@ -15,81 +15,278 @@ except ImportError:  # when run from repo root
     from backend.app.core.config import settings
 
 try:
-    # Anthropic SDK for Claude
-    from anthropic import Anthropic
-except Exception:  # pragma: no cover
-    Anthropic = None  # type: ignore
-
-
-# Reference phrases the model tends to use when it believes the conversation is complete.
-_COMPLETION_REFERENCE_PHRASES = [
-    "perfect i have enough information to create your database design",
-    "great i now have everything i need to design your database",
-    "excellent based on what you've told me i can create your database schema",
-    "i have enough information to create the schema",
-    "i can create your database schema now",
-    "ready to design your database",
-    "i have everything i need to design this",
-]
-_COMPLETION_SIMILARITY_THRESHOLD = 0.45
-_TOKEN_RE = re.compile(r"[a-z']+")
-_STOPWORDS = {
-    "a", "an", "the", "i", "you", "your", "yours", "me", "my", "to", "of", "on", "in", "for",
-    "and", "or", "is", "are", "be", "can", "now", "this", "that", "what", "based",
-}
-
-
-def _tokenize(text: str) -> List[str]:
-    """Lowercase word tokenizer with stopword removal used by the TF-IDF completion detector."""
-    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
-
-
-def _build_idf(documents: List[List[str]]) -> Dict[str, float]:
-    """Compute inverse-document-frequency weights over a small reference corpus."""
-    doc_count = len(documents)
-    doc_freq: Counter = Counter()
-    for tokens in documents:
-        for term in set(tokens):
-            doc_freq[term] += 1
-    return {term: math.log((1 + doc_count) / (1 + freq)) + 1.0 for term, freq in doc_freq.items()}
+    from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError
+    from app.services.completion_detector import (
+        build_idf as _build_idf,
+        cosine_similarity as _cosine_similarity,
+        default_detector as _completion_detector,
+        tfidf_vector as _tfidf_vector,
+        tokenize as _tokenize,
+    )
+    from app.services.deadline import Deadline, DeadlineExceeded
+    from app.services.domain_templates import DOMAIN_MATCH_THRESHOLD, DomainTemplateMatcher
+    from app.services.generation_profile import PHASE_QUESTION, PHASE_SPEC, GenerationProfile, select_phase
+    from app.services.history_compactor import CompactionResult, compact_history, estimate_tokens
+    from app.services.json_extract import extract_json_object, scan_json_object
+    from app.services.json_stream import StreamingFieldReader
+    from app.services.llm_metrics import CallRecord, LLMMetrics
+    from app.services.model_client import RecordedResponseClient, RecordingClient
+    from app.services.model_router import LatencyHistogram, ModelRouter
+    from app.services.rate_limiter import (
+        PRIORITY_BATCH,
+        PRIORITY_INTERACTIVE,
+        PRIORITY_SUGGESTIONS,
+        PriorityRateLimiter,
+        RateLimitTimeout,
+    )
+    from app.services.spec_patch import apply_spec_patch
+    from app.services.schema_generator import SCHEMA_DIGEST_LEGEND, generate_all, spec_hash, to_schema_digest
+    from app.services.session_store import SessionConflictError, SessionLocks, SessionRecord, create_session_store
+    from app.services.suggestion_cache import SuggestionCache, suggestion_key
+except ImportError:
+    from backend.app.services.circuit_breaker import CircuitBreaker, CircuitOpenError
+    from backend.app.services.completion_detector import (
+        build_idf as _build_idf,
+        cosine_similarity as _cosine_similarity,
+        default_detector as _completion_detector,
+        tfidf_vector as _tfidf_vector,
+        tokenize as _tokenize,
+    )
+    from backend.app.services.deadline import Deadline, DeadlineExceeded
+    from backend.app.services.domain_templates import DOMAIN_MATCH_THRESHOLD, DomainTemplateMatcher
+    from backend.app.services.generation_profile import PHASE_QUESTION, PHASE_SPEC, GenerationProfile, select_phase
+    from backend.app.services.history_compactor import CompactionResult, compact_history, estimate_tokens
+    from backend.app.services.json_extract import extract_json_object, scan_json_object
+    from backend.app.services.json_stream import StreamingFieldReader
+    from backend.app.services.llm_metrics import CallRecord, LLMMetrics
+    from backend.app.services.model_client import RecordedResponseClient, RecordingClient
+    from backend.app.services.model_router import LatencyHistogram, ModelRouter
+    from backend.app.services.rate_limiter import (
+        PRIORITY_BATCH,
+        PRIORITY_INTERACTIVE,
+        PRIORITY_SUGGESTIONS,
+        PriorityRateLimiter,
+        RateLimitTimeout,
+    )
+    from backend.app.services.spec_patch import apply_spec_patch
+    from backend.app.services.schema_generator import SCHEMA_DIGEST_LEGEND, generate_all, spec_hash, to_schema_digest
+    from backend.app.services.session_store import SessionConflictError, SessionLocks, SessionRecord, create_session_store
+    from backend.app.services.suggestion_cache import SuggestionCache, suggestion_key
 
+try:
+    # Anthropic SDK for Claude (async client so model calls never block the event loop)
+    from anthropic import APIConnectionError, APITimeoutError, AsyncAnthropic
+except Exception:  # pragma: no cover
+    AsyncAnthropic = None  # type: ignore
+    APITimeoutError = None  # type: ignore
+    APIConnectionError = None  # type: ignore
 
-def _tfidf_vector(tokens: List[str], idf: Dict[str, float]) -> Dict[str, float]:
-    """Build a sparse TF-IDF vector for a token list given precomputed IDF weights."""
-    term_freq = Counter(tokens)
-    total = sum(term_freq.values()) or 1
-    return {term: (count / total) * idf.get(term, 1.0) for term, count in term_freq.items()}
+try:
+    import httpx  # installed with the anthropic SDK; used for the pooled keep-alive client
+except Exception:  # pragma: no cover
+    httpx = None  # type: ignore
 
 
-def _cosine_similarity(vec_a: Dict[str, float], vec_b: Dict[str, float]) -> float:
-    """Cosine similarity between two sparse TF-IDF vectors."""
-    shared_terms = set(vec_a) & set(vec_b)
-    if not shared_terms:
-        return 0.0
-    dot = sum(vec_a[t] * vec_b[t] for t in shared_terms)
-    norm_a = math.sqrt(sum(v * v for v in vec_a.values()))
-    norm_b = math.sqrt(sum(v * v for v in vec_b.values()))
-    if norm_a == 0 or norm_b == 0:
-        return 0.0
-    return dot / (norm_a * norm_b)
+# Tool definitions for structured-output mode: forcing the model to "call" these tools makes
+# the API return the control object as already-parsed JSON instead of free text.
+_CONTROL_TOOL: Dict[str, Any] = {
+    "name": "submit_turn",
+    "description": "Submit the next conversational turn: the question to ask (or the closing message), "
+                   "whether the design is complete, and the database specification gathered so far.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "next_question": {"type": "string", "description": "The next question or closing message shown to the user."},
+            "done": {"type": "boolean", "description": "True once there is enough information for a complete design."},
+            "partial_spec": {
+                "type": "object",
+                "description": "Database specification: app_type, db_type and entities with fields.",
+            },
+            "spec_patch": {
+                "type": "array",
+                "items": {"type": "object"},
+                "description": "Optional patch operations for edit turns (only when SPEC PATCH MODE is described).",
+            },
+        },
+        "required": ["next_question", "done", "partial_spec"],
+    },
+}
 
+_TABLE_SCHEMA: Dict[str, Any] = {
+    "type": ["object", "null"],
+    "properties": {
+        "name": {"type": "string"},
+        "fields": {"type": "array", "items": {"type": "object"}},
+    },
+}
+_ENTITY_GROUP_TOOL: Dict[str, Any] = {
+    "name": "submit_entities",
+    "description": "Submit complete field definitions for the requested entities.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "entities": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "name": {"type": "string"},
+                        "fields": {"type": "array", "items": {"type": "object"}},
+                    },
+                    "required": ["name", "fields"],
+                },
+            },
+        },
+        "required": ["entities"],
+    },
+}
+_CONNECTIONS_SCHEMA: Dict[str, Any] = {
+    "type": "array",
+    "items": {"type": "object", "properties": {"from": {"type": "string"}, "to": {"type": "string"}}},
+}
+_SUGGESTIONS_TOOL: Dict[str, Any] = {
+    "name": "submit_suggestions",
+    "description": "Submit the two schema improvement suggestions.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "option_1": {
+                "type": "object",
+                "properties": {
+                    "reasoning": {"type": "string"},
+                    "new_table": _TABLE_SCHEMA,
+                    "connections": _CONNECTIONS_SCHEMA,
+                },
+                "required": ["reasoning", "new_table", "connections"],
+            },
+            "option_2": {
+                "type": "object",
+                "properties": {
+                    "reasoning": {"type": "string"},
+                    "tables_to_merge": {"type": "array", "items": {"type": "string"}},
+                    "merged_table": _TABLE_SCHEMA,
+                    "connections": _CONNECTIONS_SCHEMA,
+                },
+                "required": ["reasoning", "tables_to_merge", "merged_table", "connections"],
+            },
+        },
+        "required": ["option_1", "option_2"],
+    },
+}
 
-_COMPLETION_REFERENCE_TOKENS = [_tokenize(phrase) for phrase in _COMPLETION_REFERENCE_PHRASES]
-_COMPLETION_IDF = _build_idf(_COMPLETION_REFERENCE_TOKENS)
-_COMPLETION_REFERENCE_VECTORS = [_tfidf_vector(tokens, _COMPLETION_IDF) for tokens in _COMPLETION_REFERENCE_TOKENS]
+# Appended to the first answer when the model adapts a domain template spec to it
+_REFINE_TEMPLATE_INSTRUCTION = (
+    "The CURRENT partial_spec is a generic starting template for this kind of business. Return "
+    "partial_spec as the COMPLETE adapted specification: keep the entities that fit the description, "
+    "leave out the ones that do not, and add what is missing."
+)
 
 
 class AIAgentService:
-    def __init__(self) -> None:
-        """Initialize the in-memory session store and configure the Anthropic client."""
-        self._sessions: Dict[str, Dict[str, Any]] = {}
+    def __init__(self, client: Optional[Any] = None) -> None:
+        """Initialize the configured session store and the async Anthropic client.
+
+        ``client`` replaces the Anthropic client with any ModelClient (an object exposing the
+        same async ``messages.create``, e.g. RecordedResponseClient for offline runs). Without
+        one, AGENT_MODEL_CLIENT_MODE picks a live, recording or replaying client.
+        """
+        self._sessions = create_session_store(settings)
+        self._session_locks = SessionLocks()
+        # session_id -> (spec hash, background generate_all task) for completed conversations
+        self._artifact_tasks: Dict[str, Tuple[str, "asyncio.Task[Optional[Dict[str, Any]]]"]] = {}
+        # session_id -> background model call refining a domain-template first turn
+        self._refine_tasks: Dict[str, "asyncio.Task[None]"] = {}
+        self._template_matcher: Optional[DomainTemplateMatcher] = None
+        if getattr(settings, "AGENT_DOMAIN_TEMPLATES", False):
+            self._template_matcher = DomainTemplateMatcher(
+                threshold=getattr(settings, "AGENT_DOMAIN_TEMPLATE_THRESHOLD", DOMAIN_MATCH_THRESHOLD),
+            )
         self._lock = threading.Lock()
-        if Anthropic is None:
+        self._usage_totals: Counter = Counter()
+        self._compaction_totals: Counter = Counter()
+        self._metrics = LLMMetrics(max_sessions=getattr(settings, "SESSION_MAX_ENTRIES", 10000))
+        self._suggestion_cache = SuggestionCache(
+            max_entries=getattr(settings, "SUGGESTION_CACHE_MAX_ENTRIES", 256),
+            ttl=getattr(settings, "SUGGESTION_CACHE_TTL_SECONDS", 900.0),
+        )
+        # Only set when this service built (and so must close) the HTTP connection pool
+        self._http_client: Optional[Any] = None
+        self._client = client if client is not None else self._build_client()
+        self._breaker = CircuitBreaker(
+            failure_rate=getattr(settings, "AGENT_CIRCUIT_FAILURE_RATE", 0.5),
+            min_calls=getattr(settings, "AGENT_CIRCUIT_MIN_CALLS", 10),
+            window=getattr(settings, "AGENT_CIRCUIT_WINDOW_SECONDS", 60.0),
+            open_seconds=getattr(settings, "AGENT_CIRCUIT_OPEN_SECONDS", 30.0),
+        )
+        self._rate_limiter = PriorityRateLimiter(
+            requests_per_minute=getattr(settings, "ANTHROPIC_REQUESTS_PER_MINUTE", 0) or 0,
+            tokens_per_minute=getattr(settings, "ANTHROPIC_TOKENS_PER_MINUTE", 0) or 0,
+        )
+        self._model_name: str = getattr(settings, "ANTHROPIC_MODEL", "claude-3-haiku-20240307")
+        self._profiles: Dict[str, GenerationProfile] = {
+            PHASE_QUESTION: GenerationProfile(
+                PHASE_QUESTION,
+                model=getattr(settings, "AGENT_QUESTION_MODEL", None),
+                max_tokens=getattr(settings, "AGENT_QUESTION_MAX_TOKENS", 4000),
+                timeout=getattr(settings, "AGENT_QUESTION_TIMEOUT_SECONDS", 30.0),
+            ),
+            PHASE_SPEC: GenerationProfile(
+                PHASE_SPEC,
+                model=getattr(settings, "AGENT_SPEC_MODEL", None),
+                max_tokens=getattr(settings, "AGENT_SPEC_MAX_TOKENS", 8000),
+                timeout=getattr(settings, "AGENT_SPEC_TIMEOUT_SECONDS", 60.0),
+            ),
+        }
+        self._phase_latency: Dict[str, LatencyHistogram] = {phase: LatencyHistogram() for phase in self._profiles}
+        self._phase_counters: Counter = Counter()
+        self._router = ModelRouter(
+            primary=self._model_name,
+            fallback=getattr(settings, "ANTHROPIC_FALLBACK_MODEL", None),
+            hedge_percentile=getattr(settings, "AGENT_HEDGE_PERCENTILE", 0.95),
+            min_delay=getattr(settings, "AGENT_HEDGE_MIN_DELAY_SECONDS", 2.0),
+            max_delay=getattr(settings, "AGENT_HEDGE_MAX_DELAY_SECONDS", 10.0),
+            min_samples=getattr(settings, "AGENT_HEDGE_MIN_SAMPLES", 20),
+            swap_after_timeouts=getattr(settings, "AGENT_MODEL_SWAP_AFTER_TIMEOUTS", 2),
+            failback_after=getattr(settings, "AGENT_MODEL_FAILBACK_SECONDS", 300.0),
+        )
+
+    def _build_client(self) -> Any:
+        mode = (getattr(settings, "AGENT_MODEL_CLIENT_MODE", "live") or "live").lower()
+        if mode not in ("live", "record", "replay"):
+            raise RuntimeError(f"AGENT_MODEL_CLIENT_MODE must be live, record or replay, not {mode!r}")
+        cassette = getattr(settings, "AGENT_MODEL_CASSETTE_PATH", None)
+        if mode != "live" and not cassette:
+            raise RuntimeError(f"AGENT_MODEL_CASSETTE_PATH is required in {mode} mode")
+        if mode == "replay":
+            logger.info(f"Replaying model responses from {cassette}")
+            return RecordedResponseClient.from_cassette(
+                cassette,
+                time_scale=getattr(settings, "AGENT_REPLAY_TIME_SCALE", 1.0),
+                latency_s=getattr(settings, "AGENT_REPLAY_LATENCY_SECONDS", None),
+            )
+        if AsyncAnthropic is None:
             raise RuntimeError("anthropic SDK not installed")
         if not getattr(settings, "ANTHROPIC_API_KEY", None):
             raise RuntimeError("ANTHROPIC_API_KEY not configured")
-        self._client = Anthropic(api_key=settings.ANTHROPIC_API_KEY)
-        self._model_name: str = getattr(settings, "ANTHROPIC_MODEL", "claude-3-haiku-20240307")
+        if httpx is not None:
+            self._http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=getattr(settings, "ANTHROPIC_MAX_CONNECTIONS", 100),
+                    max_keepalive_connections=getattr(settings, "ANTHROPIC_MAX_KEEPALIVE_CONNECTIONS", 20),
+                    keepalive_expiry=getattr(settings, "ANTHROPIC_KEEPALIVE_EXPIRY_SECONDS", 30.0),
+                ),
+                timeout=httpx.Timeout(30.0, connect=getattr(settings, "ANTHROPIC_CONNECT_TIMEOUT_SECONDS", 5.0)),
+            )
+        live = AsyncAnthropic(
+            api_key=settings.ANTHROPIC_API_KEY,
+            http_client=self._http_client,
+            # _call_model already retries; SDK retries on top multiply the time spent on a dead provider
+            max_retries=getattr(settings, "ANTHROPIC_MAX_RETRIES", 0),
+        )
+        if mode == "record":
+            logger.info(f"Recording model responses to {cassette}")
+            return RecordingClient(live, cassette)
+        return live
 
     def _system_instruction(self) -> str:
         """Return the instruction used to constrain the model to a JSON control response."""
@@ -309,6 +506,49 @@ class AIAgentService:
             "The system will detect these phrases and automatically finalize the conversation."
         )
 
+    def _spec_patch_instruction(self) -> str:
+        """Extra instruction enabling the compact spec_patch response mode for edit turns."""
+        return (
+            "\n\n"
+            "SPEC PATCH MODE: "
+            "Once the CURRENT partial_spec already contains entities, describe changes with a 'spec_patch' key "
+            "instead of re-emitting entities. Set partial_spec to {} and add 'spec_patch': a list of operations: "
+            '{"op": "add_entity", "entity": {"name": ..., "fields": [...]}}, '
+            '{"op": "update_entity", "entity": "name", "changes": {...}}, '
+            '{"op": "remove_entity", "entity": "name"}, '
+            '{"op": "add_field", "entity": "name", "field": {...}}, '
+            '{"op": "update_field", "entity": "name", "field": "field_name", "changes": {...}}, '
+            '{"op": "remove_field", "entity": "name", "field": "field_name"}, '
+            '{"op": "set", "key": "app_type", "value": ...}. '
+            "Only include operations for what actually changes. "
+            'Example for "add stories feature": '
+            '{"next_question": "Added stories.", "done": true, "partial_spec": {}, "spec_patch": '
+            '[{"op": "add_entity", "entity": {"name": "stories", "fields": [{"name": "id", "type": "uuid", "required": true, "primary_key": true}, '
+            '{"name": "user_id", "type": "uuid", "required": true, "foreign_key": {"table": "users", "field": "id"}}, '
+            '{"name": "expires_at", "type": "timestamp", "required": true}]}}]}'
+        )
+
+    def _fanout_instruction(self) -> str:
+        """Extra instruction making the done turn return an entity outline instead of full fields."""
+        return (
+            "\n\n"
+            "FAN-OUT MODE: "
+            "When you set done=true, do NOT write field definitions. Return partial_spec with app_type, db_type "
+            "and entities as an outline: each entity is "
+            '{"name": ..., "description": "one line", "group": "subdomain, e.g. catalog or billing"} with no "fields". '
+            "Put entities that reference each other heavily in the same group. "
+            "Field definitions are generated afterwards, one group at a time."
+        )
+
+    def _system_blocks(self) -> List[Dict[str, Any]]:
+        """Return the system instruction as a single text block marked for Anthropic prompt caching."""
+        text = self._system_instruction()
+        if getattr(settings, "AGENT_SPEC_PATCH_MODE", False):
+            text += self._spec_patch_instruction()
+        if getattr(settings, "AGENT_FANOUT_MODE", False):
+            text += self._fanout_instruction()
+        return [{"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}]
+
     def _merge_partial(self, base: Dict[str, Any], incoming: Dict[str, Any]) -> Dict[str, Any]:
         """Recursively merge an incoming partial spec into the accumulated base spec."""
         for k, v in incoming.items():
@@ -400,252 +640,559 @@ class AIAgentService:
         
         return True
 
-    def _to_anthropic_messages(self, history: List[Dict[str, str]], last_user: Optional[str] = None) -> List[Dict[str, Any]]:
-        """Convert internal history into Anthropic messages format, optionally appending a user turn."""
-        msgs: List[Dict[str, Any]] = []
-        for m in history:
-            role = m.get("role")
-            if role not in ("user", "assistant"):
-                continue
-            msgs.append({"role": role, "content": m.get("content", "")})
-        if last_user is not None:
-            msgs.append({"role": "user", "content": last_user})
-        return msgs
+    def _to_anthropic_messages(
+        self,
+        history: List[Dict[str, str]],
+        last_user: Optional[str] = None,
+        spec: Optional[Dict[str, Any]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Convert internal history into compacted Anthropic messages, optionally appending a user turn."""
+        return self._compact_messages(history, last_user, spec).messages
+
+    def _compact_messages(
+        self,
+        history: List[Dict[str, str]],
+        last_user: Optional[str] = None,
+        spec: Optional[Dict[str, Any]] = None,
+    ) -> CompactionResult:
+        """Compact history (question-only assistant turns, single latest spec block, token budget)."""
+        return compact_history(
+            history,
+            last_user=last_user,
+            spec=spec,
+            token_budget=getattr(settings, "AGENT_HISTORY_TOKEN_BUDGET", None),
+            keep_recent=getattr(settings, "AGENT_HISTORY_KEEP_RECENT_MESSAGES", 6),
+        )
+
+    def _record_compaction(self, result: CompactionResult) -> None:
+        """Log and accumulate the estimated input tokens saved by history compaction for one call."""
+        with self._lock:
+            self._compaction_totals.update({
+                "calls": 1,
+                "raw_tokens": result.raw_tokens,
+                "compacted_tokens": result.compacted_tokens,
+                "saved_tokens": result.saved_tokens,
+                "summarized_messages": result.summarized_messages,
+            })
+        logger.info(
+            f"History compaction: ~{result.raw_tokens} -> ~{result.compacted_tokens} tokens "
+            f"(saved ~{result.saved_tokens}, summarized {result.summarized_messages} message(s))"
+        )
+
+    def compaction_totals(self) -> Dict[str, int]:
+        """Return cumulative estimated token savings from history compaction."""
+        with self._lock:
+            return dict(self._compaction_totals)
+
+    def _with_cache_breakpoint(self, msgs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Mark the conversation prefix (everything before the newest user turn) as cacheable.
+
+        Each turn only appends to the history, so the prefix cached on this turn is re-read
+        on the next one instead of being billed and processed again.
+        """
+        if len(msgs) < 2:
+            return msgs
+        prefix_end = msgs[-2]
+        content = prefix_end["content"]
+        if isinstance(content, str):
+            content = [{"type": "text", "text": content}]
+        else:
+            content = [dict(block) for block in content]
+        content[-1]["cache_control"] = {"type": "ephemeral"}
+        return msgs[:-2] + [{"role": prefix_end["role"], "content": content}, msgs[-1]]
+
+    def _record_usage(self, resp: Any) -> Dict[str, int]:
+        """Accumulate input, output and prompt-cache token counts reported in ``resp.usage``."""
+        usage = getattr(resp, "usage", None)
+        counts = {
+            key: int(getattr(usage, key, 0) or 0)
+            for key in ("input_tokens", "output_tokens", "cache_read_input_tokens", "cache_creation_input_tokens")
+        }
+        with self._lock:
+            self._usage_totals.update(counts)
+        logger.debug(
+            f"Claude usage: input={counts['input_tokens']} output={counts['output_tokens']} "
+            f"cache_read={counts['cache_read_input_tokens']} cache_creation={counts['cache_creation_input_tokens']}"
+        )
+        return counts
+
+    def usage_totals(self) -> Dict[str, int]:
+        """Return cumulative token usage (including prompt-cache reads and writes) across all calls."""
+        with self._lock:
+            return dict(self._usage_totals)
+
+    def _record_call(
+        self,
+        phase: str,
+        started: float,
+        attempt: int,
+        resp: Any = None,
+        parse_strategy: str = "none",
+        ok: bool = True,
+        session_id: Optional[str] = None,
+    ) -> None:
+        """Account one model call attempt (tokens, wall time, parse strategy) in the LLM metrics."""
+        tokens = self._record_usage(resp) if resp is not None else None
+        model = getattr(resp, "model", None) or self._router.order()[0]
+        self._metrics.record(CallRecord(
+            phase,
+            str(model),
+            attempt,
+            time.perf_counter() - started,
+            tokens=tokens,
+            parse_strategy=parse_strategy,
+            ok=ok,
+            session_id=session_id,
+        ))
+
+    def llm_metrics(self) -> Dict[str, Any]:
+        """Global model usage and latency totals, broken down by phase and model."""
+        return self._metrics.snapshot()
+
+    def metrics_text(self) -> str:
+        """LLM call metrics and model latency histograms in Prometheus text format."""
+        return self._metrics.prometheus()
     
     # Removed hard-coded entity generation - AI should generate appropriate entities based on business analysis
 
-    def _call_model(self, history: List[Dict[str, str]], user_msg: str) -> Dict[str, Any]:
-        """Call Claude with retry/backoff, expecting a control JSON object."""
+    async def _call_model(
+        self,
+        history: List[Dict[str, str]],
+        user_msg: str,
+        spec: Optional[Dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+        priority: int = PRIORITY_INTERACTIVE,
+        profile: Optional[GenerationProfile] = None,
+        deadline: Optional[Deadline] = None,
+    ) -> Dict[str, Any]:
+        """Call Claude with retry/backoff, expecting a control JSON object.
+
+        Backoff uses asyncio.sleep so a slow or failing turn only suspends its own request
+        instead of blocking the event loop for every other session. A 429 waits for the API's
+        retry-after instead (the shared rate limiter holds every other queued call too). Every
+        attempt is recorded in the LLM metrics, attributed to ``session_id`` when given.
+
+        ``profile`` sets the model, max_tokens and timeout (the spec profile by default). A
+        question-phase reply cut off at max_tokens is retried at once on the spec profile.
+
+        With a request ``deadline`` each attempt's timeout (and rate-limit queueing) is cut to
+        the budget left, and DeadlineExceeded is raised instead of retrying once it is spent.
+        """
+        profile = profile or self._profiles[PHASE_SPEC]
         max_retries = 3
         base_sleep = 0.5
 
-        system_txt = self._system_instruction()
+        system_blocks = self._system_blocks()
+        compaction = self._compact_messages(history, last_user=user_msg, spec=spec)
+        self._record_compaction(compaction)
+        queue_deadline = self._queue_deadline(priority, deadline)
         
         for attempt in range(max_retries):
+            timeout = deadline.timeout(profile.timeout) if deadline is not None else profile.timeout
+            started = time.perf_counter()
+            resp = None
             try:
-                msgs = self._to_anthropic_messages(history, last_user=user_msg)
-                resp = self._client.messages.create(
-                    model=self._model_name,
-                    system=system_txt,
+                msgs = self._with_cache_breakpoint(compaction.messages)
+                resp = await self._create_message(
+                    priority=priority,
+                    deadline=queue_deadline,
+                    model=profile.model,
+                    system=system_blocks,
                     messages=msgs,
-                    max_tokens=4000,
+                    max_tokens=profile.max_tokens,
                     temperature=0.2,
-                    timeout=30.0,
+                    timeout=timeout,
+                    **self._tool_kwargs(_CONTROL_TOOL),
                 )
                 
-                # Concatenate text from content blocks
-                text_parts: List[str] = []
-                for block in getattr(resp, "content", []) or []:
-                    t = getattr(block, "text", None)
-                    if t:
-                        text_parts.append(t)
-                text = "".join(text_parts)
-                
-                # Log the raw response for debugging
-                logger.debug(f"Raw AI response: {text[:500]}...")
-                
-                # Parse JSON from AI response
-                obj = self._parse_json_response(text)
-                if obj is None:
-                    logger.error(f"Failed to parse AI response. Raw text: {text[:1000]}")
-                    raise ValueError(f"AI service returned invalid JSON. Response: {text[:200]}...")
-                
-                if not isinstance(obj, dict):
-                    logger.error(f"AI response is not a dict: {type(obj)} - {obj}")
-                    raise ValueError(f"AI service returned invalid response type: {type(obj)}")
-                
-                if "next_question" not in obj:
-                    logger.error(f"AI response missing 'next_question' field. Response: {obj}")
-                    raise ValueError("AI service returned response without 'next_question' field")
-                
-                return obj
+                # Structured-output mode: the control object arrives as tool input, already parsed
+                tool_input = self._tool_input(resp, _CONTROL_TOOL["name"])
+                if tool_input is not None:
+                    control, strategy = self._control_from_tool_input(tool_input), "tool"
+                else:
+                    # Concatenate text from content blocks
+                    text_parts: List[str] = []
+                    for block in getattr(resp, "content", []) or []:
+                        t = getattr(block, "text", None)
+                        if t:
+                            text_parts.append(t)
+                    text = "".join(text_parts)
+                    
+                    # Log the raw response for debugging
+                    logger.debug(f"Raw AI response: {text[:500]}...")
+                    
+                    control, strategy = self._control_and_strategy(text)
+                self._record_call(f"chat_turn:{profile.phase}", started, attempt + 1, resp, strategy, session_id=session_id)
+                self._phase_latency[profile.phase].observe(time.perf_counter() - started)
+                return control
                 
+            except (RateLimitTimeout, CircuitOpenError) as e:
+                self._record_call(f"chat_turn:{profile.phase}", started, attempt + 1, ok=False, session_id=session_id)
+                self._raise_if_budget_spent(e, deadline, queue_deadline)
+                raise
             except Exception as e:
+                self._record_call(
+                    f"chat_turn:{profile.phase}", started, attempt + 1, resp,
+                    "failed" if resp is not None else "none", ok=False, session_id=session_id,
+                )
+                if profile.phase != PHASE_SPEC and getattr(resp, "stop_reason", None) == "max_tokens":
+                    # Truncated, not failing: a bigger budget fixes it, waiting does not
+                    logger.info(f"{profile.phase} turn hit max_tokens={profile.max_tokens}; escalating to the spec profile")
+                    self._phase_counters[f"{profile.phase}_escalations"] += 1
+                    profile = self._profiles[PHASE_SPEC]
+                    if attempt < max_retries - 1:
+                        continue
                 import traceback, sys
-                sleep_s = base_sleep * (2 ** attempt)
+                sleep_s = self._retry_delay(e, base_sleep * (2 ** attempt))
                 print(f"[AI_AGENT] Claude call failed (attempt={attempt+1}/{max_retries}): {type(e).__name__}: {e}", flush=True)
                 print(traceback.format_exc(), flush=True)
                 sys.stdout.flush()
                 if attempt < max_retries - 1:
-                    time.sleep(sleep_s)
+                    if deadline is not None and sleep_s >= deadline.remaining():
+                        raise DeadlineExceeded(
+                            f"request time budget of {deadline.budget:g}s exhausted after {attempt + 1} attempt(s)"
+                        ) from e
+                    await asyncio.sleep(sleep_s)
                     continue
 
         # All retries failed
-        print(f"[AI_AGENT] All retries failed. model={self._model_name}", flush=True)
+        if deadline is not None:
+            deadline.check("another retry")
+        print(f"[AI_AGENT] All retries failed. model={self._router.order()[0]}", flush=True)
         raise RuntimeError("AI service unavailable after multiple retries. Please try again later.")
     
-    def _parse_json_response(self, text: str) -> Optional[Dict[str, Any]]:
-        """Parse JSON from AI response with robust error handling."""
-        if not text or not text.strip():
-            logger.error("Empty text provided to JSON parser")
-            return None
-        
-        import re
-        
-        # Strategy 1: Try direct JSON parsing
+    async def _create_message(
+        self,
+        priority: int = PRIORITY_INTERACTIVE,
+        deadline: Optional[float] = None,
+        model: Optional[str] = None,
+        **kwargs: Any,
+    ) -> Any:
+        """``messages.create`` on the preferred model, hedged to the fallback model when slow.
+
+        The call first queues on the shared rate limiter at ``priority`` (until ``deadline``,
+        a ``time.monotonic()`` value, at most). If the preferred model has not answered within
+        its recent latency percentile (see ModelRouter.hedge_delay), the same request is sent
+        to the fallback model and whichever succeeds first wins; the other request is
+        cancelled. Hedges are only sent when the limiter has room right away. Without a
+        fallback model this is a plain timed call. While the provider circuit is open the call
+        fails fast with CircuitOpenError. ``model`` pins a phase-specific model in place of
+        the router's preferred one (still hedged to the fallback model).
+        """
+        self._breaker.before_call()
+        estimate = self._estimate_request_tokens(kwargs)
+        await self._rate_limiter.acquire(estimate, priority=priority, deadline=deadline)
         try:
-            obj = json.loads(text.strip())
-            if isinstance(obj, dict) and "next_question" in obj:
-                logger.debug("Direct JSON parsing succeeded")
-                return obj
-        except json.JSONDecodeError as e:
-            logger.debug(f"Direct JSON parsing failed: {e}")
-        
-        # Strategy 2: Remove markdown code blocks if present
-        cleaned_text = text
-        # Remove ```json ... ``` blocks
-        cleaned_text = re.sub(r'```json\s*\n?', '', cleaned_text)
-        cleaned_text = re.sub(r'```\s*\n?', '', cleaned_text)
-        
+            resp = await self._hedged_create(estimate, model=model, priority=priority, **kwargs)
+        except BaseException:
+            # No usage to settle against: don't leave the whole estimate charged to the TPM budget
+            self._rate_limiter.refund(estimate)
+            raise
+        self._settle_usage(estimate, resp)
+        return resp
+
+    def _settle_usage(self, estimate: int, resp: Any) -> None:
+        usage = getattr(resp, "usage", None)
+        self._rate_limiter.settle(
+            estimate,
+            (getattr(usage, "input_tokens", 0) or 0) + (getattr(usage, "output_tokens", 0) or 0),
+        )
+
+    async def _hedged_create(
+        self, estimate: int, model: Optional[str] = None, priority: int = PRIORITY_INTERACTIVE, **kwargs: Any,
+    ) -> Any:
+        preferred, alternate = self._router.order()
+        if model and model != preferred:
+            fallback = self._router.fallback
+            preferred, alternate = model, (fallback if fallback != model else None)
+        first = asyncio.ensure_future(self._timed_create(preferred, **kwargs))
+        if alternate is None:
+            return await first
+        pending = {first}
         try:
-            obj = json.loads(cleaned_text.strip())
-            if isinstance(obj, dict) and "next_question" in obj:
-                logger.debug("JSON parsing after markdown removal succeeded")
-                return obj
-        except json.JSONDecodeError as e:
-            logger.debug(f"JSON parsing after markdown removal failed: {e}")
-        
-        # Strategy 3: Extract JSON block (content between first { and last })
-        start = text.find("{")
-        end = text.rfind("}")
-        if start != -1 and end != -1 and end > start:
-            try:
-                json_text = text[start : end + 1]
-                # Fix unescaped newlines in string values - replace \n with \\n within string literals
-                json_text = self._fix_unescaped_newlines(json_text)
-                obj = json.loads(json_text)
-                if isinstance(obj, dict) and "next_question" in obj:
-                    logger.debug("Extracted JSON block parsing succeeded")
-                    return obj
-            except json.JSONDecodeError as e:
-                logger.debug(f"Extracted JSON block parsing failed: {e}")
-        
-        # Strategy 4: Try line by line to find JSON object
-        lines = text.split('\n')
-        json_lines = []
-        in_json = False
-        brace_count = 0
-        
-        for line in lines:
-            stripped = line.strip()
-            if '{' in stripped and not in_json:
-                in_json = True
-                json_lines.append(line)
-                brace_count += stripped.count('{') - stripped.count('}')
-            elif in_json:
-                json_lines.append(line)
-                brace_count += stripped.count('{') - stripped.count('}')
-                if brace_count == 0:
-                    break
+            done, _ = await asyncio.wait(pending, timeout=self._router.hedge_delay(preferred))
+            if done:
+                return first.result()
+            if not self._rate_limiter.try_acquire(estimate, priority):
+                logger.info(f"Not hedging slow {preferred} call: rate limit has no headroom")
+                return await first
+            self._router.counters["hedged"] += 1
+            logger.info(f"Hedging slow {preferred} call to {alternate}")
+            hedge = asyncio.ensure_future(self._timed_create(alternate, **kwargs))
+            pending = {first, hedge}
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self._router.counters["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error  # both calls failed
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _timed_create(self, model: str, **kwargs: Any) -> Any:
+        started = asyncio.get_running_loop().time()
+        try:
+            resp = await self._client.messages.create(model=model, **kwargs)
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError) or (APITimeoutError is not None and isinstance(e, APITimeoutError)):
+                self._router.record_timeout(model)
+            if self._is_provider_failure(e):
+                self._breaker.record_failure()
+            raise
+        self._router.record_success(model, asyncio.get_running_loop().time() - started)
+        self._breaker.record_success()
+        return resp
+
+    @staticmethod
+    def _is_provider_failure(error: Exception) -> bool:
+        """Errors that say the provider is unhealthy: timeouts, connection errors and 5xx.
+
+        Client errors (4xx, including 429 which the rate limiter handles) do not count.
+        """
+        status = getattr(error, "status_code", None)
+        if isinstance(status, int):
+            return status >= 500
+        if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+            return True
+        return APIConnectionError is not None and isinstance(error, APIConnectionError)
+
+    async def warm_up(self) -> None:
+        """Open a keep-alive connection to the model provider ahead of the first request."""
+        if self._http_client is None:
+            return
+        base_url = str(getattr(self._client, "base_url", "") or "https://api.anthropic.com")
+        started = time.perf_counter()
+        try:
+            await self._http_client.get(base_url, timeout=getattr(settings, "ANTHROPIC_CONNECT_TIMEOUT_SECONDS", 5.0))
+        except Exception as e:
+            logger.warning(f"Model provider warm-up failed ({type(e).__name__}: {e}); connecting on first use")
+            return
+        logger.info(f"Model provider connection warmed in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+    def circuit_stats(self) -> Dict[str, Any]:
+        return self._breaker.stats()
+
+    @staticmethod
+    def _estimate_request_tokens(kwargs: Dict[str, Any]) -> int:
+        """Prompt-size token estimate charged against the tokens-per-minute budget up front."""
+        text = json.dumps([kwargs.get("system"), kwargs.get("messages"), kwargs.get("tools")], default=str)
+        return estimate_tokens(text)
+
+    @staticmethod
+    def _queue_deadline(priority: int, deadline: Optional[Deadline] = None) -> Optional[float]:
+        """Latest time a call may still be waiting on the rate limiter; batch work has none.
+
+        A request ``deadline`` caps it: waiting longer than the request may take is pointless.
+        """
+        limit = None
+        if priority < PRIORITY_BATCH:
+            limit = time.monotonic() + getattr(settings, "AGENT_RATE_LIMIT_MAX_WAIT_SECONDS", 30.0)
+        if deadline is not None:
+            limit = deadline.expires_at if limit is None else min(limit, deadline.expires_at)
+        return limit
+
+    @staticmethod
+    def _raise_if_budget_spent(error: Exception, deadline: Optional[Deadline], queue_deadline: Optional[float]) -> None:
+        """Report a rate-limit queue timeout caused by the request's own deadline as DeadlineExceeded."""
+        if isinstance(error, RateLimitTimeout) and deadline is not None and queue_deadline == deadline.expires_at:
+            raise DeadlineExceeded(
+                f"request time budget of {deadline.budget:g}s would run out while queued for the model"
+            ) from error
+
+    def _retry_delay(self, error: Exception, default: float) -> float:
+        """Backoff before the next attempt: the API's retry-after for a 429, else ``default``."""
+        if getattr(error, "status_code", None) != 429:
+            return default
+        headers = getattr(getattr(error, "response", None), "headers", None) or {}
+        try:
+            retry_after = float(headers.get("retry-after"))
+        except (TypeError, ValueError):
+            retry_after = default
+        if not self._rate_limiter.enabled:
+            return retry_after
+        self._rate_limiter.penalize(retry_after)
+        # The limiter now holds this and every other queued call until retry-after passes
+        return 0.0
+
+    def rate_limit_stats(self) -> Dict[str, Any]:
+        return self._rate_limiter.stats()
+
+    def cap_priority(self, priority: int, requests_per_minute: float, burst: Optional[float] = None) -> None:
+        """Cap model calls at ``priority`` (e.g. PRIORITY_BATCH) on the shared rate limiter."""
+        self._rate_limiter.cap_priority(priority, requests_per_minute, burst=burst)
+
+    def latency_stats(self) -> Dict[str, Any]:
+        """Per-model latency histograms plus hedging and model-swap counters."""
+        return self._router.stats()
+
+    def _control_from_text(self, text: str) -> Dict[str, Any]:
+        """Parse and validate the control JSON object from raw model text, raising ValueError if unusable."""
+        return self._control_and_strategy(text)[0]
+
+    def _control_and_strategy(self, text: str) -> Tuple[Dict[str, Any], str]:
+        """_control_from_text that also reports how the JSON was found (see json_extract)."""
+        obj, strategy = self._parse_json_with_strategy(text)
+        if obj is None:
+            logger.error(f"Failed to parse AI response. Raw text: {text[:1000]}")
+            raise ValueError(f"AI service returned invalid JSON. Response: {text[:200]}...")
         
-        if json_lines:
-            try:
-                json_text = '\n'.join(json_lines)
-                obj = json.loads(json_text)
-                if isinstance(obj, dict) and "next_question" in obj:
-                    logger.debug("Line-by-line JSON extraction succeeded")
-                    return obj
-            except json.JSONDecodeError as e:
-                logger.debug(f"Line-by-line JSON extraction failed: {e}")
+        if not isinstance(obj, dict):
+            logger.error(f"AI response is not a dict: {type(obj)} - {obj}")
+            raise ValueError(f"AI service returned invalid response type: {type(obj)}")
         
-        # Strategy 5: Try with character-level balancing
-        result = self._extract_json_with_balance(text)
-        if result:
-            try:
-                obj = json.loads(result)
-                if isinstance(obj, dict) and "next_question" in obj:
-                    logger.debug("Character-level balanced JSON extraction succeeded")
-                    return obj
-            except json.JSONDecodeError as e:
-                logger.debug(f"Character-level balanced JSON parsing failed: {e}")
+        if "next_question" not in obj:
+            logger.error(f"AI response missing 'next_question' field. Response: {obj}")
+            raise ValueError("AI service returned response without 'next_question' field")
         
-        # All strategies failed - log the actual error
-        logger.error(f"Could not parse AI response as valid JSON. Response preview: {text[:500]}")
-        logger.error(f"Full response length: {len(text)} characters")
+        return obj, strategy
+
+    def _tool_kwargs(self, tool: Dict[str, Any]) -> Dict[str, Any]:
+        """Request arguments forcing ``tool`` when AGENT_STRUCTURED_OUTPUT is enabled, else nothing."""
+        if not getattr(settings, "AGENT_STRUCTURED_OUTPUT", False):
+            return {}
+        return {"tools": [tool], "tool_choice": {"type": "tool", "name": tool["name"]}}
+
+    def _tool_input(self, resp: Any, tool_name: str) -> Optional[Dict[str, Any]]:
+        """Return the input of the named tool_use block in a response, if any."""
+        for block in getattr(resp, "content", []) or []:
+            if getattr(block, "type", None) == "tool_use" and getattr(block, "name", None) == tool_name:
+                tool_input = getattr(block, "input", None)
+                if isinstance(tool_input, dict):
+                    return tool_input
         return None
-    
-    def _fix_unescaped_newlines(self, json_text: str) -> str:
-        """Fix unescaped newlines in JSON string values."""
-        import re
-        # Pattern to match string values: "key": "value with possible \n"
-        # We need to escape actual newline characters within string values
-        def escape_newlines_in_string(match):
-            key_part = match.group(1)  # "key":
-            value = match.group(2)  # the string value
-            # Escape newlines and other problematic control characters
-            escaped_value = value.replace('\n', '\\n').replace('\r', '\\r').replace('\t', '\\t')
-            return f'{key_part} "{escaped_value}"'
-        
-        # Match: "key": "multiline\nvalue"
-        # This is complex because we need to handle escaped quotes
-        result = []
-        in_string = False
-        escape_next = False
-        i = 0
-        while i < len(json_text):
-            char = json_text[i]
-            
-            if escape_next:
-                result.append(char)
-                escape_next = False
-            elif char == '\\':
-                result.append(char)
-                escape_next = True
-            elif char == '"' and not escape_next:
-                in_string = not in_string
-                result.append(char)
-            elif in_string and char == '\n':
-                result.append('\\n')
-            elif in_string and char == '\r':
-                result.append('\\r')
-            elif in_string and char == '\t':
-                result.append('\\t')
+
+    def _control_from_tool_input(self, tool_input: Dict[str, Any]) -> Dict[str, Any]:
+        """Validate a submit_turn tool input as a control object, raising ValueError if unusable."""
+        if "next_question" not in tool_input:
+            logger.error(f"AI tool call missing 'next_question' field. Input: {tool_input}")
+            raise ValueError("AI service returned response without 'next_question' field")
+        control = dict(tool_input)
+        # Models occasionally pass nested objects as JSON strings inside tool input
+        if isinstance(control.get("partial_spec"), str):
+            control["partial_spec"] = extract_json_object(control["partial_spec"]) or {}
+        return control
+
+    async def _stream_model(
+        self,
+        history: List[Dict[str, str]],
+        user_msg: str,
+        spec: Optional[Dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+        profile: Optional[GenerationProfile] = None,
+        deadline: Optional[Deadline] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Stream a Claude turn, yielding next_question text deltas and finally the parsed control object.
+
+        Yields ``{"delta": str}`` items while the model is generating and one ``{"control": dict}``
+        item at the end. If the streamed text cannot be parsed, falls back to the retrying
+        non-streaming path so the caller still gets a valid control object (on the spec profile
+        if the stream was cut off at max_tokens). Streams go to the profile's model or the
+        router's preferred model and are not hedged: deltas already sent cannot be retracted.
+        A request ``deadline`` bounds the stream's timeout and the fallback's retries.
+        """
+        profile = profile or self._profiles[PHASE_SPEC]
+        reader = StreamingFieldReader("next_question")
+        text_parts: List[str] = []
+        compaction = self._compact_messages(history, last_user=user_msg, spec=spec)
+        self._record_compaction(compaction)
+        model = profile.model or self._router.order()[0]
+        started = time.perf_counter()
+        final = None
+        queue_deadline = self._queue_deadline(PRIORITY_INTERACTIVE, deadline)
+        charged: Optional[int] = None  # estimate held on the rate limiter until usage settles it
+        try:
+            timeout = deadline.timeout(profile.timeout) if deadline is not None else profile.timeout
+            self._breaker.before_call()
+            estimate = self._estimate_request_tokens({"system": self._system_blocks(), "messages": compaction.messages})
+            await self._rate_limiter.acquire(estimate, priority=PRIORITY_INTERACTIVE, deadline=queue_deadline)
+            charged = estimate
+            async with self._client.messages.stream(
+                model=model,
+                system=self._system_blocks(),
+                messages=self._with_cache_breakpoint(compaction.messages),
+                max_tokens=profile.max_tokens,
+                temperature=0.2,
+                timeout=timeout,
+                **self._tool_kwargs(_CONTROL_TOOL),
+            ) as stream:
+                async for event in stream:
+                    # Text replies arrive as text events; forced tool calls as partial JSON input
+                    if event.type == "text":
+                        chunk = event.text
+                    elif event.type == "input_json":
+                        chunk = event.partial_json
+                    else:
+                        continue
+                    text_parts.append(chunk)
+                    delta = reader.feed(chunk)
+                    if delta:
+                        yield {"delta": delta}
+                final = await stream.get_final_message()
+            self._settle_usage(charged, final)
+            charged = None
+            self._breaker.record_success()
+            tool_input = self._tool_input(final, _CONTROL_TOOL["name"])
+            if tool_input is not None:
+                control, strategy = self._control_from_tool_input(tool_input), "tool"
             else:
-                result.append(char)
-            i += 1
-        
-        return ''.join(result)
-    
-    def _extract_json_with_balance(self, text: str) -> str:
-        """Extract JSON by balancing braces and brackets."""
-        start = text.find('{')
-        if start == -1:
-            return ""
-        
-        depth = 0
-        end = start
-        
-        for i, char in enumerate(text[start:], start):
-            if char == '{':
-                depth += 1
-            elif char == '}':
-                depth -= 1
-                if depth == 0:
-                    end = i
-                    break
-        
-        if depth == 0:
-            return text[start:end + 1]
-        return ""
-
-    def _extract_json(self, text: str) -> str:
-        """Extract JSON from text, handling markdown code blocks."""
-        if not text:
-            return ""
-        
-        # Try to find JSON in markdown code block
-        json_match = re.search(r'```json\s*\n(.*?)\n```', text, re.DOTALL)
-        if json_match:
-            return json_match.group(1).strip()
-        
-        # Try direct JSON
-        json_match = re.search(r'\{.*\}', text, re.DOTALL)
-        if json_match:
-            return json_match.group(0)
+                control, strategy = self._control_and_strategy("".join(text_parts))
+            self._record_call(f"chat_stream:{profile.phase}", started, 1, final, strategy, session_id=session_id)
+            self._phase_latency[profile.phase].observe(time.perf_counter() - started)
+        except (RateLimitTimeout, CircuitOpenError) as e:
+            self._record_call(f"chat_stream:{profile.phase}", started, 1, ok=False, session_id=session_id)
+            self._raise_if_budget_spent(e, deadline, queue_deadline)
+            raise
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            if charged is not None:
+                self._rate_limiter.refund(charged)
+                charged = None
+            if final is None and self._is_provider_failure(e):
+                self._breaker.record_failure()
+            self._record_call(
+                f"chat_stream:{profile.phase}", started, 1, final,
+                "failed" if final is not None else "none", ok=False, session_id=session_id,
+            )
+            if profile.phase != PHASE_SPEC and getattr(final, "stop_reason", None) == "max_tokens":
+                self._phase_counters[f"{profile.phase}_escalations"] += 1
+                profile = self._profiles[PHASE_SPEC]
+            logger.warning(f"Streaming Claude call failed ({type(e).__name__}: {e}); retrying without streaming")
+            control = await self._call_model(
+                history, user_msg, spec=spec, session_id=session_id, profile=profile, deadline=deadline,
+            )
+        finally:
+            if charged is not None:  # the stream was cancelled or closed mid-call
+                self._rate_limiter.refund(charged)
+        yield {"control": control}
+
+    def _parse_json_response(self, text: str) -> Optional[Dict[str, Any]]:
+        """Parse the control JSON object from an AI response with a single tolerant pass.
+
+        Skips markdown fences and surrounding prose, ignores braces inside strings and
+        escapes raw newlines inside string values (see json_extract.scan_json_object).
+        """
+        return self._parse_json_with_strategy(text)[0]
+
+    def _parse_json_with_strategy(self, text: str) -> Tuple[Optional[Dict[str, Any]], str]:
+        if not text or not text.strip():
+            logger.error("Empty text provided to JSON parser")
+            return None, "failed"
         
-        return text
+        obj, strategy = scan_json_object(text, required_key="next_question")
+        if obj is None:
+            logger.error(f"Could not parse AI response as valid JSON. Response preview: {text[:500]}")
+            logger.error(f"Full response length: {len(text)} characters")
+            return None, strategy
+        logger.debug(f"JSON extraction succeeded (strategy={strategy})")
+        return obj, strategy
 
-    def start_session(self, name: str, description: Optional[str] = None) -> Dict[str, Any]:
+    async def start_session(self, name: str, description: Optional[str] = None) -> Dict[str, Any]:
         """Create a new chat session and return the first question to ask the user."""
         if not name or not str(name).strip():
             raise ValueError("name is required")
@@ -656,15 +1203,13 @@ class AIAgentService:
         first_question = "Describe and explain your business. What does your business do? What are the main products or services you offer? What are your core operations?"
         
         # Initialize session with the first question
-        with self._lock:
-            self._sessions[session_id] = {
-                "name": name,
-                "description": description,
-                "history": [{"role": "assistant", "content": first_question}],
-                "partial_spec": {},
-                "done": False,
-                "project_id": None,
-            }
+        # Written through immediately so the next turn can land on any worker
+        await self._sessions.put(SessionRecord(
+            session_id,
+            name,
+            description=description,
+            history=[{"role": "assistant", "content": first_question}],
+        ), durable=True)
         
         return {"session_id": session_id, "prompt": first_question}
 
@@ -673,33 +1218,412 @@ class AIAgentService:
 
         Catches paraphrases the model uses ("All set, I can build this now") that exact
         substring matching would miss, while staying a cheap, dependency-free classic NLP technique.
+        Reference vectors are precomputed once (see completion_detector.CompletionDetector).
         """
-        if not text or not text.strip():
-            return False
-        tokens = _tokenize(text)
-        if not tokens:
-            return False
-        vec = _tfidf_vector(tokens, _COMPLETION_IDF)
-        max_similarity = max(
-            (_cosine_similarity(vec, ref_vec) for ref_vec in _COMPLETION_REFERENCE_VECTORS),
-            default=0.0,
-        )
-        return max_similarity >= _COMPLETION_SIMILARITY_THRESHOLD
+        return _completion_detector.detect(text)
 
-    def next_turn(self, session_id: str, answer: str) -> Dict[str, Any]:
-        """Advance the conversation with the user's answer and return the next question and merged spec."""
-        with self._lock:
-            state = self._sessions.get(session_id)
-        if not state:
-            raise ValueError("invalid session_id")
+    def detect_completion_batch(self, texts: List[str]) -> List[bool]:
+        """Batch form of _detect_completion_phrases, e.g. for evaluating logged transcripts offline."""
+        return _completion_detector.detect_batch(texts)
+
+    async def next_turn(
+        self,
+        session_id: str,
+        answer: str,
+        priority: int = PRIORITY_INTERACTIVE,
+        deadline: Optional[Deadline] = None,
+    ) -> Dict[str, Any]:
+        """Advance the conversation with the user's answer and return the next question and merged spec.
+
+        Turns on the same session are serialized in arrival order; if another worker updated
+        the session while the model was answering, the turn is replayed once on the newer state.
+        ``priority`` places the model call in the shared rate limiter's queue (batch jobs pass
+        PRIORITY_BATCH so they yield to people waiting on a chat turn).
+
+        A first answer that clearly describes a templated domain is answered from the local
+        template without a model call (the response carries ``template``); the model refines
+        that spec in the background and the next turn waits for the refinement first, within
+        ``deadline`` (an unfinished refinement is then abandoned).
+
+        ``deadline`` is the request's time budget: model attempts are cut to what is left of it
+        and DeadlineExceeded is raised once it is spent. The response's ``budget`` reports how
+        much of it the turn used.
+        """
         if not answer or not str(answer).strip():
             raise ValueError("answer is required")
-        history = state["history"] + [{"role": "user", "content": answer}]
-        control = self._call_model(history, answer)
-        
+        await self._wait_for_refinement(session_id, deadline)
+        async with self._session_locks.hold(session_id):
+            for attempt in range(2):
+                state = await self._sessions.get(session_id)
+                if not state:
+                    raise ValueError("invalid session_id")
+                base_version = state.version
+                history = state.history + [{"role": "user", "content": answer}]
+                template = self._match_template(state, answer)
+                if template is not None:
+                    result = await self._apply_template(state, history, answer, template, priority)
+                    if deadline is not None:
+                        result["budget"] = deadline.report()
+                    return result
+                control = await self._call_model(
+                    history, answer, spec=state.partial_spec, session_id=session_id, priority=priority,
+                    profile=self._turn_profile(state, answer), deadline=deadline,
+                )
+                if control.get("done") and getattr(settings, "AGENT_FANOUT_MODE", False):
+                    control = await self._fan_out(
+                        state.partial_spec, control, session_id=session_id, priority=priority, deadline=deadline,
+                    )
+                try:
+                    result = await self._apply_control(state, history, control, expected_version=base_version)
+                    if deadline is not None:
+                        result["budget"] = deadline.report()
+                    return result
+                except SessionConflictError:
+                    if attempt:
+                        raise
+                    logger.warning(f"Session {session_id} was updated concurrently; replaying turn on the latest state")
+        raise SessionConflictError(f"session {session_id} changed since it was read")  # pragma: no cover
+
+    async def next_turn_stream(
+        self,
+        session_id: str,
+        answer: str,
+        deadline: Optional[Deadline] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Streaming variant of next_turn.
+
+        Yields ``{"event": "delta", "data": {"text": ...}}`` as next_question text is generated,
+        then one ``{"event": "final", "data": {...}}`` carrying the same payload next_turn returns.
+        The final prompt is authoritative; clients should replace the streamed text with it.
+        Holds the session's turn lock for the whole stream; a concurrent update from another
+        worker surfaces as SessionConflictError rather than being overwritten. ``deadline``
+        works as in next_turn.
+        """
+        if not answer or not str(answer).strip():
+            raise ValueError("answer is required")
+        await self._wait_for_refinement(session_id, deadline)
+        async with self._session_locks.hold(session_id):
+            state = await self._sessions.get(session_id)
+            if not state:
+                raise ValueError("invalid session_id")
+            base_version = state.version
+            history = state.history + [{"role": "user", "content": answer}]
+            template = self._match_template(state, answer)
+            if template is not None:
+                final = await self._apply_template(state, history, answer, template, PRIORITY_INTERACTIVE)
+                if deadline is not None:
+                    final["budget"] = deadline.report()
+                yield {"event": "final", "data": final}
+                return
+            control: Dict[str, Any] = {}
+            profile = self._turn_profile(state, answer)
+            async for item in self._stream_model(
+                history, answer, spec=state.partial_spec, session_id=session_id, profile=profile, deadline=deadline,
+            ):
+                if "delta" in item:
+                    yield {"event": "delta", "data": {"text": item["delta"]}}
+                else:
+                    control = item["control"]
+            if control.get("done") and getattr(settings, "AGENT_FANOUT_MODE", False):
+                control = await self._fan_out(state.partial_spec, control, session_id=session_id, deadline=deadline)
+            final = await self._apply_control(state, history, control, expected_version=base_version)
+            if deadline is not None:
+                final["budget"] = deadline.report()
+        yield {"event": "final", "data": final}
+
+    @staticmethod
+    def _entity_groups(entities: List[Dict[str, Any]], size: int) -> List[List[Dict[str, Any]]]:
+        """Split outline entities by their ``group`` (in first-seen order), at most ``size`` per call."""
+        by_group: Dict[Any, List[Dict[str, Any]]] = {}
+        for entity in entities:
+            by_group.setdefault(entity.get("group"), []).append(entity)
+        size = max(1, size)
+        return [members[i:i + size] for members in by_group.values() for i in range(0, len(members), size)]
+
+    async def _fan_out(
+        self,
+        spec: Optional[Dict[str, Any]],
+        control: Dict[str, Any],
+        session_id: Optional[str] = None,
+        priority: int = PRIORITY_INTERACTIVE,
+        deadline: Optional[Deadline] = None,
+    ) -> Dict[str, Any]:
+        """Write fields for an outline-only done turn with one concurrent model call per entity group.
+
+        Entities that already have fields (in the reply or from earlier turns) are left alone.
+        The groups' entities are merged into the outline with _merge_entities, so the turn's
+        wall time is that of the slowest group rather than one call emitting the whole spec.
+        """
+        partial = control.get("partial_spec") or {}
+        outline = [dict(e) for e in partial.get("entities") or [] if isinstance(e, dict) and e.get("name")]
+        defined = {e.get("name") for e in (spec or {}).get("entities") or [] if e.get("fields")}
+        todo = [e for e in outline if not e.get("fields") and e["name"] not in defined]
+        if not todo:
+            return control
+        groups = self._entity_groups(todo, getattr(settings, "AGENT_FANOUT_GROUP_SIZE", 6))
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *(
+                self._generate_entity_group(group, outline, partial, spec, session_id, priority, deadline)
+                for group in groups
+            ),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        entities = outline
+        for generated in results:
+            entities = self._merge_entities(entities, generated)
+        for entity in entities:
+            entity.pop("group", None)
+        logger.info(
+            f"Fan-out wrote {len(todo)} entities in {len(groups)} concurrent calls "
+            f"({time.perf_counter() - started:.2f}s)"
+        )
+        return {**control, "partial_spec": {**partial, "entities": entities}}
+
+    async def _generate_entity_group(
+        self,
+        group: List[Dict[str, Any]],
+        outline: List[Dict[str, Any]],
+        partial: Dict[str, Any],
+        spec: Optional[Dict[str, Any]],
+        session_id: Optional[str],
+        priority: int,
+        deadline: Optional[Deadline] = None,
+    ) -> List[Dict[str, Any]]:
+        """Ask the model for the fields of one entity group; raises once retries are exhausted."""
+        names = [e["name"] for e in group]
+        listing = "\n".join(f"- {e['name']}: {e.get('description') or ''}".rstrip(": ") for e in outline)
+        known = [e for e in (spec or {}).get("entities") or [] if e.get("fields")]
+        context = ""
+        if known:
+            digest = to_schema_digest({"entities": known})
+            context = f"\n\nALREADY DEFINED (compact digest):\n{SCHEMA_DIGEST_LEGEND}\n\n{digest}"
+        app_type = partial.get("app_type") or (spec or {}).get("app_type") or "application"
+        db_type = partial.get("db_type") or (spec or {}).get("db_type") or "postgresql"
+        prompt = (
+            f"You are writing part of the database schema for a {app_type} ({db_type}).\n\n"
+            f"ALL ENTITIES IN THE DESIGN:\n{listing}{context}\n\n"
+            f"TASK: Write complete field definitions for ONLY these entities: {', '.join(names)}. "
+            'Every entity has {"name": "id", "type": "uuid", "required": true, "primary_key": true}. '
+            'Reference other entities from the list above with "foreign_key": {"table": ..., "field": "id"}. '
+            'Field keys: name, type, required, and where useful unique, default, precision, scale, max_length.\n\n'
+            'Respond with ONLY valid JSON: {"entities": [{"name": ..., "fields": [...]}]}'
+        )
+        max_retries = 2
+        queue_deadline = self._queue_deadline(priority, deadline)
+        for attempt in range(max_retries):
+            timeout = deadline.timeout(30.0) if deadline is not None else 30.0
+            started = time.perf_counter()
+            resp = None
+            try:
+                resp = await self._create_message(
+                    priority=priority,
+                    deadline=queue_deadline,
+                    messages=[{"role": "user", "content": prompt}],
+                    max_tokens=getattr(settings, "AGENT_FANOUT_MAX_TOKENS", 3000),
+                    temperature=0.2,
+                    timeout=timeout,
+                    **self._tool_kwargs(_ENTITY_GROUP_TOOL),
+                )
+                payload, strategy = self._tool_input(resp, _ENTITY_GROUP_TOOL["name"]), "tool"
+                if payload is None:
+                    text = "".join(getattr(b, "text", "") or "" for b in getattr(resp, "content", []) or [])
+                    payload, strategy = scan_json_object(text, required_key="entities")
+                generated = {
+                    e["name"]: e for e in (payload or {}).get("entities") or []
+                    if isinstance(e, dict) and e.get("name") in names and e.get("fields")
+                }
+                missing = [name for name in names if name not in generated]
+                if missing:
+                    raise ValueError(f"AI did not define entities: {', '.join(missing)}")
+                self._record_call("fanout_group", started, attempt + 1, resp, strategy, session_id=session_id)
+                return [generated[name] for name in names]
+            except (RateLimitTimeout, CircuitOpenError) as e:
+                self._record_call("fanout_group", started, attempt + 1, ok=False, session_id=session_id)
+                self._raise_if_budget_spent(e, deadline, queue_deadline)
+                raise
+            except Exception as e:
+                self._record_call(
+                    "fanout_group", started, attempt + 1, resp,
+                    "failed" if resp is not None else "none", ok=False, session_id=session_id,
+                )
+                logger.warning(f"Fan-out group {names} failed (attempt={attempt + 1}/{max_retries}): {type(e).__name__}: {e}")
+                if attempt < max_retries - 1:
+                    sleep_s = self._retry_delay(e, 0.5)
+                    if deadline is not None and sleep_s >= deadline.remaining():
+                        raise DeadlineExceeded(f"request time budget of {deadline.budget:g}s exhausted") from e
+                    await asyncio.sleep(sleep_s)
+        if deadline is not None:
+            deadline.check("another retry")
+        raise RuntimeError("AI service unavailable after multiple retries. Please try again later.")
+
+    def _turn_profile(self, state: SessionRecord, answer: str) -> GenerationProfile:
+        """Generation profile for the turn answering ``state``'s last question with ``answer``."""
+        phase = select_phase(
+            state.history,
+            answer,
+            done=state.done,
+            spec_after_turns=getattr(settings, "AGENT_SPEC_PHASE_AFTER_TURNS", 2),
+        )
+        self._phase_counters[f"{phase}_turns"] += 1
+        return self._profiles[phase]
+
+    def phase_stats(self) -> Dict[str, Any]:
+        """Per-phase generation profile, turn count, escalations and model-call latency."""
+        return {
+            phase: {
+                **profile.describe(),
+                "turns": self._phase_counters[f"{phase}_turns"],
+                "escalations": self._phase_counters[f"{phase}_escalations"],
+                "latency": self._phase_latency[phase].snapshot(),
+            }
+            for phase, profile in self._profiles.items()
+        }
+
+    def _match_template(self, state: SessionRecord, answer: str) -> Optional[str]:
+        """Return the template domain for a session's first answer, or None to ask the model."""
+        if self._template_matcher is None or len(state.history) != 1:
+            return None
+        if (state.partial_spec or {}).get("entities"):
+            return None
+        match = self._template_matcher.match(answer)
+        if match is None:
+            return None
+        logger.info(f"Session {state.session_id}: first answer matched the {match[0]} template (score={match[1]:.2f})")
+        return match[0]
+
+    async def _apply_template(
+        self,
+        state: SessionRecord,
+        history: List[Dict[str, str]],
+        answer: str,
+        domain: str,
+        priority: int,
+    ) -> Dict[str, Any]:
+        """Answer the first turn from a domain template and start the background refinement."""
+        spec = self._template_matcher.template_spec(domain)
+        control = {
+            "next_question": self._template_matcher.templates[domain]["follow_up"],
+            "done": False,
+            "partial_spec": spec,
+        }
+        result = await self._apply_control(state, history, control, expected_version=state.version)
+        self._start_refinement(state.session_id, history, answer, copy.deepcopy(result["partial_spec"]), priority)
+        return {**result, "template": domain}
+
+    def _start_refinement(
+        self,
+        session_id: str,
+        history: List[Dict[str, str]],
+        answer: str,
+        spec: Dict[str, Any],
+        priority: int,
+    ) -> None:
+        previous = self._refine_tasks.pop(session_id, None)
+        if previous is not None:
+            previous.cancel()
+        # The user's next turn waits on this call, so it is queued like a turn of its own
+        task = asyncio.ensure_future(self._refine_template(session_id, history, answer, spec, priority))
+        self._refine_tasks[session_id] = task
+        task.add_done_callback(lambda t: self._forget_refinement(session_id, t))
+
+    def _forget_refinement(self, session_id: str, task: "asyncio.Task") -> None:
+        if self._refine_tasks.get(session_id) is task:
+            del self._refine_tasks[session_id]
+
+    async def _wait_for_refinement(self, session_id: str, deadline: Optional[Deadline] = None) -> None:
+        """Let a pending template refinement land before the session's next turn reads it.
+
+        The wait is bounded by the question profile's timeout and, with a ``deadline``, leaves
+        that much of the budget for the turn's own model call. A refinement still running after
+        that is cancelled and the turn goes on from the template.
+        """
+        task = self._refine_tasks.get(session_id)
+        if task is None:
+            return
+        limit = self._profiles[PHASE_QUESTION].timeout
+        if deadline is not None:
+            limit = min(limit, max(0.0, deadline.remaining() - limit))
+        await asyncio.wait([task], timeout=limit)
+        if not task.done():
+            logger.info(f"Template refinement for session {session_id} did not finish in time; skipping it")
+            task.cancel()
+
+    async def _refine_template(
+        self,
+        session_id: str,
+        history: List[Dict[str, str]],
+        answer: str,
+        spec: Dict[str, Any],
+        priority: int,
+    ) -> None:
+        """Ask the model to adapt a template spec to the user's description and swap it in.
+
+        The refined spec replaces the template rather than being merged into it, so tables
+        that do not fit the business can be dropped. Only ``partial_spec`` (or ``spec_patch``)
+        is taken: the user is already answering the template's follow-up question, so the
+        model's question is dropped. On failure, or once the session's spec has been changed
+        by anything else, the current spec stays.
+        """
+        ask = f"{answer}\n\n{_REFINE_TEMPLATE_INSTRUCTION}"
+        try:
+            control = await self._call_model(
+                history[:-1] + [{"role": "user", "content": ask}], ask,
+                spec=spec, session_id=session_id, priority=priority, profile=self._profiles[PHASE_QUESTION],
+            )
+        except Exception as e:
+            logger.warning(f"Template refinement failed for session {session_id}; keeping the template: {e}")
+            return
+        refined = self._refined_spec(spec, control)
+        if refined is None:
+            return
+        async with self._session_locks.hold(session_id):
+            state = await self._sessions.get(session_id)
+            # Another turn or an edit already moved the session on (e.g. on another worker): keep its state
+            if state is None or state.done or len(state.history) != len(history) + 1 or state.partial_spec != spec:
+                return
+            state.partial_spec = refined
+            state.spec_index = None
+            try:
+                await self._sessions.put(state, expected_version=state.version)
+            except SessionConflictError:
+                logger.info(f"Session {session_id} changed elsewhere; dropping the template refinement")
+                return
+        logger.info(f"Refined the template spec for session {session_id}")
+
+    @staticmethod
+    def _refined_spec(template: Dict[str, Any], control: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """The spec a refinement reply describes, or None when it carries no entities."""
+        partial = control.get("partial_spec") or {}
+        if partial.get("entities"):
+            return {**{k: v for k, v in template.items() if k != "entities"}, **partial}
+        if isinstance(control.get("spec_patch"), list):
+            refined = copy.deepcopy(template)
+            apply_spec_patch(refined, control["spec_patch"])
+            return refined
+        return None
+
+    async def _apply_control(
+        self,
+        state: SessionRecord,
+        history: List[Dict[str, str]],
+        control: Dict[str, Any],
+        expected_version: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """Merge a validated control object into the session state and build the turn response."""
         # _call_model guarantees control is valid dict with required fields
         partial = control.get("partial_spec") or {}
-        merged = self._merge_partial(dict(state.get("partial_spec") or {}), partial)
+        if partial or not isinstance(control.get("spec_patch"), list):
+            merged = self._merge_partial(dict(state.partial_spec or {}), partial)
+            state.spec_index = None
+        else:
+            merged = state.partial_spec if state.partial_spec is not None else {}
+        if isinstance(control.get("spec_patch"), list):
+            # Applied in place through the session's cached name index: O(changes), no list rebuilds
+            state.spec_index = apply_spec_patch(merged, control["spec_patch"], state.spec_index)
         done = bool(control.get("done", False))
         
         # Check if AI is using completion phrases
@@ -720,29 +1644,162 @@ class AIAgentService:
             merged["db_type"] = "postgresql"  # Default to postgresql
             control["partial_spec"] = merged
         
-        with self._lock:
-            state["history"] = history + [{"role": "assistant", "content": json.dumps(control)}]
-            state["partial_spec"] = merged
-            state["done"] = done
+        state.history = history + [{"role": "assistant", "content": json.dumps(control)}]
+        state.partial_spec = merged
+        state.done = done
+        digest = spec_hash(merged) if done else None
+        if state.artifacts_spec_hash != digest:
+            # The spec moved on (or the conversation reopened): precomputed artifacts are stale
+            state.artifacts = None
+            state.artifacts_spec_hash = None
+        await self._sessions.put(state, expected_version=expected_version)
+        if done and state.artifacts is None:
+            self._start_artifact_generation(state.session_id, merged, digest)
+        else:
+            self._drop_artifact_task(state.session_id, keep_hash=digest)
         return {
             "prompt": control.get("next_question") or ("Ok. Anything else?" if not done else "Ready to finalize."),
             "done": done,
             "partial_spec": merged,
         }
 
-    def finalize(self, session_id: str) -> Dict[str, Any]:
-        """Finalize the session and return a generated project_id with the accumulated spec."""
-        with self._lock:
-            state = self._sessions.get(session_id)
-        if not state:
-            raise ValueError("invalid session_id")
-        spec = dict(state.get("partial_spec") or {})
-        if not state.get("project_id"):
-            state["project_id"] = str(uuid4())
-        return {"project_id": state["project_id"], "spec": spec}
-
-    def generate_schema_suggestions(self, postgres_sql: str, schema: Dict[str, Any], rejected_suggestions: list = None, previously_suggested: list = None) -> Dict[str, Any]:
-        """Generate two AI suggestions for improving the database schema."""
+    async def finalize(self, session_id: str) -> Dict[str, Any]:
+        """Finalize the session and return a generated project_id with the accumulated spec.
+
+        ``artifacts`` carries the generate_all output precomputed when the conversation
+        completed (waiting for it if it is still running), or None if the spec has changed
+        since or generation failed; callers then generate the artifacts themselves.
+        """
+        async with self._session_locks.hold(session_id):
+            for attempt in range(2):
+                state = await self._sessions.get(session_id)
+                if not state:
+                    raise ValueError("invalid session_id")
+                spec = dict(state.partial_spec or {})
+                digest = spec_hash(state.partial_spec)
+                artifacts = state.artifacts if state.artifacts_spec_hash == digest else None
+                if state.project_id:
+                    break
+                # Versioned so a concurrent write on another worker cannot silently drop the id
+                state.project_id = str(uuid4())
+                try:
+                    await self._sessions.put(state, expected_version=state.version)
+                    break
+                except SessionConflictError:
+                    if attempt:
+                        raise
+                    logger.warning(f"Session {session_id} was updated concurrently; finalizing the latest state")
+        if artifacts is None:
+            pending = self._artifact_tasks.get(session_id)
+            if pending is not None and pending[0] == digest:
+                artifacts = await asyncio.shield(pending[1])
+        return {
+            "project_id": state.project_id,
+            "spec": spec,
+            "artifacts": artifacts,
+            "usage": self._metrics.session_summary(session_id),
+        }
+
+    def _start_artifact_generation(self, session_id: str, spec: Dict[str, Any], digest: str) -> None:
+        """Run generate_all for a completed conversation in a worker thread, off the request path."""
+        pending = self._artifact_tasks.get(session_id)
+        if pending is not None and pending[0] == digest:
+            return
+        self._drop_artifact_task(session_id)
+        task = asyncio.ensure_future(self._generate_artifacts(session_id, copy.deepcopy(spec), digest))
+        self._artifact_tasks[session_id] = (digest, task)
+        task.add_done_callback(lambda t: self._forget_artifact_task(session_id, t))
+
+    def _drop_artifact_task(self, session_id: str, keep_hash: Optional[str] = None) -> None:
+        pending = self._artifact_tasks.get(session_id)
+        if pending is not None and pending[0] != keep_hash:
+            # The worker thread cannot be interrupted; its result is simply discarded
+            pending[1].cancel()
+            self._artifact_tasks.pop(session_id, None)
+
+    def _forget_artifact_task(self, session_id: str, task: "asyncio.Task") -> None:
+        pending = self._artifact_tasks.get(session_id)
+        if pending is not None and pending[1] is task:
+            del self._artifact_tasks[session_id]
+
+    async def _generate_artifacts(self, session_id: str, spec: Dict[str, Any], digest: str) -> Optional[Dict[str, Any]]:
+        try:
+            artifacts = await asyncio.to_thread(generate_all, spec)
+        except Exception as e:
+            logger.warning(f"Background artifact generation failed for session {session_id}: {e}")
+            return None
+        async with self._session_locks.hold(session_id):
+            state = await self._sessions.get(session_id)
+            if state is None or not state.done or spec_hash(state.partial_spec) != digest:
+                return None
+            state.artifacts = artifacts
+            state.artifacts_spec_hash = digest
+            try:
+                await self._sessions.put(state, expected_version=state.version)
+            except SessionConflictError:
+                logger.info(f"Session {session_id} changed elsewhere; dropping its precomputed artifacts")
+                return None
+        logger.info(f"Precomputed schema artifacts for completed session {session_id}")
+        return artifacts
+
+    def session_stats(self) -> Dict[str, Any]:
+        """Return session-store size and memory statistics."""
+        return self._sessions.stats()
+
+    def suggestion_cache_stats(self) -> Dict[str, Any]:
+        """Return suggestion-cache size and hit/miss/coalescing counters."""
+        return self._suggestion_cache.stats()
+
+    async def close(self) -> None:
+        """Release background resources held by the agent (session sweeper, background tasks, HTTP pool)."""
+        for _, task in list(self._artifact_tasks.values()):
+            task.cancel()
+        self._artifact_tasks.clear()
+        for task in list(self._refine_tasks.values()):
+            task.cancel()
+        self._refine_tasks.clear()
+        await self._sessions.close()
+        if self._http_client is not None:
+            await self._http_client.aclose()
+
+    async def suggest_for_schema(self, schema: Dict[str, Any], rejected_suggestions: list = None, previously_suggested: list = None, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """Cached, single-flighted schema suggestions.
+
+        Unchanged schema + exclusion lists are answered from the cache; identical concurrent
+        requests share one model call. The prompt carries the schema digest (see
+        to_schema_digest), not the full DDL, and failed calls are not cached (callers get the
+        fallback suggestions). A caller whose ``deadline`` runs out stops waiting and gets the
+        fallback too; a shared model call keeps the deadline of the request that started it.
+        """
+        key = suggestion_key(schema, rejected_suggestions, previously_suggested)
+
+        async def compute() -> Dict[str, Any]:
+            return await self._request_schema_suggestions(None, schema, rejected_suggestions, previously_suggested, deadline)
+
+        try:
+            if deadline is None:
+                return await self._suggestion_cache.get_or_compute(key, compute)
+            # The shared call is shielded inside get_or_compute, so giving up here does not cancel it
+            return await asyncio.wait_for(self._suggestion_cache.get_or_compute(key, compute), deadline.remaining())
+        except Exception as e:
+            logger.error(f"Failed to generate suggestions: {e}")
+            return self._fallback_suggestions()
+
+    async def generate_schema_suggestions(self, postgres_sql: str, schema: Dict[str, Any], rejected_suggestions: list = None, previously_suggested: list = None, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """Generate two AI suggestions for improving the database schema.
+
+        The prompt describes ``schema`` as a compact digest; ``postgres_sql`` is only sent
+        when ``schema`` has no entities to digest. With a ``deadline`` the model call's timeout
+        is the budget left, and a spent budget returns the fallback suggestions.
+        """
+        try:
+            return await self._request_schema_suggestions(postgres_sql, schema, rejected_suggestions, previously_suggested, deadline)
+        except Exception as e:
+            logger.error(f"Failed to generate suggestions: {e}")
+            return self._fallback_suggestions()
+
+    async def _request_schema_suggestions(self, postgres_sql: Optional[str], schema: Dict[str, Any], rejected_suggestions: list = None, previously_suggested: list = None, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """Ask the model for two suggestions; raises if the call fails or the reply is unusable."""
         if rejected_suggestions is None:
             rejected_suggestions = []
         if previously_suggested is None:
@@ -760,10 +1817,15 @@ class AIAgentService:
             prev_list = ", ".join(previously_suggested)
             excluded_text += f"\n\nUNIQUENESS REQUIREMENT: The following tables have already been suggested to the user. Please suggest DIFFERENT tables:\n{prev_list}\n\nIf you need ideas, consider: audit trails, analytics/reporting tables, intermediate junction tables, normalization opportunities, or edge case tables."
         
+        # The digest states the same tables, keys and indexes as the DDL in far fewer tokens
+        if (schema or {}).get("entities"):
+            schema_text = f"CURRENT DATABASE SCHEMA (compact digest):\n{SCHEMA_DIGEST_LEGEND}\n\n{to_schema_digest(schema)}"
+        else:
+            schema_text = f"CURRENT DATABASE SCHEMA:\n{postgres_sql or ''}"
+        
         prompt = f"""You are analyzing a database schema and providing improvement suggestions.
 
-CURRENT DATABASE SCHEMA:
-{postgres_sql}{excluded_text}
+{schema_text}{excluded_text}
 
 TASK: Provide TWO COMPLETELY NEW AND UNIQUE suggestions for how this database could be improved.
 
@@ -808,41 +1870,52 @@ Provide your response in this EXACT JSON format:
 
 CRITICAL: Respond with ONLY valid JSON. No other text before or after."""
         
+        started = time.perf_counter()
+        message = None
+        queue_deadline = self._queue_deadline(PRIORITY_SUGGESTIONS, deadline)
         try:
-            message = self._client.messages.create(
-                model=self._model_name,
+            budget = {"timeout": deadline.timeout(60.0)} if deadline is not None else {}
+            message = await self._create_message(
+                priority=PRIORITY_SUGGESTIONS,
+                deadline=queue_deadline,
                 max_tokens=4096,
-                messages=[{"role": "user", "content": prompt}]
+                messages=[{"role": "user", "content": prompt}],
+                **budget,
+                **self._tool_kwargs(_SUGGESTIONS_TOOL),
             )
             
-            response_text = message.content[0].text if message.content else ""
-            response_text = self._extract_json(response_text)
-            
-            # Parse JSON response
-            suggestions = json.loads(response_text)
+            suggestions, strategy = self._tool_input(message, _SUGGESTIONS_TOOL["name"]), "tool"
+            if suggestions is None:
+                response_text = "".join(getattr(b, "text", "") or "" for b in message.content or [])
+                # Parse JSON response
+                suggestions, strategy = scan_json_object(response_text, required_key="option_1")
             
             # Ensure we have both options
-            if "option_1" not in suggestions or "option_2" not in suggestions:
+            if not suggestions or "option_1" not in suggestions or "option_2" not in suggestions:
                 raise ValueError("AI did not return both option_1 and option_2")
-            
-            return suggestions
-            
         except Exception as e:
-            logger.error(f"Failed to generate suggestions: {e}")
-            # Return fallback suggestions
-            return {
-                "option_1": {
-                    "reasoning": "Could not generate AI suggestion. Please try again.",
-                    "new_table": None,
-                    "connections": []
-                },
-                "option_2": {
-                    "reasoning": "Could not generate AI suggestion. Please try again.",
-                    "tables_to_merge": [],
-                    "merged_table": None,
-                    "connections": []
-                }
+            self._record_call("suggestions", started, 1, message, "failed" if message is not None else "none", ok=False)
+            self._retry_delay(e, 0.0)  # a 429 still pauses the shared limiter
+            self._raise_if_budget_spent(e, deadline, queue_deadline)
+            raise
+        self._record_call("suggestions", started, 1, message, strategy)
+        return suggestions
+
+    def _fallback_suggestions(self) -> Dict[str, Any]:
+        """Placeholder suggestions returned when the model call fails."""
+        return {
+            "option_1": {
+                "reasoning": "Could not generate AI suggestion. Please try again.",
+                "new_table": None,
+                "connections": []
+            },
+            "option_2": {
+                "reasoning": "Could not generate AI suggestion. Please try again.",
+                "tables_to_merge": [],
+                "merged_table": None,
+                "connections": []
             }
+        }
 
 
 # Lazy initialize the agent to avoid crashing app startup if SDK/env isn't ready
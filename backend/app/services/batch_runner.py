@@ -0,0 +1,187 @@
+import asyncio
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from loguru import logger
+
+try:
+    from app.services.rate_limiter import PRIORITY_BATCH
+    from app.services.schema_generator import generate_all
+except ImportError:
+    from backend.app.services.rate_limiter import PRIORITY_BATCH
+    from backend.app.services.schema_generator import generate_all
+
+DEFAULT_AUTO_ANSWER = (
+    "Use sensible defaults for anything I have not specified and finish the database design."
+)
+
+
+class BatchJob:
+    """One business description to push through the agent without a human in the loop."""
+
+    __slots__ = ("job_id", "name", "description", "answers")
+
+    def __init__(self, job_id: str, name: str, description: str, answers: Optional[List[str]] = None) -> None:
+        self.job_id = job_id
+        self.name = name
+        self.description = description
+        self.answers = list(answers or [])
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], index: int = 0) -> "BatchJob":
+        if not isinstance(data, dict):
+            raise ValueError(f"job {index}: expected an object")
+        description = str(data.get("description") or "").strip()
+        if not description:
+            raise ValueError(f"job {index}: description is required")
+        job_id = str(data.get("id") or data.get("job_id") or f"job-{index}")
+        return cls(job_id, str(data.get("name") or job_id), description, data.get("answers"))
+
+
+def load_jobs(path: Path) -> List[BatchJob]:
+    """Read jobs from an NDJSON file (one ``{"id", "name", "description", "answers"}`` object per line)."""
+    jobs: List[BatchJob] = []
+    seen: Set[str] = set()
+    with open(path, "r", encoding="utf-8") as fh:
+        for index, line in enumerate(fh):
+            if not line.strip():
+                continue
+            job = BatchJob.from_dict(json.loads(line), index)
+            if job.job_id in seen:
+                raise ValueError(f"duplicate job id {job.job_id!r}")
+            seen.add(job.job_id)
+            jobs.append(job)
+    return jobs
+
+
+def completed_job_ids(output_path: Path) -> Set[str]:
+    """Ids already written successfully to ``output_path``; failed jobs are retried on resume.
+
+    A torn last line (the process died mid-write) is ignored.
+    """
+    done: Set[str] = set()
+    if not output_path.exists():
+        return done
+    with open(output_path, "r", encoding="utf-8") as fh:
+        for line in fh:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(row, dict) and row.get("status") == "ok" and row.get("id"):
+                done.add(str(row["id"]))
+    return done
+
+
+def _ends_with_newline(path: Path) -> bool:
+    with open(path, "rb") as fh:
+        fh.seek(-1, 2)
+        return fh.read(1) == b"\n"
+
+
+class BatchRunner:
+    """Runs BatchJobs through AIAgentService on a bounded worker pool.
+
+    Each job is start_session -> description -> scripted answers (then ``auto_answer``) until
+    the agent reports done or ``max_turns`` is reached -> finalize -> generate_all. Turns run at
+    PRIORITY_BATCH on the agent's model rate limiter, so they yield to interactive chat; a
+    cap on the batch itself is set on that same limiter (``agent.cap_priority``) and is
+    shared by all workers. Results are appended to an NDJSON
+    file one line per job as soon as the job ends, so a restarted run skips finished jobs.
+    """
+
+    def __init__(
+        self,
+        agent: Any,
+        workers: int = 4,
+        max_turns: int = 8,
+        auto_answer: str = DEFAULT_AUTO_ANSWER,
+    ) -> None:
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        if max_turns < 1:
+            raise ValueError("max_turns must be at least 1")
+        self.agent = agent
+        self.workers = workers
+        self.max_turns = max_turns
+        self.auto_answer = auto_answer
+        self.active = 0
+        self.peak_active = 0
+
+    async def run_job(self, job: BatchJob) -> Dict[str, Any]:
+        started = time.perf_counter()
+        row: Dict[str, Any] = {"id": job.job_id, "name": job.name}
+        turns = 0
+        try:
+            session = await self.agent.start_session(job.name, job.description)
+            answers = [job.description] + job.answers
+            result: Dict[str, Any] = {"done": False}
+            while not result.get("done") and turns < self.max_turns:
+                answer = answers[turns] if turns < len(answers) else self.auto_answer
+                result = await self.agent.next_turn(session["session_id"], answer, priority=PRIORITY_BATCH)
+                turns += 1
+            out = await self.agent.finalize(session["session_id"])
+            artifacts = out.get("artifacts")
+            if artifacts is None:
+                artifacts = await asyncio.to_thread(generate_all, out["spec"])
+            row.update({
+                "status": "ok",
+                "done": bool(result.get("done")),
+                "turns": turns,
+                "project_id": out["project_id"],
+                "spec": out["spec"],
+                "artifacts": artifacts,
+                "usage": out.get("usage"),
+            })
+        except Exception as exc:
+            logger.warning(f"Batch job {job.job_id} failed after {turns} turns: {exc}")
+            row.update({"status": "error", "turns": turns, "error": f"{type(exc).__name__}: {exc}"})
+        row["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+        return row
+
+    async def run(self, jobs: Iterable[BatchJob], output_path: Path, resume: bool = True) -> Dict[str, Any]:
+        """Run ``jobs`` and append one NDJSON row per job to ``output_path``; returns a summary."""
+        output_path = Path(output_path)
+        skip = completed_job_ids(output_path) if resume else set()
+        jobs = list(jobs)
+        pending = [job for job in jobs if job.job_id not in skip]
+        queue: "asyncio.Queue[BatchJob]" = asyncio.Queue()
+        for job in pending:
+            queue.put_nowait(job)
+        counts = {"ok": 0, "error": 0}
+        started = time.perf_counter()
+        with open(output_path, "a" if resume else "w", encoding="utf-8") as out:
+            if resume and out.tell() and not _ends_with_newline(output_path):
+                out.write("\n")  # terminate a torn last line so the next row parses
+
+            async def worker() -> None:
+                while True:
+                    try:
+                        job = queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        return
+                    self.active += 1
+                    self.peak_active = max(self.peak_active, self.active)
+                    try:
+                        row = await self.run_job(job)
+                    finally:
+                        self.active -= 1
+                    counts[row["status"]] += 1
+                    # Single-threaded event loop: the line is written whole before another worker runs
+                    out.write(json.dumps(row, default=str) + "\n")
+                    out.flush()
+
+            await asyncio.gather(*(worker() for _ in range(min(self.workers, len(pending)))))
+        summary = {
+            "skipped": len(jobs) - len(pending),
+            "ran": len(pending),
+            **counts,
+            "peak_workers": self.peak_active,
+            "elapsed_seconds": round(time.perf_counter() - started, 3),
+        }
+        if hasattr(self.agent, "rate_limit_stats"):
+            summary["rate_limiter"] = self.agent.rate_limit_stats()
+        logger.info(f"Batch finished: {summary}")
+        return summary
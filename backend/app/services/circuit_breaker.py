@@ -0,0 +1,115 @@
+import time
+from collections import Counter, deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from loguru import logger
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """The model provider is failing; calls are rejected without being attempted."""
+
+    def __init__(self, retry_after: float) -> None:
+        self.retry_after = max(0.0, retry_after)
+        super().__init__(f"AI service is temporarily unavailable; retry in {self.retry_after:.0f}s")
+
+
+class CircuitBreaker:
+    """Error-rate circuit breaker for model provider calls.
+
+    - closed: calls go through; outcomes from the last ``window`` seconds are kept. Once at
+      least ``min_calls`` are in the window and the failure share reaches ``failure_rate``,
+      the circuit opens.
+    - open: ``before_call`` raises CircuitOpenError for ``open_seconds``.
+    - half_open: one probe call is let through; success closes the circuit, failure opens it
+      again. A probe that never reports back (e.g. cancelled) is replaced after
+      ``open_seconds``.
+    """
+
+    def __init__(
+        self,
+        failure_rate: float = 0.5,
+        min_calls: int = 10,
+        window: float = 60.0,
+        open_seconds: float = 30.0,
+    ) -> None:
+        self.failure_rate = failure_rate
+        self.min_calls = max(1, min_calls)
+        self.window = window
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.counters: Counter = Counter()
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_started: Optional[float] = None
+
+    def _trim(self, now: float) -> None:
+        while self._outcomes and now - self._outcomes[0][0] > self.window:
+            _, ok = self._outcomes.popleft()
+            self._failures -= 0 if ok else 1
+
+    def _open(self, now: float) -> None:
+        self.state = OPEN
+        self._opened_at = now
+        self._probe_started = None
+        self.counters["opened"] += 1
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError if the call must not be attempted right now."""
+        now = time.monotonic()
+        if self.state == OPEN:
+            remaining = self._opened_at + self.open_seconds - now
+            if remaining > 0:
+                self.counters["rejected"] += 1
+                raise CircuitOpenError(remaining)
+            logger.info("Model circuit half-open: probing the provider")
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            if self._probe_started is not None and now - self._probe_started < self.open_seconds:
+                self.counters["rejected"] += 1
+                raise CircuitOpenError(self._probe_started + self.open_seconds - now)
+            self._probe_started = now
+
+    def record_success(self) -> None:
+        now = time.monotonic()
+        if self.state == HALF_OPEN:
+            logger.info("Model circuit closed: provider recovered")
+            self.state = CLOSED
+            self._outcomes.clear()
+            self._failures = 0
+            self._probe_started = None
+            return
+        self._outcomes.append((now, True))
+        self._trim(now)
+
+    def record_failure(self) -> None:
+        now = time.monotonic()
+        self.counters["failures"] += 1
+        if self.state == HALF_OPEN:
+            logger.warning("Model circuit probe failed; staying open")
+            self._open(now)
+            return
+        if self.state == OPEN:
+            return
+        self._outcomes.append((now, False))
+        self._failures += 1
+        self._trim(now)
+        calls = len(self._outcomes)
+        if calls >= self.min_calls and self._failures / calls >= self.failure_rate:
+            logger.warning(f"Model circuit open: {self._failures}/{calls} calls failed in the last {self.window:.0f}s")
+            self._open(now)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        self._trim(now)
+        return {
+            "state": self.state,
+            "window_calls": len(self._outcomes),
+            "window_failures": self._failures,
+            "retry_after_seconds": round(max(0.0, self._opened_at + self.open_seconds - now), 3) if self.state == OPEN else 0.0,
+            **{k: self.counters[k] for k in ("opened", "rejected", "failures")},
+        }
@@ -0,0 +1,174 @@
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+# Reference phrases the model tends to use when it believes the conversation is complete.
+COMPLETION_REFERENCE_PHRASES = [
+    "perfect i have enough information to create your database design",
+    "great i now have everything i need to design your database",
+    "excellent based on what you've told me i can create your database schema",
+    "i have enough information to create the schema",
+    "i can create your database schema now",
+    "ready to design your database",
+    "i have everything i need to design this",
+]
+COMPLETION_SIMILARITY_THRESHOLD = 0.45
+# Reference phrases users write when they have nothing more to add (see generation_profile)
+USER_COMPLETION_PHRASES = [
+    "that covers all of it",
+    "that's everything",
+    "no other requirements",
+    "nothing else",
+    "that's all",
+    "go ahead and build it",
+    "finish the database design",
+    "use sensible defaults for anything else",
+]
+_TOKEN_RE = re.compile(r"[a-z']+")
+_STOPWORDS = {
+    "a", "an", "the", "i", "you", "your", "yours", "me", "my", "to", "of", "on", "in", "for",
+    "and", "or", "is", "are", "be", "can", "now", "this", "that", "what", "based",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokenizer with stopword removal used by the TF-IDF completion detector."""
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+def build_idf(documents: List[List[str]]) -> Dict[str, float]:
+    """Compute inverse-document-frequency weights over a small reference corpus."""
+    doc_count = len(documents)
+    doc_freq: Counter = Counter()
+    for tokens in documents:
+        for term in set(tokens):
+            doc_freq[term] += 1
+    return {term: math.log((1 + doc_count) / (1 + freq)) + 1.0 for term, freq in doc_freq.items()}
+
+
+def tfidf_vector(tokens: List[str], idf: Dict[str, float]) -> Dict[str, float]:
+    """Build a sparse TF-IDF vector for a token list given precomputed IDF weights."""
+    term_freq = Counter(tokens)
+    total = sum(term_freq.values()) or 1
+    return {term: (count / total) * idf.get(term, 1.0) for term, count in term_freq.items()}
+
+
+def cosine_similarity(vec_a: Dict[str, float], vec_b: Dict[str, float]) -> float:
+    """Cosine similarity between two sparse TF-IDF vectors."""
+    shared_terms = set(vec_a) & set(vec_b)
+    if not shared_terms:
+        return 0.0
+    dot = sum(vec_a[t] * vec_b[t] for t in shared_terms)
+    norm_a = math.sqrt(sum(v * v for v in vec_a.values()))
+    norm_b = math.sqrt(sum(v * v for v in vec_b.values()))
+    if norm_a == 0 or norm_b == 0:
+        return 0.0
+    return dot / (norm_a * norm_b)
+
+
+class CompletionDetector:
+    """TF-IDF completion-phrase detector with the reference side precomputed once.
+
+    Reference vectors are L2-normalized into a dense ``(phrases x vocabulary)`` matrix, so
+    scoring a text is one sparse-dense product: the text's weights on in-vocabulary terms
+    against the matrix columns, divided by the text's own norm (which still counts
+    out-of-vocabulary terms, exactly as ``cosine_similarity`` does). Scores match the
+    per-call implementation.
+
+    Single texts are scored through term -> (phrase, weight) postings over the same matrix:
+    with a handful of reference phrases that beats NumPy's per-call overhead. Batches become
+    one ``(texts x vocabulary) @ (vocabulary x phrases)`` product (``use_numpy=False`` keeps
+    the pure-Python loop).
+    """
+
+    def __init__(
+        self,
+        phrases: Sequence[str] = COMPLETION_REFERENCE_PHRASES,
+        threshold: float = COMPLETION_SIMILARITY_THRESHOLD,
+        use_numpy: bool = True,
+    ) -> None:
+        self.threshold = threshold
+        reference_tokens = [tokenize(p) for p in phrases]
+        self.idf = build_idf(reference_tokens)
+        self.vocabulary: Dict[str, int] = {term: i for i, term in enumerate(sorted(self.idf))}
+        self.phrase_count = len(reference_tokens)
+        rows: List[List[float]] = []
+        for tokens in reference_tokens:
+            vec = tfidf_vector(tokens, self.idf)
+            norm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+            row = [0.0] * len(self.vocabulary)
+            for term, weight in vec.items():
+                row[self.vocabulary[term]] = weight / norm
+            rows.append(row)
+        self._postings: Dict[int, List[tuple]] = {}
+        for phrase_index, row in enumerate(rows):
+            for term_index, weight in enumerate(row):
+                if weight:
+                    self._postings.setdefault(term_index, []).append((phrase_index, weight))
+        self._matrix = np.asarray(rows, dtype=np.float64) if use_numpy else None
+
+    @property
+    def backend(self) -> str:
+        return "numpy" if self._matrix is not None else "python"
+
+    def _query(self, text: str):
+        """Return (term indices, weights) of the normalized query restricted to the vocabulary."""
+        term_freq = Counter(tokenize(text or ""))
+        if not term_freq:
+            return [], []
+        total = sum(term_freq.values())
+        norm_sq = 0.0
+        indices: List[int] = []
+        weights: List[float] = []
+        for term, count in term_freq.items():
+            weight = (count / total) * self.idf.get(term, 1.0)
+            norm_sq += weight * weight
+            index = self.vocabulary.get(term)
+            if index is not None:
+                indices.append(index)
+                weights.append(weight)
+        norm = math.sqrt(norm_sq)
+        return indices, [w / norm for w in weights]
+
+    def score(self, text: str) -> float:
+        """Highest cosine similarity between ``text`` and any reference phrase."""
+        indices, weights = self._query(text)
+        if not indices:
+            return 0.0
+        scores = [0.0] * self.phrase_count
+        for index, weight in zip(indices, weights):
+            for phrase_index, ref_weight in self._postings.get(index, ()):
+                scores[phrase_index] += weight * ref_weight
+        return max(scores)
+
+    def score_batch(self, texts: Sequence[str]) -> List[float]:
+        """Scores for many texts; with NumPy this is a single (texts x vocab) @ (vocab x phrases) product."""
+        if self._matrix is None:
+            return [self.score(text) for text in texts]
+        if not len(texts):
+            return []
+        queries = np.zeros((len(texts), len(self.vocabulary)))
+        for row, text in enumerate(texts):
+            indices, weights = self._query(text)
+            if indices:
+                queries[row, indices] = weights
+        return [max(0.0, float(s)) for s in (queries @ self._matrix.T).max(axis=1)]
+
+    def detect(self, text: str) -> bool:
+        if not text or not text.strip():
+            return False
+        return self.score(text) >= self.threshold
+
+    def detect_batch(self, texts: Sequence[str]) -> List[bool]:
+        return [bool(text and text.strip()) and s >= self.threshold for text, s in zip(texts, self.score_batch(texts))]
+
+
+default_detector = CompletionDetector()
+
+
+def detect_completion_batch(texts: Sequence[str]) -> List[bool]:
+    """Flag which texts read as "I have enough information" closings (e.g. over logged transcripts)."""
+    return default_detector.detect_batch(texts)
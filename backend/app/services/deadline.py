@@ -0,0 +1,73 @@
+import time
+from typing import Any, Dict, Optional
+
+try:
+    from app.core.config import settings
+except ImportError:
+    from backend.app.core.config import settings
+
+
+class DeadlineExceeded(RuntimeError):
+    """The request's time budget ran out before the model produced an answer."""
+
+
+class Deadline:
+    """Time budget for one API request, shared by every model call and retry made for it.
+
+    ``timeout(cap)`` gives the per-attempt timeout: ``cap`` cut down to what is left of the
+    budget. Times are ``time.monotonic()`` seconds.
+    """
+
+    __slots__ = ("budget", "started", "expires_at")
+
+    def __init__(self, budget_seconds: float) -> None:
+        if budget_seconds <= 0:
+            raise ValueError("request timeout must be positive")
+        self.budget = float(budget_seconds)
+        self.started = time.monotonic()
+        self.expires_at = self.started + self.budget
+
+    @classmethod
+    def from_header(cls, value: Optional[str], default: float, maximum: float) -> "Deadline":
+        """Build from an ``X-Request-Timeout`` header (seconds), falling back to ``default``.
+
+        Values above ``maximum`` are clamped; malformed or non-positive values raise ValueError.
+        """
+        if value is None or not str(value).strip():
+            return cls(min(default, maximum))
+        try:
+            seconds = float(value)
+        except ValueError:
+            raise ValueError(f"X-Request-Timeout must be a number of seconds, not {value!r}")
+        if not seconds > 0:
+            raise ValueError("X-Request-Timeout must be positive")
+        return cls(min(seconds, maximum))
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def check(self, what: str = "the model call") -> None:
+        if self.remaining() <= 0:
+            raise DeadlineExceeded(f"request time budget of {self.budget:g}s exhausted before {what}")
+
+    def timeout(self, cap: float) -> float:
+        """Per-attempt timeout: ``cap`` or the remaining budget, whichever is smaller."""
+        self.check()
+        return min(cap, self.remaining())
+
+    def report(self) -> Dict[str, Any]:
+        used = time.monotonic() - self.started
+        return {
+            "budget_seconds": round(self.budget, 3),
+            "used_seconds": round(used, 3),
+            "remaining_seconds": round(max(0.0, self.budget - used), 3),
+        }
+
+
+def request_deadline(header_value: Optional[str]) -> Deadline:
+    """Deadline for an API request: its ``X-Request-Timeout`` header or the configured default."""
+    return Deadline.from_header(
+        header_value,
+        default=getattr(settings, "AGENT_REQUEST_TIMEOUT_SECONDS", 90.0),
+        maximum=getattr(settings, "AGENT_REQUEST_TIMEOUT_MAX_SECONDS", 300.0),
+    )
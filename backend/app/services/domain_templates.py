@@ -0,0 +1,285 @@
+import copy
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    from app.services.completion_detector import build_idf, cosine_similarity, tfidf_vector, tokenize
+except ImportError:
+    from backend.app.services.completion_detector import build_idf, cosine_similarity, tfidf_vector, tokenize
+
+# Minimum cosine similarity to the best domain, and lead over the runner-up domain, for a match.
+# Similarity alone is weak evidence (a law firm's "cases and clients" scores 0.43 for trading),
+# so a match also needs the domain's ``evidence`` keywords; see DomainTemplateMatcher.
+DOMAIN_MATCH_THRESHOLD = 0.4
+DOMAIN_MATCH_MARGIN = 0.2
+
+
+def _id() -> Dict[str, Any]:
+    return {"name": "id", "type": "uuid", "required": True, "primary_key": True}
+
+
+def _field(name: str, type_: str, required: bool = True, **extra: Any) -> Dict[str, Any]:
+    return {"name": name, "type": type_, "required": required, **extra}
+
+
+def _fk(name: str, table: str, required: bool = True) -> Dict[str, Any]:
+    return {"name": name, "type": "uuid", "required": required, "foreign_key": {"table": table, "field": "id"}}
+
+
+def _created() -> Dict[str, Any]:
+    return {"name": "created_at", "type": "timestamp", "required": True, "default": "now()"}
+
+
+def _entity(name: str, *fields: Dict[str, Any]) -> Dict[str, Any]:
+    return {"name": name, "fields": [_id(), *fields, _created()]}
+
+
+# The canonical domains named in the system prompt. ``phrases`` are what people say when
+# describing such a business; ``evidence`` lists keyword groups a description must hit (one
+# word from every group) before the template is used; ``entities`` is a complete starting
+# schema the model then refines.
+DOMAIN_TEMPLATES: Dict[str, Dict[str, Any]] = {
+    "healthcare": {
+        "app_type": "Healthcare Clinic Management",
+        "phrases": [
+            "medical clinic patients doctors appointments",
+            "hospital patient records prescriptions",
+            "healthcare practice physicians nurses",
+            "dental clinic patient appointments treatments",
+            "telehealth doctors patients visits",
+        ],
+        "evidence": (
+            ("patient", "patients", "doctor", "doctors", "nurses", "physicians", "dentist", "dentists"),
+            ("clinic", "clinics", "hospital", "medical", "dental", "telehealth", "healthcare", "appointments"),
+        ),
+        "follow_up": (
+            "I've drafted a healthcare schema with patients, doctors, appointments, medical records "
+            "and prescriptions. Do you also need billing and insurance claims, or multiple clinic locations?"
+        ),
+        "entities": [
+            _entity("patients", _field("first_name", "string"), _field("last_name", "string"),
+                    _field("date_of_birth", "date"), _field("email", "string", False, unique=True),
+                    _field("phone", "string", False)),
+            _entity("doctors", _field("first_name", "string"), _field("last_name", "string"),
+                    _field("specialty", "string"), _field("license_number", "string", unique=True)),
+            _entity("appointments", _fk("patient_id", "patients"), _fk("doctor_id", "doctors"),
+                    _field("scheduled_at", "timestamp"), _field("status", "string", default="scheduled"),
+                    _field("reason", "text", False)),
+            _entity("medical_records", _fk("patient_id", "patients"), _fk("doctor_id", "doctors"),
+                    _fk("appointment_id", "appointments", False), _field("diagnosis", "text"),
+                    _field("notes", "text", False)),
+            _entity("prescriptions", _fk("medical_record_id", "medical_records"), _field("medication", "string"),
+                    _field("dosage", "string"), _field("refills", "integer", default=0)),
+        ],
+    },
+    "e-commerce": {
+        "app_type": "E-commerce Platform",
+        "phrases": [
+            "online store selling products",
+            "e-commerce shop customers orders checkout",
+            "ecommerce website cart payments shipping",
+            "sell products online marketplace",
+            "retail shop inventory orders",
+        ],
+        "evidence": (
+            ("store", "shop", "ecommerce", "commerce", "webshop", "retail"),
+            ("sell", "sells", "selling", "products", "orders", "checkout", "cart"),
+        ),
+        "follow_up": (
+            "I've drafted an e-commerce schema with products, categories, customers, orders, order items "
+            "and payments. Do you need product variants (sizes, colours), discount codes, or multiple sellers?"
+        ),
+        "entities": [
+            _entity("categories", _field("name", "string", unique=True), _fk("parent_id", "categories", False)),
+            _entity("products", _fk("category_id", "categories", False), _field("name", "string"),
+                    _field("description", "text", False), _field("price", "decimal", precision=10, scale=2, min_value=0),
+                    _field("inventory_count", "integer", default=0, min_value=0), _field("sku", "string", unique=True)),
+            _entity("customers", _field("name", "string"), _field("email", "string", unique=True),
+                    _field("phone", "string", False), _field("shipping_address", "text", False)),
+            _entity("orders", _fk("customer_id", "customers"), _field("status", "string", default="pending"),
+                    _field("total", "decimal", precision=10, scale=2, min_value=0)),
+            _entity("order_items", _fk("order_id", "orders"), _fk("product_id", "products"),
+                    _field("quantity", "integer", min_value=1), _field("unit_price", "decimal", precision=10, scale=2)),
+            _entity("payments", _fk("order_id", "orders"), _field("amount", "decimal", precision=10, scale=2),
+                    _field("payment_method", "string"), _field("status", "string", default="pending")),
+        ],
+    },
+    "real-estate": {
+        "app_type": "Real Estate Listings",
+        "phrases": [
+            "real estate property listings",
+            "rental properties apartments houses tenants",
+            "realtor agents homes for sale",
+            "property management rentals listings search",
+            "buy rent houses apartments",
+        ],
+        "evidence": (
+            ("estate", "rental", "rentals", "rent", "realtor", "realtors", "property", "properties", "listings"),
+            ("apartments", "apartment", "houses", "homes", "condos", "property", "properties", "tenants"),
+        ),
+        "follow_up": (
+            "I've drafted a real estate schema with users, agents, properties, favorites and property views. "
+            "Are these sales, rentals or both, and do you need viewing appointments or offers?"
+        ),
+        "entities": [
+            _entity("users", _field("name", "string"), _field("email", "string", unique=True),
+                    _field("phone", "string", False)),
+            _entity("agents", _fk("user_id", "users"), _field("license_number", "string", unique=True),
+                    _field("agency", "string", False)),
+            _entity("properties", _fk("agent_id", "agents", False), _field("title", "string"),
+                    _field("address", "string"), _field("city", "string"),
+                    _field("price", "decimal", precision=12, scale=2, min_value=0),
+                    _field("bedrooms", "integer", False), _field("bathrooms", "integer", False),
+                    _field("listing_type", "string", default="sale"), _field("status", "string", default="active")),
+            _entity("favorites", _fk("user_id", "users"), _fk("property_id", "properties")),
+            _entity("property_views", _fk("property_id", "properties"), _fk("user_id", "users", False),
+                    _field("viewed_at", "timestamp")),
+        ],
+    },
+    "stock-trading": {
+        "app_type": "Stock Trading Platform",
+        "phrases": [
+            "stock trading platform buy sell shares",
+            "brokerage investors portfolios trades",
+            "trading app stocks watchlist",
+            "investment portfolio tracking equities",
+            "crypto stock exchange orders trades",
+        ],
+        "evidence": (
+            ("stock", "stocks", "shares", "equities", "crypto", "securities"),
+            ("trading", "trade", "trades", "brokerage", "portfolio", "portfolios", "investing", "investors"),
+        ),
+        "follow_up": (
+            "I've drafted a trading schema with users, stocks, portfolios, transactions and watchlists. "
+            "Do you need limit orders and order books, or only executed trades and holdings?"
+        ),
+        "entities": [
+            _entity("users", _field("name", "string"), _field("email", "string", unique=True),
+                    _field("cash_balance", "decimal", precision=14, scale=2, default=0)),
+            _entity("stocks", _field("symbol", "string", unique=True), _field("name", "string"),
+                    _field("exchange", "string"), _field("last_price", "decimal", False, precision=14, scale=4)),
+            _entity("portfolios", _fk("user_id", "users"), _fk("stock_id", "stocks"),
+                    _field("quantity", "decimal", precision=18, scale=6), _field("average_cost", "decimal", precision=14, scale=4)),
+            _entity("transactions", _fk("user_id", "users"), _fk("stock_id", "stocks"), _field("side", "string"),
+                    _field("quantity", "decimal", precision=18, scale=6, min_value=0),
+                    _field("price", "decimal", precision=14, scale=4), _field("executed_at", "timestamp")),
+            _entity("watchlists", _fk("user_id", "users"), _fk("stock_id", "stocks")),
+        ],
+    },
+    "education": {
+        "app_type": "Learning Management System",
+        "phrases": [
+            "school students courses teachers",
+            "online learning platform courses lessons",
+            "university enrollments classes grades",
+            "education students assignments grades",
+            "tutoring courses instructors students",
+        ],
+        "evidence": (
+            ("students", "student", "teachers", "instructors", "pupils", "learners"),
+            ("courses", "course", "classes", "school", "lessons", "university", "tutoring", "learning"),
+        ),
+        "follow_up": (
+            "I've drafted an education schema with students, instructors, courses, enrollments, assignments "
+            "and grades. Do you need course content such as lessons and quizzes, or attendance tracking?"
+        ),
+        "entities": [
+            _entity("students", _field("name", "string"), _field("email", "string", unique=True)),
+            _entity("instructors", _field("name", "string"), _field("email", "string", unique=True)),
+            _entity("courses", _fk("instructor_id", "instructors"), _field("title", "string"),
+                    _field("description", "text", False), _field("starts_on", "date", False)),
+            _entity("enrollments", _fk("student_id", "students"), _fk("course_id", "courses"),
+                    _field("status", "string", default="active")),
+            _entity("assignments", _fk("course_id", "courses"), _field("title", "string"),
+                    _field("due_at", "timestamp", False), _field("max_points", "integer", default=100)),
+            _entity("grades", _fk("assignment_id", "assignments"), _fk("student_id", "students"),
+                    _field("points", "decimal", precision=6, scale=2, min_value=0), _field("feedback", "text", False)),
+        ],
+    },
+    "social": {
+        "app_type": "Social Network",
+        "phrases": [
+            "social network users posts followers",
+            "social media app posts comments likes",
+            "community platform users share posts",
+            "follow friends feed photos",
+            "forum users threads comments",
+        ],
+        "evidence": (
+            ("social", "community", "forum", "network"),
+            ("posts", "post", "followers", "follow", "likes", "comments", "feed", "friends", "photos"),
+        ),
+        "follow_up": (
+            "I've drafted a social schema with users, posts, comments, likes and follows. "
+            "Do you need direct messages, media attachments, or groups?"
+        ),
+        "entities": [
+            _entity("users", _field("username", "string", unique=True), _field("email", "string", unique=True),
+                    _field("display_name", "string", False), _field("bio", "text", False)),
+            _entity("posts", _fk("user_id", "users"), _field("body", "text"), _field("visibility", "string", default="public")),
+            _entity("comments", _fk("post_id", "posts"), _fk("user_id", "users"), _field("body", "text")),
+            _entity("likes", _fk("post_id", "posts"), _fk("user_id", "users")),
+            _entity("follows", _fk("follower_id", "users"), _fk("followee_id", "users")),
+        ],
+    },
+}
+
+
+class DomainTemplateMatcher:
+    """Matches a business description to a DOMAIN_TEMPLATES entry with TF-IDF cosine similarity.
+
+    Phrase vectors are built once. A description's score for a domain is its best similarity
+    to any of that domain's phrases; a match needs ``threshold``, a ``margin`` lead over the
+    next domain so ambiguous descriptions ("a marketplace for tutoring") go to the model, and a
+    word from each of the domain's ``evidence`` groups ("a school for dogs" is not education).
+    """
+
+    def __init__(
+        self,
+        templates: Dict[str, Dict[str, Any]] = DOMAIN_TEMPLATES,
+        threshold: float = DOMAIN_MATCH_THRESHOLD,
+        margin: float = DOMAIN_MATCH_MARGIN,
+    ) -> None:
+        self.templates = templates
+        self.threshold = threshold
+        self.margin = margin
+        phrase_tokens = [(domain, tokenize(p)) for domain, t in templates.items() for p in t["phrases"]]
+        self.idf = build_idf([tokens for _, tokens in phrase_tokens])
+        self._vectors: List[Tuple[str, Dict[str, float]]] = [
+            (domain, tfidf_vector(tokens, self.idf)) for domain, tokens in phrase_tokens
+        ]
+
+    def scores(self, text: str) -> Dict[str, float]:
+        return self._scores(tokenize(text or ""))
+
+    def _scores(self, tokens: List[str]) -> Dict[str, float]:
+        query = tfidf_vector(tokens, self.idf)
+        best: Dict[str, float] = {domain: 0.0 for domain in self.templates}
+        if query:
+            for domain, vec in self._vectors:
+                best[domain] = max(best[domain], cosine_similarity(query, vec))
+        return best
+
+    def match(self, text: str) -> Optional[Tuple[str, float]]:
+        """Return ``(domain, score)`` for a confident match, else None."""
+        tokens = tokenize(text or "")
+        ranked = sorted(self._scores(tokens).items(), key=lambda item: item[1], reverse=True)
+        if not ranked:
+            return None
+        domain, score = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+        if score < self.threshold or score - runner_up < self.margin:
+            return None
+        words = set(tokens)
+        if not all(words.intersection(group) for group in self.templates[domain].get("evidence", ())):
+            return None
+        return domain, score
+
+    def template_spec(self, domain: str) -> Dict[str, Any]:
+        """A fresh, complete partial_spec for ``domain`` (safe to mutate)."""
+        template = self.templates[domain]
+        return {
+            "app_type": template["app_type"],
+            "db_type": "postgresql",
+            "entities": copy.deepcopy(template["entities"]),
+        }
+
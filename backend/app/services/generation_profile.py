@@ -0,0 +1,62 @@
+import json
+from typing import Any, Dict, List, Optional
+
+try:
+    from app.services.completion_detector import USER_COMPLETION_PHRASES, CompletionDetector, default_detector
+except ImportError:
+    from backend.app.services.completion_detector import USER_COMPLETION_PHRASES, CompletionDetector, default_detector
+
+# Clarifying-question turns: the reply is mostly a short question plus a small spec delta
+PHASE_QUESTION = "question"
+# Turns expected to emit the whole spec (completion, and edits after completion)
+PHASE_SPEC = "spec"
+
+user_completion_detector = CompletionDetector(USER_COMPLETION_PHRASES)
+
+
+class GenerationProfile:
+    """Model, output budget and timeout used for one phase of the conversation.
+
+    ``model`` None means the router's preferred model (ANTHROPIC_MODEL unless swapped).
+    """
+
+    __slots__ = ("phase", "model", "max_tokens", "timeout")
+
+    def __init__(self, phase: str, model: Optional[str] = None, max_tokens: int = 4000, timeout: float = 30.0) -> None:
+        self.phase = phase
+        self.model = model or None
+        self.max_tokens = max_tokens
+        self.timeout = timeout
+
+    def describe(self) -> Dict[str, Any]:
+        return {"model": self.model, "max_tokens": self.max_tokens, "timeout_seconds": self.timeout}
+
+
+def select_phase(history: List[Dict[str, str]], answer: str, done: bool = False, spec_after_turns: int = 2) -> str:
+    """Pick the phase of the turn answering ``history`` with ``answer``.
+
+    A turn is a spec turn once the conversation is done (edits re-emit the spec), from the
+    ``spec_after_turns``-th user answer on, when the user says they have nothing to add, or when
+    the previous assistant message already read as a completion ("I have enough information...").
+    Everything else is a questioning turn.
+    """
+    if done:
+        return PHASE_SPEC
+    user_turns = 1 + sum(1 for message in history if message.get("role") == "user")
+    if spec_after_turns and user_turns >= spec_after_turns:
+        return PHASE_SPEC
+    if user_completion_detector.detect(answer):
+        return PHASE_SPEC
+    last_question = next((m.get("content", "") for m in reversed(history) if m.get("role") == "assistant"), "")
+    if last_question and default_detector.detect(_question_text(last_question)):
+        return PHASE_SPEC
+    return PHASE_QUESTION
+
+
+def _question_text(content: str) -> str:
+    """Assistant turns are stored as control JSON; only the question counts for detection."""
+    try:
+        control = json.loads(content)
+    except ValueError:
+        return content
+    return str(control.get("next_question") or "") if isinstance(control, dict) else content
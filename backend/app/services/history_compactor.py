@@ -0,0 +1,120 @@
+import json
+from typing import Any, Dict, List, Optional
+
+# Rough chars-per-token ratio for English prose and JSON; good enough for budgeting and reporting
+_CHARS_PER_TOKEN = 4
+_SUMMARY_SNIPPET_CHARS = 240
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate used for history budgeting and savings reports."""
+    if not text:
+        return 0
+    return max(1, len(text) // _CHARS_PER_TOKEN)
+
+
+def _content_text(content: Any) -> str:
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(block.get("text", "") for block in content if isinstance(block, dict))
+    return str(content or "")
+
+
+def _messages_tokens(messages: List[Dict[str, Any]]) -> int:
+    return sum(estimate_tokens(_content_text(m.get("content"))) for m in messages)
+
+
+def _question_only(content: str) -> str:
+    """Reduce a stored assistant control object to the question the user actually saw."""
+    stripped = content.strip()
+    if not stripped.startswith("{"):
+        return content
+    try:
+        control = json.loads(stripped)
+    except (TypeError, ValueError):
+        return content
+    if isinstance(control, dict) and "next_question" in control:
+        return str(control.get("next_question") or "")
+    return content
+
+
+def _snippet(text: str) -> str:
+    text = " ".join(text.split())
+    if len(text) <= _SUMMARY_SNIPPET_CHARS:
+        return text
+    return text[: _SUMMARY_SNIPPET_CHARS - 3] + "..."
+
+
+class CompactionResult:
+    """Compacted Anthropic messages plus estimated token counts before and after compaction."""
+
+    __slots__ = ("messages", "raw_tokens", "compacted_tokens", "summarized_messages")
+
+    def __init__(self, messages: List[Dict[str, Any]], raw_tokens: int, compacted_tokens: int, summarized_messages: int) -> None:
+        self.messages = messages
+        self.raw_tokens = raw_tokens
+        self.compacted_tokens = compacted_tokens
+        self.summarized_messages = summarized_messages
+
+    @property
+    def saved_tokens(self) -> int:
+        return max(0, self.raw_tokens - self.compacted_tokens)
+
+
+def compact_history(
+    history: List[Dict[str, str]],
+    last_user: Optional[str] = None,
+    spec: Optional[Dict[str, Any]] = None,
+    token_budget: Optional[int] = None,
+    keep_recent: int = 6,
+) -> CompactionResult:
+    """Build the message list for a turn without resending every earlier spec snapshot.
+
+    - Assistant turns are stored as full control objects (including ``partial_spec``); they
+      are replaced by their ``next_question`` text.
+    - The latest spec is sent exactly once, as a context block on the newest user turn.
+    - A trailing user message identical to ``last_user`` is not repeated.
+    - If the result still exceeds ``token_budget``, older messages are folded into a single
+      summary message, leaving at least the ``keep_recent`` newest. The cut advances in whole
+      chunks of ``keep_recent`` messages, so the summary (the start of the prompt-cache
+      prefix) stays byte-identical across the turns in between instead of changing every turn.
+    """
+    raw: List[Dict[str, Any]] = []
+    compacted: List[Dict[str, Any]] = []
+    for m in history:
+        role = m.get("role")
+        if role not in ("user", "assistant"):
+            continue
+        content = m.get("content", "")
+        raw.append({"role": role, "content": content})
+        compacted.append({"role": role, "content": _question_only(content) if role == "assistant" else content})
+    if last_user is not None:
+        raw.append({"role": "user", "content": last_user})
+        if compacted and compacted[-1]["role"] == "user" and compacted[-1]["content"] == last_user:
+            compacted.pop()
+        final_user = last_user
+        if spec:
+            spec_json = json.dumps(spec, separators=(",", ":"))
+            final_user = (
+                "CURRENT partial_spec (latest version, supersedes anything earlier in this conversation):\n"
+                f"{spec_json}\n\nUser answer:\n{last_user}"
+            )
+        compacted.append({"role": "user", "content": final_user})
+
+    summarized = 0
+    if token_budget is not None and len(compacted) > keep_recent + 1 and _messages_tokens(compacted) > token_budget:
+        step = max(keep_recent, 1)
+        cut = (len(compacted) - step) // step * step
+    else:
+        cut = 0
+    if cut:
+        older, recent = compacted[:cut], compacted[cut:]
+        lines = ["Summary of the earlier conversation (older turns condensed):"]
+        for m in older:
+            speaker = "Assistant asked" if m["role"] == "assistant" else "User said"
+            lines.append(f"- {speaker}: {_snippet(_content_text(m['content']))}")
+        compacted = [{"role": "user", "content": "\n".join(lines)}] + recent
+        summarized = len(older)
+
+    return CompactionResult(compacted, _messages_tokens(raw), _messages_tokens(compacted), summarized)
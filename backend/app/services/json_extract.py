@@ -0,0 +1,89 @@
+import json
+import re
+from typing import Any, Dict, Optional, Tuple
+
+# strict=False accepts raw newlines/tabs inside strings (a common model mistake) and decodes
+# them exactly as if they had been escaped; raw_decode tolerates trailing commentary.
+_DECODER = json.JSONDecoder(strict=False)
+
+# Outside strings only braces, brackets and quotes matter; inside strings only quotes and
+# backslashes do. Jumping between them with compiled regexes keeps the skip scan linear
+# while the per-character work stays in C.
+_STRUCTURE_RE = re.compile(r'[{}\[\]"]')
+_STRING_RE = re.compile(r'["\\]')
+
+STRATEGY_DIRECT = "direct"
+STRATEGY_EXTRACTED = "extracted"
+STRATEGY_FAILED = "failed"
+
+
+def _skip_balanced(text: str, start: int) -> int:
+    """Return the index just past the bracket-balanced span opening at ``start``, or -1 if unclosed.
+
+    Braces and brackets inside string literals are ignored.
+    """
+    depth = 0
+    i = start
+    while True:
+        m = _STRUCTURE_RE.search(text, i)
+        if m is None:
+            return -1
+        ch, j = m.group(), m.start()
+        if ch == '"':
+            k = j + 1
+            while True:
+                s = _STRING_RE.search(text, k)
+                if s is None:
+                    return -1  # unterminated string: the object is truncated
+                if s.group() == '"':
+                    k = s.start() + 1
+                    break
+                k = s.start() + 2
+            i = k
+            continue
+        if ch in "{[":
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return j + 1
+        i = j + 1
+
+
+def scan_json_object(text: str, required_key: Optional[str] = None) -> Tuple[Optional[Dict[str, Any]], str]:
+    """Find and parse the outermost JSON object in model output in one forward pass.
+
+    Text outside the object (markdown fences, greetings, trailing commentary) is skipped and
+    raw control characters inside strings are accepted. Each candidate ``{`` is decoded at C
+    speed; if that fails, or the object lacks ``required_key``, the candidate's balanced span
+    is skipped (ignoring braces inside strings) and scanning resumes after it, so no part of
+    the text is re-parsed by a different strategy.
+
+    Returns the object and how it was obtained: ``direct`` (the text was just the object),
+    ``extracted`` (surrounding text was skipped) or ``failed``.
+    """
+    if not text:
+        return None, STRATEGY_FAILED
+    pos = 0
+    while True:
+        start = text.find("{", pos)
+        if start == -1:
+            return None, STRATEGY_FAILED
+        try:
+            obj, end = _DECODER.raw_decode(text, start)
+        except ValueError:
+            obj, end = None, -1
+        if isinstance(obj, dict) and (required_key is None or required_key in obj):
+            if not text[:start].strip() and not text[end:].strip():
+                return obj, STRATEGY_DIRECT
+            return obj, STRATEGY_EXTRACTED
+        if end == -1:
+            end = _skip_balanced(text, start)
+            if end == -1:
+                return None, STRATEGY_FAILED
+        pos = end
+
+
+def extract_json_object(text: str, required_key: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Return the outermost JSON object in ``text`` (containing ``required_key`` if given), or None."""
+    return scan_json_object(text, required_key)[0]
@@ -0,0 +1,123 @@
+from typing import Optional
+
+_SIMPLE_ESCAPES = {
+    '"': '"',
+    "\\": "\\",
+    "/": "/",
+    "b": "\b",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+}
+
+
+class StreamingFieldReader:
+    """Incrementally decode one top-level string field from a JSON object as it streams in.
+
+    The model's control object arrives token by token; ``feed`` accepts each raw chunk and
+    returns the newly decoded characters of the target field (``next_question`` by default),
+    so the question can be shown long before the full object, with its potentially large
+    ``partial_spec``, has finished generating. Text before the opening brace (markdown fences,
+    stray prose) is ignored, and raw newlines inside strings are tolerated.
+    """
+
+    def __init__(self, field: str = "next_question") -> None:
+        self.field = field
+        self.complete = False
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._unicode: Optional[str] = None
+        self._high_surrogate: Optional[int] = None
+        self._expect_key = False
+        self._capturing_key = False
+        self._key_chars: list = []
+        self._last_key: Optional[str] = None
+        self._capturing_value = False
+        self._value_chars: list = []
+
+    @property
+    def value(self) -> str:
+        """The portion of the field decoded so far."""
+        return "".join(self._value_chars)
+
+    def feed(self, chunk: str) -> str:
+        """Consume a raw chunk of model output and return newly decoded field characters."""
+        out: list = []
+        for ch in chunk:
+            if not self._started:
+                if ch == "{":
+                    self._started = True
+                    self._depth = 1
+                    self._expect_key = True
+                continue
+            if self._in_string:
+                self._consume_string_char(ch, out)
+                continue
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1 and self._expect_key:
+                    self._capturing_key = True
+                    self._key_chars = []
+                elif self._depth == 1 and self._last_key == self.field and not self.complete:
+                    self._capturing_value = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+            elif ch == "," and self._depth == 1:
+                self._expect_key = True
+                self._last_key = None
+        if out:
+            self._value_chars.extend(out)
+        return "".join(out)
+
+    def _consume_string_char(self, ch: str, out: list) -> None:
+        if self._unicode is not None:
+            self._unicode += ch
+            if len(self._unicode) == 4:
+                self._emit_codepoint(self._unicode, out)
+                self._unicode = None
+            return
+        if self._escape:
+            self._escape = False
+            if ch == "u":
+                self._unicode = ""
+            else:
+                self._emit(_SIMPLE_ESCAPES.get(ch, ch), out)
+            return
+        if ch == "\\":
+            self._escape = True
+            return
+        if ch == '"':
+            self._in_string = False
+            if self._capturing_key:
+                self._capturing_key = False
+                self._expect_key = False
+                self._last_key = "".join(self._key_chars)
+            elif self._capturing_value:
+                self._capturing_value = False
+                self.complete = True
+            return
+        self._emit(ch, out)
+
+    def _emit_codepoint(self, hex_digits: str, out: list) -> None:
+        try:
+            code = int(hex_digits, 16)
+        except ValueError:
+            return
+        if 0xD800 <= code <= 0xDBFF:
+            self._high_surrogate = code
+            return
+        if 0xDC00 <= code <= 0xDFFF and self._high_surrogate is not None:
+            code = 0x10000 + ((self._high_surrogate - 0xD800) << 10) + (code - 0xDC00)
+        self._high_surrogate = None
+        self._emit(chr(code), out)
+
+    def _emit(self, text: str, out: list) -> None:
+        if self._capturing_key:
+            self._key_chars.append(text)
+        elif self._capturing_value:
+            out.append(text)
@@ -0,0 +1,162 @@
+import threading
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    from app.services.model_router import LatencyHistogram
+except ImportError:
+    from backend.app.services.model_router import LatencyHistogram
+
+TOKEN_KINDS = ("input_tokens", "output_tokens", "cache_read_input_tokens", "cache_creation_input_tokens")
+
+
+class CallRecord:
+    """One model call attempt: what it was for, how long it took and what it cost."""
+
+    __slots__ = ("phase", "model", "attempt", "wall_seconds", "tokens", "parse_strategy", "ok", "session_id")
+
+    def __init__(
+        self,
+        phase: str,
+        model: str,
+        attempt: int,
+        wall_seconds: float,
+        tokens: Optional[Dict[str, int]] = None,
+        parse_strategy: str = "none",
+        ok: bool = True,
+        session_id: Optional[str] = None,
+    ) -> None:
+        self.phase = phase
+        self.model = model
+        self.attempt = attempt
+        self.wall_seconds = wall_seconds
+        self.tokens = tokens or {}
+        self.parse_strategy = parse_strategy
+        self.ok = ok
+        self.session_id = session_id
+
+
+class _Aggregate:
+    __slots__ = ("calls", "failures", "retries", "wall_seconds", "tokens", "strategies")
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.failures = 0
+        self.retries = 0
+        self.wall_seconds = 0.0
+        self.tokens: Counter = Counter()
+        self.strategies: Counter = Counter()
+
+    def add(self, record: CallRecord) -> None:
+        self.calls += 1
+        self.failures += 0 if record.ok else 1
+        self.retries += 1 if record.attempt > 1 else 0
+        self.wall_seconds += record.wall_seconds
+        self.tokens.update(record.tokens)
+        self.strategies[record.parse_strategy] += 1
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "retries": self.retries,
+            "wall_seconds": round(self.wall_seconds, 3),
+            **{kind: self.tokens[kind] for kind in TOKEN_KINDS},
+            "parse_strategies": dict(self.strategies),
+        }
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels: str) -> str:
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+class LLMMetrics:
+    """Per-call model usage/latency accounting, aggregated globally and per chat session.
+
+    Global series are keyed by ``(phase, model)``; per-session summaries are kept for the
+    ``max_sessions`` most recently active sessions. ``prometheus()`` renders everything in the
+    Prometheus text exposition format for a ``/metrics`` scrape.
+    """
+
+    def __init__(self, max_sessions: int = 10000) -> None:
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, str], _Aggregate] = {}
+        self._durations: Dict[Tuple[str, str], LatencyHistogram] = {}
+        self._sessions: "OrderedDict[str, _Aggregate]" = OrderedDict()
+
+    def record(self, record: CallRecord) -> None:
+        key = (record.phase, record.model)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Aggregate()
+                self._durations[key] = LatencyHistogram()
+            series.add(record)
+            self._durations[key].observe(record.wall_seconds)
+            if record.session_id:
+                session = self._sessions.get(record.session_id)
+                if session is None:
+                    session = self._sessions[record.session_id] = _Aggregate()
+                self._sessions.move_to_end(record.session_id)
+                session.add(record)
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+
+    def session_summary(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return session.summary() if session is not None else None
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Global totals plus a breakdown by phase and model."""
+        with self._lock:
+            total = _Aggregate()
+            by_series = []
+            for (phase, model), series in sorted(self._series.items()):
+                by_series.append({"phase": phase, "model": model, **series.summary()})
+                total.calls += series.calls
+                total.failures += series.failures
+                total.retries += series.retries
+                total.wall_seconds += series.wall_seconds
+                total.tokens.update(series.tokens)
+                total.strategies.update(series.strategies)
+            return {"total": total.summary(), "by_phase_model": by_series, "tracked_sessions": len(self._sessions)}
+
+    def prometheus(self, prefix: str = "shipdb_llm") -> str:
+        with self._lock:
+            items = sorted(self._series.items())
+            durations = {key: hist.snapshot() for key, hist in self._durations.items()}
+        lines: List[str] = []
+
+        def header(name: str, kind: str, help_text: str) -> None:
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+
+        header("calls_total", "counter", "Model call attempts by phase, model and outcome.")
+        for (phase, model), s in items:
+            lines.append(f"{prefix}_calls_total{_labels(phase=phase, model=model, outcome='ok')} {s.calls - s.failures}")
+            lines.append(f"{prefix}_calls_total{_labels(phase=phase, model=model, outcome='error')} {s.failures}")
+        header("retries_total", "counter", "Model call attempts after the first within one request.")
+        for (phase, model), s in items:
+            lines.append(f"{prefix}_retries_total{_labels(phase=phase, model=model)} {s.retries}")
+        header("tokens_total", "counter", "Tokens reported in resp.usage, by kind.")
+        for (phase, model), s in items:
+            for kind in TOKEN_KINDS:
+                lines.append(f"{prefix}_tokens_total{_labels(phase=phase, model=model, kind=kind)} {s.tokens[kind]}")
+        header("parse_total", "counter", "How each model reply was decoded (tool, direct, extracted, failed, none).")
+        for (phase, model), s in items:
+            for strategy, n in sorted(s.strategies.items()):
+                lines.append(f"{prefix}_parse_total{_labels(phase=phase, model=model, strategy=strategy)} {n}")
+        header("call_duration_seconds", "histogram", "Wall time of model call attempts.")
+        for (phase, model), _ in items:
+            snap = durations[(phase, model)]
+            for bound, count in snap["buckets"].items():
+                lines.append(f"{prefix}_call_duration_seconds_bucket{_labels(phase=phase, model=model, le=bound)} {count}")
+            lines.append(f"{prefix}_call_duration_seconds_sum{_labels(phase=phase, model=model)} {snap['sum_seconds']}")
+            lines.append(f"{prefix}_call_duration_seconds_count{_labels(phase=phase, model=model)} {snap['count']}")
+        return "\n".join(lines) + "\n"
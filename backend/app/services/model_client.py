@@ -0,0 +1,271 @@
+import asyncio
+import json
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Protocol, Union
+
+# Bound at import so harnesses that patch asyncio.sleep to count retry backoff do not also
+# intercept the simulated model latency.
+_sleep = asyncio.sleep
+
+CASSETTE_VERSION = 1
+
+
+class MessagesAPI(Protocol):
+    async def create(self, **kwargs: Any) -> Any: ...
+
+
+class ModelClient(Protocol):
+    """What AIAgentService needs from a model client: ``AsyncAnthropic``'s ``messages.create``.
+
+    ``messages.stream`` is optional; clients without it make streaming turns fall back to
+    ``create``.
+    """
+
+    messages: MessagesAPI
+
+
+def build_message(recorded: Dict[str, Any]) -> SimpleNamespace:
+    """Build an object shaped like an Anthropic ``Message`` from a recorded response dict.
+
+    A recorded response has either ``text`` (a plain text reply) or ``tool_input`` (plus an
+    optional ``tool_name``) for a forced tool call, and may carry ``usage`` token counts and a
+    ``stop_reason``.
+    """
+    content = []
+    if recorded.get("text") is not None:
+        content.append(SimpleNamespace(type="text", text=recorded["text"]))
+    if recorded.get("tool_input") is not None:
+        content.append(SimpleNamespace(
+            type="tool_use",
+            id=recorded.get("tool_use_id", "toolu_recorded"),
+            name=recorded.get("tool_name", ""),
+            input=recorded["tool_input"],
+        ))
+    usage = recorded.get("usage") or {}
+    return SimpleNamespace(
+        content=content,
+        stop_reason=recorded.get("stop_reason", "tool_use" if recorded.get("tool_input") is not None else "end_turn"),
+        usage=SimpleNamespace(
+            input_tokens=usage.get("input_tokens", 0),
+            output_tokens=usage.get("output_tokens", 0),
+            cache_read_input_tokens=usage.get("cache_read_input_tokens", 0),
+            cache_creation_input_tokens=usage.get("cache_creation_input_tokens", 0),
+        ),
+    )
+
+
+def dump_message(resp: Any) -> Dict[str, Any]:
+    """Inverse of build_message: reduce an Anthropic ``Message`` to a JSON-serializable dict."""
+    recorded: Dict[str, Any] = {"stop_reason": getattr(resp, "stop_reason", None)}
+    texts = []
+    for block in getattr(resp, "content", None) or []:
+        if getattr(block, "type", "text") == "tool_use":
+            recorded["tool_name"] = getattr(block, "name", "")
+            recorded["tool_use_id"] = getattr(block, "id", "toolu_recorded")
+            recorded["tool_input"] = getattr(block, "input", None)
+        elif getattr(block, "text", None) is not None:
+            texts.append(block.text)
+    if texts:
+        recorded["text"] = "".join(texts)
+    usage = getattr(resp, "usage", None)
+    recorded["usage"] = {
+        kind: int(getattr(usage, kind, 0) or 0)
+        for kind in ("input_tokens", "output_tokens", "cache_read_input_tokens", "cache_creation_input_tokens")
+    }
+    return recorded
+
+
+class _RecordedMessages:
+    def __init__(self, owner: "RecordedResponseClient") -> None:
+        self._owner = owner
+
+    async def create(self, **kwargs: Any) -> SimpleNamespace:
+        return await self._owner._next(kwargs)
+
+
+class RecordedResponseClient:
+    """Offline stand-in for ``AsyncAnthropic`` that serves recorded responses in order.
+
+    Each recorded response may specify ``latency_s``; it is slept (scaled by ``time_scale``,
+    so 0 makes replays instant) and always added to ``simulated_latency_s`` so harnesses can
+    report what the recorded run would have cost in wall-clock time. A response with an
+    ``error`` key raises ``RuntimeError`` instead, like a failed API call. ``latency_s``
+    replaces every recorded latency with a fixed one.
+    """
+
+    def __init__(
+        self,
+        responses: List[Dict[str, Any]],
+        time_scale: float = 0.0,
+        latency_s: Optional[float] = None,
+    ) -> None:
+        self._responses = list(responses)
+        self._index = 0
+        self.time_scale = time_scale
+        self.latency_s = latency_s
+        self.calls = 0
+        self.simulated_latency_s = 0.0
+        self.requests: List[Dict[str, Any]] = []
+        self.messages = _RecordedMessages(self)
+
+    async def _next(self, request: Dict[str, Any]) -> SimpleNamespace:
+        if self._index >= len(self._responses):
+            raise RuntimeError("recorded responses exhausted")
+        recorded = self._responses[self._index]
+        self._index += 1
+        self.calls += 1
+        self.requests.append(request)
+        latency = self.latency_s if self.latency_s is not None else float(recorded.get("latency_s", 0.0))
+        self.simulated_latency_s += latency
+        if self.time_scale and latency:
+            await _sleep(latency * self.time_scale)
+        if recorded.get("error"):
+            raise RuntimeError(recorded["error"])
+        return build_message(recorded)
+
+    @classmethod
+    def from_cassette(
+        cls,
+        path: Union[str, Path],
+        time_scale: float = 1.0,
+        latency_s: Optional[float] = None,
+    ) -> "RecordedResponseClient":
+        """Replay a cassette written by RecordingClient, in recorded order."""
+        data = json.loads(Path(path).read_text(encoding="utf-8"))
+        return cls([item["response"] for item in data.get("interactions", [])], time_scale=time_scale, latency_s=latency_s)
+
+    @property
+    def remaining(self) -> int:
+        return len(self._responses) - self._index
+
+    def last_request(self) -> Optional[Dict[str, Any]]:
+        return self.requests[-1] if self.requests else None
+
+
+class ScriptedConversationClient:
+    """Offline stand-in for ``AsyncAnthropic`` that plays a plausible chat for any business.
+
+    Unlike RecordedResponseClient it derives each reply from the request itself, so it can
+    serve many concurrent conversations: it asks ``turns_to_done - 1`` follow-up questions,
+    then finishes with a small spec named after the business description (the first user
+    message). Each call waits ``latency_s`` to mimic model latency.
+    """
+
+    def __init__(self, turns_to_done: int = 3, latency_s: float = 0.0) -> None:
+        self.turns_to_done = max(1, turns_to_done)
+        self.latency_s = latency_s
+        self.calls = 0
+        self.messages = _ScriptedMessages(self)
+
+    async def _reply(self, request: Dict[str, Any]) -> SimpleNamespace:
+        self.calls += 1
+        if self.latency_s:
+            await _sleep(self.latency_s)
+        messages = request.get("messages") or []
+        turn = sum(1 for m in messages if m.get("role") == "assistant")
+        description = _message_text(next((m for m in messages if m.get("role") == "user"), {}))
+        description = description.split("User answer:\n")[-1].strip()
+        app_type = " ".join(description.split()[:4]) or "Business"
+        if turn < self.turns_to_done:
+            control = {
+                "next_question": f"Question {turn + 1}: what else should the {app_type} database track?",
+                "done": False,
+                "partial_spec": {"app_type": app_type},
+            }
+        else:
+            control = {
+                "next_question": "Perfect! I have enough information to create your database design.",
+                "done": True,
+                "partial_spec": {
+                    "app_type": app_type,
+                    "db_type": "postgresql",
+                    "entities": [
+                        {"name": "customers", "fields": [
+                            {"name": "id", "type": "uuid", "primary_key": True},
+                            {"name": "email", "type": "string", "required": True, "unique": True},
+                        ]},
+                        {"name": "orders", "fields": [
+                            {"name": "id", "type": "uuid", "primary_key": True},
+                            {"name": "customer_id", "type": "uuid", "required": True,
+                             "foreign_key": {"table": "customers", "field": "id"}},
+                            {"name": "total", "type": "decimal"},
+                        ]},
+                    ],
+                },
+            }
+        tools = request.get("tools")
+        if tools:
+            return build_message({"tool_name": tools[0]["name"], "tool_input": control, "usage": _SCRIPTED_USAGE})
+        return build_message({"text": json.dumps(control), "usage": _SCRIPTED_USAGE})
+
+
+class _ScriptedMessages:
+    def __init__(self, owner: ScriptedConversationClient) -> None:
+        self._owner = owner
+
+    async def create(self, **kwargs: Any) -> SimpleNamespace:
+        return await self._owner._reply(kwargs)
+
+
+_SCRIPTED_USAGE = {"input_tokens": 900, "output_tokens": 150, "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0}
+
+
+def _message_text(message: Dict[str, Any]) -> str:
+    content = message.get("content", "")
+    if isinstance(content, list):
+        return "".join(block.get("text", "") for block in content if isinstance(block, dict))
+    return str(content or "")
+
+
+class _RecordingMessages:
+    def __init__(self, owner: "RecordingClient") -> None:
+        self._owner = owner
+
+    async def create(self, **kwargs: Any) -> Any:
+        return await self._owner._record(kwargs)
+
+    def stream(self, **kwargs: Any) -> Any:
+        # Streams pass straight through; only create() calls are captured
+        return self._owner.inner.messages.stream(**kwargs)
+
+
+class RecordingClient:
+    """Wraps a live client and saves every ``messages.create`` exchange to a cassette file.
+
+    The cassette is rewritten after each call, so an interrupted session still leaves a usable
+    recording. Failed calls are stored as ``error`` responses, which replay as RuntimeError.
+    Replay it with ``RecordedResponseClient.from_cassette``.
+    """
+
+    def __init__(self, inner: ModelClient, cassette_path: Union[str, Path]) -> None:
+        self.inner = inner
+        self.cassette_path = Path(cassette_path)
+        self.interactions: List[Dict[str, Any]] = []
+        self.messages = _RecordingMessages(self)
+
+    async def _record(self, request: Dict[str, Any]) -> Any:
+        started = time.perf_counter()
+        try:
+            resp = await self.inner.messages.create(**request)
+        except Exception as exc:
+            self._append(request, {"error": f"{type(exc).__name__}: {exc}"}, started)
+            raise
+        self._append(request, dump_message(resp), started)
+        return resp
+
+    def _append(self, request: Dict[str, Any], response: Dict[str, Any], started: float) -> None:
+        response["latency_s"] = round(time.perf_counter() - started, 4)
+        summary = {k: request.get(k) for k in ("model", "max_tokens", "messages") if k in request}
+        if request.get("tool_choice"):
+            summary["tool_choice"] = request["tool_choice"]
+        self.interactions.append({"request": summary, "response": response})
+        self.save()
+
+    def save(self) -> None:
+        self.cassette_path.parent.mkdir(parents=True, exist_ok=True)
+        payload = {"version": CASSETTE_VERSION, "interactions": self.interactions}
+        tmp = self.cassette_path.with_suffix(self.cassette_path.suffix + ".tmp")
+        tmp.write_text(json.dumps(payload, indent=1, default=str), encoding="utf-8")
+        tmp.replace(self.cassette_path)
@@ -0,0 +1,139 @@
+import bisect
+import time
+from collections import Counter, deque
+from typing import Any, Deque, Dict, Optional, Sequence, Tuple
+
+from loguru import logger
+
+# Upper bounds in seconds; chat turns typically land between 1s and 10s
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 30.0, 60.0)
+
+
+class LatencyHistogram:
+    """Cumulative bucketed latency histogram plus a window of recent samples for percentiles.
+
+    Buckets are exported as-is (Prometheus-style ``le`` bounds); percentiles used for hedging
+    are computed from the most recent ``window`` samples so they track current model speed.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS, window: int = 200) -> None:
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.total = 0.0
+        self._recent: Deque[float] = deque(maxlen=window)
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self._recent.append(seconds)
+
+    def percentile(self, q: float, min_samples: int = 1) -> Optional[float]:
+        """Return the ``q`` quantile (0..1) of recent samples, or None with too few samples."""
+        if len(self._recent) < max(1, min_samples):
+            return None
+        ordered = sorted(self._recent)
+        index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+        return ordered[index]
+
+    def snapshot(self) -> Dict[str, Any]:
+        cumulative, running = {}, 0
+        for bound, n in zip(self.buckets, self.counts):
+            running += n
+            cumulative[str(bound)] = running
+        cumulative["+Inf"] = self.count
+        return {
+            "count": self.count,
+            "sum_seconds": round(self.total, 6),
+            "buckets": cumulative,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+        }
+
+
+class ModelRouter:
+    """Chooses the primary/hedge model pair and tracks per-model latency and timeouts.
+
+    - ``hedge_delay`` is the preferred model's recent ``hedge_percentile`` latency (clamped to
+      ``[min_delay, max_delay]``; ``max_delay`` until ``min_samples`` calls have been seen).
+    - After ``swap_after_timeouts`` consecutive timeouts the preferred model is swapped for the
+      other one; the original primary is tried again after ``failback_after`` seconds.
+    """
+
+    def __init__(
+        self,
+        primary: str,
+        fallback: Optional[str] = None,
+        hedge_percentile: float = 0.95,
+        min_delay: float = 2.0,
+        max_delay: float = 10.0,
+        min_samples: int = 20,
+        swap_after_timeouts: int = 2,
+        failback_after: float = 300.0,
+    ) -> None:
+        self.primary = primary
+        self.fallback = fallback if fallback and fallback != primary else None
+        self.hedge_percentile = hedge_percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self.swap_after_timeouts = swap_after_timeouts
+        self.failback_after = failback_after
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self.counters: Counter = Counter()
+        self._preferred = primary
+        self._swapped_at: Optional[float] = None
+        self._timeout_streak: Counter = Counter()
+
+    def histogram(self, model: str) -> LatencyHistogram:
+        hist = self.histograms.get(model)
+        if hist is None:
+            hist = self.histograms[model] = LatencyHistogram()
+        return hist
+
+    def order(self) -> Tuple[str, Optional[str]]:
+        """Return ``(preferred, alternate)``; alternate is None when no fallback is configured."""
+        if self._swapped_at is not None and time.monotonic() - self._swapped_at >= self.failback_after:
+            logger.info(f"Model failback: retrying primary model {self.primary}")
+            self._preferred, self._swapped_at = self.primary, None
+            self._timeout_streak.clear()
+        if self.fallback is None:
+            return self.primary, None
+        alternate = self.fallback if self._preferred == self.primary else self.primary
+        return self._preferred, alternate
+
+    def hedge_delay(self, model: str) -> float:
+        observed = self.histogram(model).percentile(self.hedge_percentile, self.min_samples)
+        if observed is None:
+            return self.max_delay
+        return min(self.max_delay, max(self.min_delay, observed))
+
+    def record_success(self, model: str, seconds: float) -> None:
+        self.histogram(model).observe(seconds)
+        self._timeout_streak[model] = 0
+
+    def record_timeout(self, model: str) -> None:
+        self.counters["timeouts"] += 1
+        self._timeout_streak[model] += 1
+        if (
+            self.fallback is not None
+            and model == self._preferred
+            and self._timeout_streak[model] >= self.swap_after_timeouts
+        ):
+            _, alternate = self.order()
+            logger.warning(f"Model {model} timed out {self._timeout_streak[model]} times in a row; switching to {alternate}")
+            self._preferred = alternate
+            self._swapped_at = time.monotonic() if alternate != self.primary else None
+            self._timeout_streak[model] = 0
+            self.counters["model_swaps"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        preferred, alternate = self.order()
+        return {
+            "preferred_model": preferred,
+            "hedge_model": alternate,
+            "hedge_delay_seconds": self.hedge_delay(preferred) if alternate else None,
+            "models": {model: hist.snapshot() for model, hist in self.histograms.items()},
+            **{k: self.counters[k] for k in ("hedged", "hedge_wins", "timeouts", "model_swaps")},
+        }
@@ -0,0 +1,219 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Set
+
+
+# Lower value = served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_SUGGESTIONS = 1
+PRIORITY_BATCH = 2
+
+
+class RateLimitTimeout(RuntimeError):
+    """A queued model call could not be admitted before its deadline."""
+
+
+class _Bucket:
+    """Synchronous token bucket; the priority limiter does the waiting."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None) -> None:
+        self.rate = per_minute / 60.0
+        self.capacity = float(capacity if capacity is not None else per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+
+def _wake(waiter: "asyncio.Future[None]") -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class PriorityRateLimiter:
+    """Shared requests-per-minute / tokens-per-minute limiter for model calls.
+
+    Calls queue by ``priority`` (PRIORITY_INTERACTIVE before PRIORITY_SUGGESTIONS before
+    PRIORITY_BATCH, FIFO within a level) and only the head of the queue is admitted, so
+    a backlog of batch work cannot delay a chat turn by more than one call. Token costs are
+    estimates taken when the call is queued. ``settle`` corrects them once the response
+    reports real usage. ``penalize`` pauses all admissions for a 429's ``retry-after``. A
+    call still queued at its ``deadline`` (``time.monotonic()`` seconds) raises
+    RateLimitTimeout instead of waiting on. A limit of 0 disables that dimension.
+    ``cap_priority`` adds a requests-per-minute cap for one priority level on top of the
+    shared limits (e.g. a batch run's own budget); capped calls that must wait for their cap
+    still let higher-priority calls past.
+    """
+
+    def __init__(self, requests_per_minute: float = 0, tokens_per_minute: float = 0) -> None:
+        self._requests = _Bucket(requests_per_minute) if requests_per_minute > 0 else None
+        self._tokens = _Bucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self._caps: Dict[int, _Bucket] = {}
+        self._queue: List[List[Any]] = []
+        self._seq = itertools.count()
+        self._waiters: Set["asyncio.Future[None]"] = set()
+        self._paused_until = 0.0
+        self.counters: Counter = Counter()
+        self.waited_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self._requests is not None or self._tokens is not None or bool(self._caps)
+
+    def cap_priority(self, priority: int, requests_per_minute: float, burst: Optional[float] = None) -> None:
+        """Limit calls at ``priority`` to ``requests_per_minute`` (``burst`` back to back); 0 removes the cap."""
+        if requests_per_minute > 0:
+            self._caps[priority] = _Bucket(requests_per_minute, burst if burst is not None else max(1.0, requests_per_minute / 60.0))
+        else:
+            self._caps.pop(priority, None)
+
+    def _cost(self, tokens: float) -> float:
+        return min(float(tokens), self._tokens.capacity) if self._tokens is not None else 0.0
+
+    def _wait_time(self, tokens: float, now: float, priority: Optional[int] = None) -> float:
+        wait = max(0.0, self._paused_until - now)
+        cap = self._caps.get(priority)
+        if cap is not None:
+            cap.refill(now)
+            wait = max(wait, cap.wait_time(1))
+        if self._requests is not None:
+            self._requests.refill(now)
+            wait = max(wait, self._requests.wait_time(1))
+        if self._tokens is not None:
+            self._tokens.refill(now)
+            wait = max(wait, self._tokens.wait_time(tokens))
+        return wait
+
+    def _take(self, tokens: float, priority: Optional[int] = None) -> None:
+        cap = self._caps.get(priority)
+        if cap is not None:
+            cap.tokens -= 1
+        if self._requests is not None:
+            self._requests.tokens -= 1
+        if self._tokens is not None:
+            self._tokens.tokens -= tokens
+
+    def _notify(self) -> None:
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def _sleep(self, seconds: Optional[float]) -> None:
+        """Sleep until ``seconds`` pass or the queue state changes, whichever comes first."""
+        # A bare future rather than wait_for(event.wait()): cancellation always propagates
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        handle = loop.call_later(seconds, _wake, waiter) if seconds is not None else None
+        self._waiters.add(waiter)
+        try:
+            await waiter
+        finally:
+            self._waiters.discard(waiter)
+            if handle is not None:
+                handle.cancel()
+
+    def try_acquire(self, tokens: float = 0, priority: int = PRIORITY_INTERACTIVE) -> bool:
+        """Admit a call only if it would not wait and nobody is queued (used for hedges)."""
+        if not self.enabled:
+            return True
+        cost = self._cost(tokens)
+        if self._queue or self._wait_time(cost, time.monotonic(), priority) > 0:
+            self.counters["rejected"] += 1
+            return False
+        self._take(cost, priority)
+        self.counters["admitted"] += 1
+        return True
+
+    async def acquire(
+        self,
+        tokens: float = 0,
+        priority: int = PRIORITY_INTERACTIVE,
+        deadline: Optional[float] = None,
+    ) -> float:
+        """Wait for admission; returns the seconds spent queued."""
+        if not self.enabled:
+            return 0.0
+        cost = self._cost(tokens)
+        entry = [priority, next(self._seq)]
+        heapq.heappush(self._queue, entry)
+        started = time.monotonic()
+        try:
+            while True:
+                now = time.monotonic()
+                wait: Optional[float] = None
+                if self._queue[0] is entry:
+                    wait = self._wait_time(cost, now, priority)
+                    if wait <= 0:
+                        heapq.heappop(self._queue)
+                        self._take(cost, priority)
+                        break
+                if deadline is not None:
+                    remaining = deadline - now
+                    if remaining <= 0 or (wait is not None and wait > remaining):
+                        self.counters["deadline_exceeded"] += 1
+                        raise RateLimitTimeout("model rate limit: call could not start before its deadline")
+                    wait = remaining if wait is None else wait
+                await self._sleep(wait)
+        except BaseException:
+            if entry in self._queue:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+            raise
+        finally:
+            # Whoever is at the head now (the next waiter) must re-check its admission
+            self._notify()
+        waited = time.monotonic() - started
+        self.counters["admitted"] += 1
+        self.waited_seconds += waited
+        return waited
+
+    def settle(self, estimated: float, actual: float) -> None:
+        """Charge (or refund) the difference between a call's estimated and reported tokens."""
+        if self._tokens is None or actual <= 0:
+            return
+        self._tokens.tokens = min(self._tokens.capacity, self._tokens.tokens - (actual - self._cost(estimated)))
+        if actual < estimated:
+            self._notify()
+
+    def refund(self, estimated: float) -> None:
+        """Give back a call's estimated tokens when it failed (timeout, error, 429) without reporting usage."""
+        if self._tokens is None:
+            return
+        self._tokens.tokens = min(self._tokens.capacity, self._tokens.tokens + self._cost(estimated))
+        self._notify()
+
+    def penalize(self, retry_after: float) -> None:
+        """Hold every queued call for ``retry_after`` seconds after the API answered 429."""
+        self.counters["rate_limited"] += 1
+        self._paused_until = max(self._paused_until, time.monotonic() + max(0.0, retry_after))
+        self._notify()
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        self._wait_time(0, now)  # refill both buckets
+        for cap in self._caps.values():
+            cap.refill(now)
+        return {
+            "requests_per_minute": self._requests.capacity if self._requests else None,
+            "tokens_per_minute": self._tokens.capacity if self._tokens else None,
+            "available_requests": round(self._requests.tokens, 2) if self._requests else None,
+            "available_tokens": round(self._tokens.tokens) if self._tokens else None,
+            "priority_caps": {
+                priority: {"requests_per_minute": cap.rate * 60.0, "available": round(cap.tokens, 2)}
+                for priority, cap in sorted(self._caps.items())
+            },
+            "queued": len(self._queue),
+            "paused_seconds": round(max(0.0, self._paused_until - now), 3),
+            "waited_seconds": round(self.waited_seconds, 3),
+            **{k: self.counters[k] for k in ("admitted", "rejected", "deadline_exceeded", "rate_limited")},
+        }
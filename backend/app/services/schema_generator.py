@@ -1,93 +1,48 @@
+import hashlib
+import json
 from typing import Dict, Any, List, Tuple
 from loguru import logger
 
-BASIC_TYPE_MAP_PG = {
-    "string": "TEXT",
-    "text": "TEXT",
-    "varchar": "VARCHAR",
-    "int": "INTEGER",
-    "integer": "INTEGER",
-    "bigint": "BIGINT",
-    "smallint": "SMALLINT",
-    "float": "DOUBLE PRECISION",
-    "double": "DOUBLE PRECISION",
-    "number": "DOUBLE PRECISION",
-    "decimal": "DECIMAL",
-    "numeric": "NUMERIC",
-    "bool": "BOOLEAN",
-    "boolean": "BOOLEAN",
-    "date": "DATE",
-    "datetime": "TIMESTAMP",
-    "timestamp": "TIMESTAMP",
-    "time": "TIME",
-    "json": "JSONB",
-    "jsonb": "JSONB",
-    "uuid": "UUID",
-    "inet": "INET",
-    "cidr": "CIDR",
-    "macaddr": "MACADDR",
-    "point": "POINT",
-    "polygon": "POLYGON",
-    "bytea": "BYTEA",
-    "array": "TEXT[]",
-    "enum": "TEXT",
-}
-
-
-def _normalize_type(t: str) -> str:
-    t = (t or "").lower().strip()
-    return t if t in BASIC_TYPE_MAP_PG else "string"
+try:
+    from app.services.spec_compiler import (
+        BASIC_TYPE_MAP_PG,
+        CompiledEntity,
+        CompiledField,
+        CompiledSpec,
+        _normalize_type,
+        compile_spec,
+    )
+except ImportError:
+    from backend.app.services.spec_compiler import (
+        BASIC_TYPE_MAP_PG,
+        CompiledEntity,
+        CompiledField,
+        CompiledSpec,
+        _normalize_type,
+        compile_spec,
+    )
+
+# Every emitter takes a spec dict or a CompiledSpec; generate_all compiles once and renders
+# all artifacts from the same IR. BASIC_TYPE_MAP_PG and _normalize_type now live in
+# spec_compiler and are re-exported here for existing importers.
 
 
 def validate_spec(spec: Dict[str, Any]) -> Tuple[bool, List[str]]:
-    errors: List[str] = []
-    if not isinstance(spec, dict):
-        return False, ["spec must be a dict"]
-    entities = spec.get("entities") or []
-    if not isinstance(entities, list) or not entities:
-        errors.append("spec.entities must be a non-empty list")
-    for ent in entities:
-        name = ent.get("name") if isinstance(ent, dict) else None
-        if not name:
-            errors.append("entity.name is required")
-            continue
-        fields = ent.get("fields") or []
-        if not isinstance(fields, list) or not fields:
-            errors.append(f"{name}: fields must be a non-empty list")
-            continue
-        for f in fields:
-            if not f.get("name"):
-                errors.append(f"{name}: field.name is required")
-            if not f.get("type"):
-                errors.append(f"{name}.{f.get('name','?')}: field.type is required")
-    return len(errors) == 0, errors
+    errors = compile_spec(spec).errors
+    return len(errors) == 0, list(errors)
 
 
 def to_json_schema(spec: Dict[str, Any]) -> Dict[str, Any]:
-    entities = spec.get("entities", [])
+    compiled = compile_spec(spec)
     definitions = {}
-    for ent in entities:
+    for ent in compiled.entities:
         props = {}
         required = []
-        for f in ent.get("fields", []):
-            ftype = _normalize_type(f.get("type"))
-            json_type = {
-                "string": "string",
-                "int": "integer",
-                "integer": "integer",
-                "float": "number",
-                "number": "number",
-                "bool": "boolean",
-                "boolean": "boolean",
-                "date": "string",
-                "datetime": "string",
-                "json": "object",
-                "uuid": "string",
-            }.get(ftype, "string")
-            props[f["name"]] = {"type": json_type}
-            if f.get("required"):
-                required.append(f["name"])
-        definitions[ent["name"]] = {
+        for f in ent.fields:
+            props[f.name] = {"type": f.json_type}
+            if f.required:
+                required.append(f.name)
+        definitions[ent.name] = {
             "type": "object",
             "properties": props,
             "required": required,
@@ -95,152 +50,64 @@ def to_json_schema(spec: Dict[str, Any]) -> Dict[str, Any]:
     return {"$schema": "http://json-schema.org/draft-07/schema#", "definitions": definitions}
 
 
-def to_postgres_sql(spec: Dict[str, Any]) -> str:
-    stmts: List[str] = []
-    
-    # Create custom types/enums first
-    for ent in spec.get("entities", []):
-        for f in ent.get("fields", []):
-            if f.get("type") == "enum" and f.get("values"):
-                enum_name = f"{ent['name']}_{f['name']}_enum"
-                values = ", ".join([f"'{v}'" for v in f["values"]])
-                stmts.append(f"CREATE TYPE IF NOT EXISTS {enum_name} AS ENUM ({values});")
-    
-    # Create tables
-    for ent in spec.get("entities", []):
-        cols: List[str] = []
-        pks: List[str] = []
-        uniques: List[str] = []
-        fks: List[str] = []
-        checks: List[str] = []
-        
-        for f in ent.get("fields", []):
-            col = f['name']
-            field_type = _normalize_type(f.get('type'))
-            
-            # Handle enum types
-            if field_type == "enum" and f.get("values"):
-                pg_type = f"{ent['name']}_{f['name']}_enum"
-            else:
-                pg_type = BASIC_TYPE_MAP_PG.get(field_type, 'TEXT')
-            
-            # Handle precision and scale for decimal/numeric
-            if field_type in ["decimal", "numeric"] and f.get("precision"):
-                scale = f.get("scale", 0)
-                pg_type = f"{pg_type}({f['precision']},{scale})"
-            elif field_type == "varchar" and f.get("length"):
-                pg_type = f"VARCHAR({f['length']})"
-            
-            nullable = "NOT NULL" if f.get("required") else ""
-            default = f.get("default")
-            
-            # Handle default values properly
-            if default is not None:
-                if isinstance(default, str) and field_type not in ["enum"]:
-                    default_sql = f" DEFAULT '{default}'"
-                else:
-                    default_sql = f" DEFAULT {default}"
-            else:
-                default_sql = ""
-            
-            # Handle auto-increment
-            if f.get("auto_increment"):
-                if field_type in ["int", "integer"]:
-                    pg_type = "SERIAL"
-                elif field_type == "bigint":
-                    pg_type = "BIGSERIAL"
-                nullable = "NOT NULL"
-                default_sql = ""
-            
-            col_def = f"\"{col}\" {pg_type} {nullable}{default_sql}".strip()
-            cols.append(col_def)
-            
-            # Collect primary keys
-            if f.get("primary_key"):
-                pks.append(f'"{col}"')
-            
-            # Collect unique constraints
-            if f.get("unique") and not f.get("primary_key"):
-                uniques.append(f"UNIQUE (\"{col}\")")
-            
-            # Collect foreign keys
-            if f.get("foreign_key"):
-                fk_info = f["foreign_key"]
-                ref_table = fk_info.get("table")
-                ref_field = fk_info.get("field")
-                if ref_table and ref_field:
-                    fks.append(f"FOREIGN KEY (\"{col}\") REFERENCES \"{ref_table}\"(\"{ref_field}\")")
-            
-            # Collect check constraints
-            if f.get("min_value") is not None:
-                checks.append(f"CHECK (\"{col}\" >= {f['min_value']})")
-            if f.get("max_value") is not None:
-                checks.append(f"CHECK (\"{col}\" <= {f['max_value']})")
-            if f.get("min_length") is not None:
-                checks.append(f"CHECK (LENGTH(\"{col}\") >= {f['min_length']})")
-            if f.get("max_length") is not None:
-                checks.append(f"CHECK (LENGTH(\"{col}\") <= {f['max_length']})")
-        
-        # Handle composite primary keys
-        if not pks:
-            # Look for primary_key at entity level
-            pk_fields = ent.get("primary_key", [])
-            if isinstance(pk_fields, list):
-                pks = [f'"{c}"' for c in pk_fields]
-        
-        # Handle composite unique constraints
-        for uq in ent.get("unique", []) or []:
-            if isinstance(uq, list) and uq:
-                quoted = ", ".join(f'"{c}"' for c in uq)
-                uniques.append(f"UNIQUE ({quoted})")
-        
-        # Handle foreign keys at entity level
-        for fk in ent.get("foreign_keys", []) or []:
-            cols_local = fk.get("columns") or []
-            ref_table = fk.get("ref_table")
-            ref_cols = fk.get("ref_columns") or []
-            if cols_local and ref_table and ref_cols:
-                fks.append(
-                    "FOREIGN KEY (" + ", ".join([f'\"{c}\"' for c in cols_local]) + ") REFERENCES "
-                    + f'"{ref_table}"(' + ", ".join([f'\"{c}\"' for c in ref_cols]) + ")"
-                )
-        
-        table = ent["name"]
-        body = [*cols]
-        
-        if pks:
-            body.append(f"PRIMARY KEY ({', '.join(pks)})")
-        body.extend(uniques)
-        body.extend(fks)
-        body.extend(checks)
-        
-        stmts.append(f"CREATE TABLE IF NOT EXISTS \"{table}\" (\n  " + ",\n  ".join(body) + "\n);")
-        
-        # Create indexes
-        for i, idx in enumerate(ent.get("indexes", []) or []):
-            fields = idx.get("fields") or []
-            if not fields:
-                continue
-            
-            idx_name = idx.get("name") or f"{table}_idx_{i}"
-            cols_idx = ", ".join([f'"{f.get("field")}" {("DESC" if f.get("order")=="desc" else "ASC")}' for f in fields])
-            unique_kw = "UNIQUE " if idx.get("unique") else ""
-            index_type = idx.get("type", "btree")
-            
-            if index_type == "gin":
-                stmts.append(f"CREATE {unique_kw}INDEX IF NOT EXISTS \"{idx_name}\" ON \"{table}\" USING GIN ({cols_idx});")
-            elif index_type == "gist":
-                stmts.append(f"CREATE {unique_kw}INDEX IF NOT EXISTS \"{idx_name}\" ON \"{table}\" USING GIST ({cols_idx});")
-            elif index_type == "hash":
-                stmts.append(f"CREATE {unique_kw}INDEX IF NOT EXISTS \"{idx_name}\" ON \"{table}\" USING HASH ({cols_idx});")
+def _quoted(columns: Any) -> str:
+    return ", ".join(f'"{c}"' for c in columns)
+
+
+def _table_sql(ent: CompiledEntity) -> List[str]:
+    table = ent.name
+    body: List[str] = []
+    uniques: List[str] = []
+    fks: List[str] = []
+    checks: List[str] = []
+    for f in ent.fields:
+        col, get = f.name, f.spec.get
+        nullable = "NOT NULL" if f.required or f.auto_increment else ""
+        default = get("default")
+        default_sql = ""
+        if default is not None and not f.auto_increment:
+            if isinstance(default, str) and f.type != "enum":
+                default_sql = f" DEFAULT '{default}'"
             else:
-                stmts.append(f"CREATE {unique_kw}INDEX IF NOT EXISTS \"{idx_name}\" ON \"{table}\" ({cols_idx});")
-    
-    # Add triggers for audit trails if specified
-    if spec.get("audit_trail"):
-        for ent in spec.get("entities", []):
-            table = ent["name"]
-            stmts.append(f"""
+                default_sql = f" DEFAULT {default}"
+        body.append(f"\"{col}\" {f.pg_type} {nullable}{default_sql}".strip())
+
+        if f.unique and not f.primary_key:
+            uniques.append(f"UNIQUE (\"{col}\")")
+        if f.references:
+            fks.append(f"FOREIGN KEY (\"{col}\") REFERENCES \"{f.references[0]}\"(\"{f.references[1]}\")")
+        if get("min_value") is not None:
+            checks.append(f"CHECK (\"{col}\" >= {f.spec['min_value']})")
+        if get("max_value") is not None:
+            checks.append(f"CHECK (\"{col}\" <= {f.spec['max_value']})")
+        if get("min_length") is not None:
+            checks.append(f"CHECK (LENGTH(\"{col}\") >= {f.spec['min_length']})")
+        if get("max_length") is not None:
+            checks.append(f"CHECK (LENGTH(\"{col}\") <= {f.spec['max_length']})")
+    uniques.extend(f"UNIQUE ({_quoted(uq)})" for uq in ent.unique_constraints)
+    fks.extend(
+        f"FOREIGN KEY ({_quoted(cols)}) REFERENCES \"{ref_table}\"({_quoted(ref_cols)})"
+        for cols, ref_table, ref_cols in ent.foreign_keys
+    )
+
+    if ent.primary_key:
+        body.append(f"PRIMARY KEY ({_quoted(ent.primary_key)})")
+    body.extend(uniques)
+    body.extend(fks)
+    body.extend(checks)
+    stmts = [f"CREATE TABLE IF NOT EXISTS \"{table}\" (\n  " + ",\n  ".join(body) + "\n);"]
+
+    for idx in ent.indexes:
+        idx_name = idx.name or f"{table}_idx_{idx.position}"
+        cols_idx = ", ".join(f'"{field}" {"DESC" if desc else "ASC"}' for field, desc in idx.columns)
+        unique_kw = "UNIQUE " if idx.unique else ""
+        using = {"gin": " USING GIN", "gist": " USING GIST", "hash": " USING HASH"}.get(idx.type, "")
+        stmts.append(f"CREATE {unique_kw}INDEX IF NOT EXISTS \"{idx_name}\" ON \"{table}\"{using} ({cols_idx});")
+    return stmts
+
+
+def _audit_trigger_sql(table: str) -> str:
+    return f"""
 -- Audit trigger for {table}
 CREATE OR REPLACE FUNCTION audit_{table}_changes()
 RETURNS TRIGGER AS $$
@@ -265,96 +132,155 @@ $$ LANGUAGE plpgsql;
 CREATE TRIGGER {table}_audit_trigger
     AFTER INSERT OR UPDATE OR DELETE ON "{table}"
     FOR EACH ROW EXECUTE FUNCTION audit_{table}_changes();
-""")
-    
+"""
+
+
+def _render_postgres_sql(compiled: CompiledSpec) -> str:
+    stmts: List[str] = []
+
+    # Create custom types/enums first
+    for ent in compiled.entities:
+        for f in ent.fields:
+            if f.declares_enum:
+                values = ", ".join([f"'{v}'" for v in f.values])
+                stmts.append(f"CREATE TYPE IF NOT EXISTS {f.pg_type} AS ENUM ({values});")
+
+    for ent in compiled.entities:
+        stmts.extend(_table_sql(ent))
+
+    # Add triggers for audit trails if specified
+    if compiled.audit_trail:
+        stmts.extend(_audit_trigger_sql(ent.name) for ent in compiled.entities)
+
     return "\n".join(stmts)
 
 
+def to_postgres_sql(spec: Dict[str, Any]) -> str:
+    return compile_spec(spec).rendered("postgres_sql", _render_postgres_sql)
+
+
+SCHEMA_DIGEST_LEGEND = (
+    "One line per table: table: column type [flags], ... | table-level constraints.\n"
+    "Flags: type! NOT NULL, PK primary key, UQ unique, ->t.c foreign key, =v default, auto "
+    "auto-increment, [a..b] value range, len[a..b] length range. IDX(cols) index "
+    "(- marks DESC, then unique/type), AUDIT row-change triggers into audit_logs."
+)
+
+
+def _digest_range(lo: Any, hi: Any) -> str:
+    return f"[{'' if lo is None else lo}..{'' if hi is None else hi}]"
+
+
+def _digest_column(f: CompiledField) -> str:
+    get = f.spec.get
+    type_text = f.type
+    if f.type == "enum" and f.values:
+        type_text = "enum(" + "|".join(str(v) for v in f.values) + ")"
+    elif f.type in ("decimal", "numeric") and get("precision"):
+        type_text = f"{f.type}({get('precision')},{get('scale', 0)})"
+    elif f.type == "varchar" and get("length"):
+        type_text = f"varchar({get('length')})"
+    if f.required or f.auto_increment:
+        type_text += "!"
+    parts = [f.name, type_text]
+    if f.primary_key:
+        parts.append("PK")
+    elif f.unique:
+        parts.append("UQ")
+    if f.auto_increment:
+        parts.append("auto")
+    if f.references:
+        parts.append(f"->{f.references[0]}.{f.references[1]}")
+    if get("default") is not None and not f.auto_increment:
+        parts.append(f"={get('default')}")
+    if get("min_value") is not None or get("max_value") is not None:
+        parts.append(_digest_range(get("min_value"), get("max_value")))
+    if get("min_length") is not None or get("max_length") is not None:
+        parts.append("len" + _digest_range(get("min_length"), get("max_length")))
+    return " ".join(parts)
+
+
+def _render_schema_digest(compiled: CompiledSpec) -> str:
+    lines: List[str] = []
+    for ent in compiled.entities:
+        line = f"{ent.name}: " + ", ".join(_digest_column(f) for f in ent.fields)
+        table_level: List[str] = []
+        if ent.table_primary_key and not ent.pk_fields:
+            table_level.append("PK(" + ",".join(ent.table_primary_key) + ")")
+        table_level.extend("UQ(" + ",".join(uq) + ")" for uq in ent.unique_constraints)
+        table_level.extend(
+            f"FK({','.join(cols)})->{ref_table}({','.join(ref_cols)})" for cols, ref_table, ref_cols in ent.foreign_keys
+        )
+        for idx in ent.indexes:
+            cols_idx = ",".join(("-" if desc else "") + str(field) for field, desc in idx.columns)
+            extras = (["unique"] if idx.unique else []) + [t for t in (idx.type,) if t and t != "btree"]
+            table_level.append(f"IDX({cols_idx})" + "".join(f" {e}" for e in extras))
+        if table_level:
+            line += " | " + "; ".join(table_level)
+        lines.append(line)
+    if compiled.audit_trail and lines:
+        lines.append("AUDIT: " + ", ".join(ent.name for ent in compiled.entities))
+    return "\n".join(lines)
+
+
+def to_schema_digest(spec: Dict[str, Any]) -> str:
+    """Compact, deterministic text form of the schema for model prompts.
+
+    Carries what to_postgres_sql expresses (typed columns, keys, uniques, foreign keys,
+    checks, indexes, audit triggers) at a fraction of the tokens. The notation is explained
+    by SCHEMA_DIGEST_LEGEND.
+    """
+    return compile_spec(spec).rendered("schema_digest", _render_schema_digest)
+
+
 def to_dynamodb_defs(spec: Dict[str, Any]) -> List[Dict[str, Any]]:
+    compiled = compile_spec(spec)
     tables: List[Dict[str, Any]] = []
-    for ent in spec.get("entities", []):
-        # Find primary key fields from the fields array
-        pk_fields = [f for f in ent.get("fields", []) if f.get("primary_key")]
-        if not pk_fields:
-            logger.warning("DynamoDB: entity %s missing primary_key fields; skipping", ent.get("name"))
+    for ent in compiled.entities:
+        if not ent.pk_fields:
+            logger.warning("DynamoDB: entity %s missing primary_key fields; skipping", ent.name)
             continue
-        
-        key_schema = []
-        attr_defs = []
-        attr_set = set()
-        
-        # Use the first primary key field as HASH key
-        if len(pk_fields) >= 1:
-            pk_name = pk_fields[0]["name"]
-            key_schema.append({"AttributeName": pk_name, "KeyType": "HASH"})
-            attr_set.add(pk_name)
-        
-        # Use second primary key field as RANGE key (if exists)
-        if len(pk_fields) >= 2:
-            pk_name = pk_fields[1]["name"]
-            key_schema.append({"AttributeName": pk_name, "KeyType": "RANGE"})
-            attr_set.add(pk_name)
-        
-        # Add all primary key fields to attribute definitions
-        for f in ent.get("fields", []):
-            if f["name"] in attr_set:
-                t = _normalize_type(f.get("type"))
-                dynamo_t = "S" if t in ["string", "date", "datetime", "uuid"] else ("N" if t in ["int", "integer", "float", "number"] else "S")
-                attr_defs.append({"AttributeName": f["name"], "AttributeType": dynamo_t})
+
+        # First primary key field is the HASH key, the second (if any) the RANGE key
+        key_names = [f.name for f in ent.pk_fields[:2]]
+        key_schema = [{"AttributeName": name, "KeyType": kind} for name, kind in zip(key_names, ("HASH", "RANGE"))]
+        attr_defs = [{"AttributeName": f.name, "AttributeType": f.dynamo_type} for f in ent.fields if f.name in key_names]
+        defined = {a["AttributeName"] for a in attr_defs}
         provisioned = {
-            "ReadCapacityUnits": (ent.get("read_capacity") or spec.get("aws", {}).get("read_capacity") or 5),
-            "WriteCapacityUnits": (ent.get("write_capacity") or spec.get("aws", {}).get("write_capacity") or 5),
+            "ReadCapacityUnits": (ent.read_capacity or compiled.read_capacity or 5),
+            "WriteCapacityUnits": (ent.write_capacity or compiled.write_capacity or 5),
         }
         table_def = {
-            "TableName": ent["name"],
+            "TableName": ent.name,
             "KeySchema": key_schema,
             "AttributeDefinitions": attr_defs,
             "BillingMode": "PROVISIONED",
             "ProvisionedThroughput": provisioned,
         }
-        # GSIs (optional)
         gsis = []
-        
-        # First, add GSIs for foreign key fields (automatic)
-        fk_fields = [f for f in ent.get("fields", []) if f.get("foreign_key")]
-        for fk_field in fk_fields:
-            fk_name = fk_field["name"]
-            fk_table = fk_field.get("foreign_key", {}).get("table", "")
-            
-            # Add foreign key attribute to attribute definitions if not already there
-            if fk_name not in [a["AttributeName"] for a in attr_defs]:
-                t = _normalize_type(fk_field.get("type"))
-                dynamo_t = "S" if t in ["string", "date", "datetime", "uuid"] else ("N" if t in ["int", "integer", "float", "number"] else "S")
-                attr_defs.append({"AttributeName": fk_name, "AttributeType": dynamo_t})
-            
-            # Create GSI for foreign key queries (e.g., "find all properties for user_id")
-            gsi_name = f"{ent['name']}_{fk_name}_gsi"
+
+        # First, add GSIs for foreign key fields (automatic), e.g. "find all properties for user_id"
+        for f in ent.fk_fields:
+            if f.name not in defined:
+                attr_defs.append({"AttributeName": f.name, "AttributeType": f.dynamo_type})
+                defined.add(f.name)
             gsis.append({
-                "IndexName": gsi_name,
-                "KeySchema": [{"AttributeName": fk_name, "KeyType": "HASH"}],
+                "IndexName": f"{ent.name}_{f.name}_gsi",
+                "KeySchema": [{"AttributeName": f.name, "KeyType": "HASH"}],
                 "Projection": {"ProjectionType": "ALL"},
                 "ProvisionedThroughput": provisioned,
             })
-        
-        # Then add explicit indexes from the spec
-        for idx in ent.get("indexes", []) or []:
-            fields = idx.get("fields") or []
-            if not fields:
-                continue
-            # Simple single-attr GSI from first field
-            gname = idx.get("name") or f"{ent['name']}_gsi_{len(gsis)}"
-            attr = fields[0].get("field")
+
+        # Then add explicit indexes from the spec: a single-attribute GSI on the first field
+        for idx in ent.indexes:
+            gname = idx.name or f"{ent.name}_gsi_{len(gsis)}"
+            attr = idx.columns[0][0]
             if not attr:
                 continue
-            if attr not in [a["AttributeName"] for a in attr_defs]:
-                # Add attribute def if missing
-                t = "S"
-                for f in ent.get("fields", []):
-                    if f["name"] == attr:
-                        tnorm = _normalize_type(f.get("type"))
-                        t = "S" if tnorm in ["string", "date", "datetime", "uuid"] else ("N" if tnorm in ["int", "integer", "float", "number"] else "S")
-                        break
-                attr_defs.append({"AttributeName": attr, "AttributeType": t})
+            if attr not in defined:
+                field = ent.field_by_name.get(attr)
+                attr_defs.append({"AttributeName": attr, "AttributeType": field.dynamo_type if field else "S"})
+                defined.add(attr)
             gsis.append({
                 "IndexName": gname,
                 "KeySchema": [{"AttributeName": attr, "KeyType": "HASH"}],
@@ -368,14 +294,15 @@ def to_dynamodb_defs(spec: Dict[str, Any]) -> List[Dict[str, Any]]:
 
 
 def generate_all(spec: Dict[str, Any]) -> Dict[str, Any]:
-    ok, errors = validate_spec(spec)
-    if not ok:
-        raise ValueError("Invalid spec: " + "; ".join(errors))
+    compiled = compile_spec(spec)
+    if compiled.errors:
+        raise ValueError("Invalid spec: " + "; ".join(compiled.errors))
+    spec = compiled.spec
     
     result = {
-        "json_schema": to_json_schema(spec),
-        "postgres_sql": to_postgres_sql(spec),
-        "dynamodb_tables": to_dynamodb_defs(spec),
+        "json_schema": to_json_schema(compiled),
+        "postgres_sql": to_postgres_sql(compiled),
+        "dynamodb_tables": to_dynamodb_defs(compiled),
     }
     
     # Add enterprise features if present
@@ -401,3 +328,9 @@ def generate_all(spec: Dict[str, Any]) -> Dict[str, Any]:
         result["security"] = spec["security"]
     
     return result
+
+
+def spec_hash(spec: Dict[str, Any]) -> str:
+    """Stable fingerprint of a spec (key order independent), used to tell whether artifacts are stale."""
+    canonical = json.dumps(spec or {}, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
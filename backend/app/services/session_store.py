@@ -0,0 +1,651 @@
+import asyncio
+import contextlib
+import json
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from loguru import logger
+
+try:
+    import aiosqlite
+except Exception:  # pragma: no cover
+    aiosqlite = None  # type: ignore
+
+
+class SessionRecord:
+    """Compact per-session chat state.
+
+    Uses ``__slots__`` to avoid a per-instance ``__dict__``. Once a conversation grows past the
+    store's compression threshold its history is kept as a zlib-compressed JSON blob and only
+    inflated when a turn actually reads it.
+    """
+
+    __slots__ = (
+        "session_id",
+        "name",
+        "description",
+        "partial_spec",
+        "done",
+        "project_id",
+        "created_at",
+        "last_access",
+        "_history",
+        "_history_blob",
+        "_turns",
+        "version",
+        "spec_index",
+        "artifacts",
+        "artifacts_spec_hash",
+    )
+
+    def __init__(
+        self,
+        session_id: str,
+        name: str,
+        description: Optional[str] = None,
+        history: Optional[List[Dict[str, str]]] = None,
+        partial_spec: Optional[Dict[str, Any]] = None,
+        done: bool = False,
+        project_id: Optional[str] = None,
+    ) -> None:
+        now = time.monotonic()
+        self.session_id = session_id
+        self.name = name
+        self.description = description
+        self.partial_spec: Dict[str, Any] = partial_spec or {}
+        self.done = done
+        self.project_id = project_id
+        self.created_at = now
+        self.last_access = now
+        self._history: Optional[List[Dict[str, str]]] = None
+        self._history_blob: Optional[bytes] = None
+        self._turns = 0
+        self.version = 0
+        # Transient name index over partial_spec used by the patch applier; never persisted
+        self.spec_index: Optional[Any] = None
+        # generate_all output precomputed once the conversation is done, and the spec it was built from
+        self.artifacts: Optional[Dict[str, Any]] = None
+        self.artifacts_spec_hash: Optional[str] = None
+        self.history = history or []
+
+    @property
+    def history(self) -> List[Dict[str, str]]:
+        """Conversation history, decompressed on demand when stored compactly."""
+        if self._history is not None:
+            return self._history
+        if self._history_blob is not None:
+            return json.loads(zlib.decompress(self._history_blob).decode("utf-8"))
+        return []
+
+    @history.setter
+    def history(self, value: List[Dict[str, str]]) -> None:
+        self._history = list(value)
+        self._history_blob = None
+        self._turns = sum(1 for m in self._history if m.get("role") == "user")
+
+    @property
+    def turns(self) -> int:
+        """Number of user turns in the history."""
+        return self._turns
+
+    @property
+    def compressed(self) -> bool:
+        return self._history_blob is not None
+
+    def compress_history(self) -> None:
+        """Replace the in-memory history list with a zlib-compressed JSON blob."""
+        if self._history is None:
+            return
+        raw = json.dumps(self._history, separators=(",", ":")).encode("utf-8")
+        self._history_blob = zlib.compress(raw, 6)
+        self._history = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serializable form of the record used by persistent backends."""
+        return {
+            "session_id": self.session_id,
+            "name": self.name,
+            "description": self.description,
+            "history": self.history,
+            "partial_spec": self.partial_spec,
+            "done": self.done,
+            "project_id": self.project_id,
+            "artifacts": self.artifacts,
+            "artifacts_spec_hash": self.artifacts_spec_hash,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], version: int = 0) -> "SessionRecord":
+        record = cls(
+            data["session_id"],
+            data.get("name", ""),
+            description=data.get("description"),
+            history=data.get("history") or [],
+            partial_spec=data.get("partial_spec") or {},
+            done=bool(data.get("done", False)),
+            project_id=data.get("project_id"),
+        )
+        record.artifacts = data.get("artifacts")
+        record.artifacts_spec_hash = data.get("artifacts_spec_hash")
+        record.version = version
+        return record
+
+    def approx_bytes(self) -> int:
+        """Rough payload size of the record (history plus spec), used for memory stats."""
+        if self._history_blob is not None:
+            history_bytes = len(self._history_blob)
+        else:
+            history_bytes = sum(len(m.get("content", "")) + 32 for m in self._history or [])
+        spec_bytes = len(json.dumps(self.partial_spec, separators=(",", ":"))) if self.partial_spec else 0
+        return history_bytes + spec_bytes
+
+
+class SessionConflictError(Exception):
+    """Raised when a session was updated by someone else since it was read (optimistic check failed)."""
+
+
+class SessionLocks:
+    """Per-session asyncio locks so turns on one session run one at a time, in arrival order.
+
+    asyncio.Lock wakes waiters first-in first-out, so queued turns are applied in the order
+    they arrived. Locks exist only while held or awaited; different sessions never share one.
+    """
+
+    def __init__(self) -> None:
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._users: Dict[str, int] = {}
+
+    @contextlib.asynccontextmanager
+    async def hold(self, session_id: str) -> AsyncIterator[None]:
+        lock = self._locks.get(session_id)
+        if lock is None:
+            lock = self._locks[session_id] = asyncio.Lock()
+        self._users[session_id] = self._users.get(session_id, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._users[session_id] -= 1
+            if not self._users[session_id]:
+                del self._users[session_id]
+                del self._locks[session_id]
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+
+class _Shard:
+    __slots__ = ("entries", "lock", "hits", "misses", "evictions", "expirations")
+
+    def __init__(self) -> None:
+        self.entries: "OrderedDict[str, SessionRecord]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+
+class InMemorySessionStore:
+    """Bounded in-process session store with LRU eviction and idle-TTL expiry.
+
+    ``max_entries`` caps the number of live sessions (least recently used sessions are
+    evicted first), ``idle_ttl`` drops sessions that have not been touched for that many
+    seconds, and a background sweeper enforces the TTL even for sessions nobody reads again.
+    Histories with more than ``compress_after_turns`` user turns are stored zlib-compressed.
+
+    Sessions are spread over ``shards`` independently locked LRU maps so bookkeeping for one
+    session never waits on another's; capacity and LRU order are enforced per shard.
+
+    ``get`` returns the stored record itself and callers update it in place, so there is no
+    separate copy to version-check: one process owns every session here and AIAgentService's
+    SessionLocks are what serialize writers. ``expected_version`` is accepted for interface
+    parity with SqliteSessionStore, where it is a real compare-and-set.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        idle_ttl: float = 3600.0,
+        sweep_interval: float = 60.0,
+        compress_after_turns: Optional[int] = 4,
+        shards: int = 16,
+    ) -> None:
+        self.max_entries = max_entries
+        self.idle_ttl = idle_ttl
+        self.sweep_interval = sweep_interval
+        self.compress_after_turns = compress_after_turns
+        # Small stores stay unsharded so LRU order is exact; large ones spread over up to ``shards`` maps
+        shards = max(1, min(shards, max_entries // 64))
+        self._shards = [_Shard() for _ in range(shards)]
+        self._shard_capacity = max(1, -(-max_entries // shards))
+        self._sweeper: Optional[asyncio.Task] = None
+
+    def _shard(self, session_id: str) -> _Shard:
+        return self._shards[hash(session_id) % len(self._shards)]
+
+    async def get(self, session_id: str) -> Optional[SessionRecord]:
+        """Return the session and mark it recently used, or None if unknown or expired."""
+        now = time.monotonic()
+        shard = self._shard(session_id)
+        with shard.lock:
+            record = shard.entries.get(session_id)
+            if record is None:
+                shard.misses += 1
+                return None
+            if self.idle_ttl and now - record.last_access > self.idle_ttl:
+                del shard.entries[session_id]
+                shard.expirations += 1
+                shard.misses += 1
+                return None
+            record.last_access = now
+            shard.entries.move_to_end(session_id)
+            shard.hits += 1
+            return record
+
+    async def put(self, record: SessionRecord, durable: bool = False, expected_version: Optional[int] = None) -> None:
+        """Insert or update a session, compressing long histories and evicting LRU overflow.
+
+        ``durable`` and ``expected_version`` are accepted for interface parity with persistent
+        stores; in-process writes are always immediately visible and writers are serialized
+        by SessionLocks (see the class docstring).
+        """
+        self._ensure_sweeper()
+        shard = self._shard(record.session_id)
+        with shard.lock:
+            record.version += 1
+            self._insert_locked(shard, record)
+
+    def insert(self, record: SessionRecord) -> None:
+        """Cache a record as-is, without a version bump or conflict check (for read-through caches)."""
+        shard = self._shard(record.session_id)
+        with shard.lock:
+            self._insert_locked(shard, record)
+
+    def _insert_locked(self, shard: _Shard, record: SessionRecord) -> None:
+        if self.compress_after_turns is not None and record.turns > self.compress_after_turns:
+            record.compress_history()
+        record.last_access = time.monotonic()
+        shard.entries[record.session_id] = record
+        shard.entries.move_to_end(record.session_id)
+        while len(shard.entries) > self._shard_capacity:
+            evicted_id, _ = shard.entries.popitem(last=False)
+            shard.evictions += 1
+            logger.debug(f"Evicted idle chat session {evicted_id} (store at capacity)")
+
+    async def delete(self, session_id: str) -> None:
+        shard = self._shard(session_id)
+        with shard.lock:
+            shard.entries.pop(session_id, None)
+
+    def sweep(self) -> int:
+        """Drop every session idle for longer than ``idle_ttl``; returns the number removed."""
+        if not self.idle_ttl:
+            return 0
+        cutoff = time.monotonic() - self.idle_ttl
+        removed = 0
+        for shard in self._shards:
+            with shard.lock:
+                # Entries are kept in access order, so expired sessions are all at the front
+                expired = 0
+                while shard.entries:
+                    session_id, record = next(iter(shard.entries.items()))
+                    if record.last_access > cutoff:
+                        break
+                    del shard.entries[session_id]
+                    expired += 1
+                shard.expirations += expired
+            removed += expired
+        if removed:
+            logger.info(f"Session sweeper expired {removed} idle chat session(s)")
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        """Return entry counts, hit/miss/eviction counters and approximate memory usage."""
+        records: List[SessionRecord] = []
+        counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+        for shard in self._shards:
+            with shard.lock:
+                records.extend(shard.entries.values())
+                for key in counters:
+                    counters[key] += getattr(shard, key)
+        return {
+            "backend": "memory",
+            "entries": len(records),
+            "max_entries": self.max_entries,
+            "shards": len(self._shards),
+            "idle_ttl_seconds": self.idle_ttl,
+            "compressed_entries": sum(1 for r in records if r.compressed),
+            "approx_bytes": sum(r.approx_bytes() for r in records),
+            **counters,
+        }
+
+    def _ensure_sweeper(self) -> None:
+        if self._sweeper is not None and not self._sweeper.done():
+            return
+        if not self.idle_ttl or not self.sweep_interval:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._sweeper = loop.create_task(self._sweep_forever())
+
+    async def _sweep_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception as e:  # pragma: no cover - the sweeper must never die
+                logger.warning(f"Session sweep failed: {e}")
+
+    async def close(self) -> None:
+        """Stop the background sweeper."""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+
+
+class SqliteSessionStore:
+    """Session store shared by every worker and replica through a SQLite database (aiosqlite).
+
+    Reads go through a bounded local ``InMemorySessionStore``: a cached record is reused only
+    while its version still matches the row's version, which is a single primary-key lookup,
+    so a turn served by another worker is always picked up. Writes are write-behind: ``put``
+    updates the local cache and queues the session, and a background flusher upserts all
+    queued sessions in one transaction every ``flush_interval`` seconds (or as soon as
+    ``batch_size`` sessions are waiting). Pass ``durable=True`` to wait for the write.
+    Versioned puts (``expected_version``, used for chat turns) skip the queue and commit a
+    compare-and-set on the row's version, so two workers can never both win the same turn.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 10000,
+        idle_ttl: float = 3600.0,
+        sweep_interval: float = 60.0,
+        compress_after_turns: Optional[int] = 4,
+        flush_interval: float = 0.05,
+        batch_size: int = 100,
+    ) -> None:
+        if aiosqlite is None:
+            raise RuntimeError("aiosqlite not installed")
+        self.path = path
+        self.idle_ttl = idle_ttl
+        self.sweep_interval = sweep_interval
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._cache = InMemorySessionStore(
+            max_entries=max_entries,
+            idle_ttl=idle_ttl,
+            sweep_interval=sweep_interval,
+            compress_after_turns=compress_after_turns,
+        )
+        self._db: Optional["aiosqlite.Connection"] = None
+        self._connect_lock: Optional[asyncio.Lock] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._pending: Dict[str, SessionRecord] = {}
+        self._last_sweep = time.monotonic()
+        self._flushes = 0
+        self._rows_written = 0
+        self._stale_writes = 0
+        self._db_reads = 0
+
+    async def _conn(self) -> "aiosqlite.Connection":
+        if self._db is not None:
+            return self._db
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self._db is None:
+                directory = os.path.dirname(os.path.abspath(self.path))
+                os.makedirs(directory, exist_ok=True)
+                db = await aiosqlite.connect(self.path)
+                await db.execute("PRAGMA journal_mode=WAL")
+                await db.execute("PRAGMA busy_timeout=5000")
+                await db.execute(
+                    "CREATE TABLE IF NOT EXISTS chat_sessions ("
+                    " session_id TEXT PRIMARY KEY,"
+                    " version INTEGER NOT NULL,"
+                    " updated_at REAL NOT NULL,"
+                    " payload BLOB NOT NULL)"
+                )
+                await db.execute("CREATE INDEX IF NOT EXISTS chat_sessions_updated_at ON chat_sessions (updated_at)")
+                await db.commit()
+                self._db = db
+        return self._db
+
+    async def get(self, session_id: str) -> Optional[SessionRecord]:
+        """Return the session, reusing the local copy only if no other worker has updated it."""
+        pending = self._pending.get(session_id)
+        if pending is not None:
+            return pending
+        cached = await self._cache.get(session_id)
+        db = await self._conn()
+        self._db_reads += 1
+        if cached is not None:
+            async with db.execute("SELECT version FROM chat_sessions WHERE session_id = ?", (session_id,)) as cur:
+                row = await cur.fetchone()
+            if row is None:
+                await self._cache.delete(session_id)
+                return None
+            if row[0] == cached.version:
+                return cached
+        async with db.execute(
+            "SELECT version, payload FROM chat_sessions WHERE session_id = ?", (session_id,)
+        ) as cur:
+            row = await cur.fetchone()
+        if row is None:
+            return None
+        record = SessionRecord.from_dict(json.loads(zlib.decompress(row[1]).decode("utf-8")), version=row[0])
+        self._cache.insert(record)
+        return record
+
+    async def put(self, record: SessionRecord, durable: bool = False, expected_version: Optional[int] = None) -> None:
+        """Update the local cache and queue the session for the next batched write.
+
+        With ``expected_version`` the write is not queued: it is a compare-and-set on the row's
+        version, committed before returning, and fails with SessionConflictError if another
+        worker has already written a newer version.
+        """
+        if expected_version is not None:
+            await self._put_versioned(record, expected_version)
+            return
+        record.version += 1
+        self._cache.insert(record)
+        self._pending[record.session_id] = record
+        if durable:
+            await self.flush()
+            return
+        self._ensure_flusher()
+        if len(self._pending) >= self.batch_size and self._wake is not None:
+            self._wake.set()
+
+    async def _put_versioned(self, record: SessionRecord, expected_version: int) -> None:
+        if record.session_id in self._pending:
+            # The compare-and-set below must see this worker's own queued write
+            await self.flush()
+        version = expected_version + 1
+        payload = zlib.compress(json.dumps(record.to_dict(), separators=(",", ":")).encode("utf-8"), 6)
+        db = await self._conn()
+        cursor = await db.execute(
+            "UPDATE chat_sessions SET version = ?, updated_at = ?, payload = ? WHERE session_id = ? AND version = ?",
+            (version, time.time(), payload, record.session_id, expected_version),
+        )
+        written = cursor.rowcount
+        if written == 0:
+            # Either the row is new, or another worker moved it past expected_version
+            cursor = await db.execute(
+                "INSERT INTO chat_sessions (session_id, version, updated_at, payload) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(session_id) DO NOTHING",
+                (record.session_id, version, time.time(), payload),
+            )
+            written = cursor.rowcount
+        await db.commit()
+        if written == 0:
+            await self._cache.delete(record.session_id)
+            raise SessionConflictError(f"session {record.session_id} changed since it was read")
+        record.version = version
+        self._cache.insert(record)
+        self._rows_written += 1
+
+    async def delete(self, session_id: str) -> None:
+        self._pending.pop(session_id, None)
+        await self._cache.delete(session_id)
+        db = await self._conn()
+        await db.execute("DELETE FROM chat_sessions WHERE session_id = ?", (session_id,))
+        await db.commit()
+
+    async def flush(self) -> int:
+        """Write every queued session in a single transaction; returns the number of rows written."""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+            now = time.time()
+            rows = [
+                (
+                    session_id,
+                    record.version,
+                    now,
+                    zlib.compress(json.dumps(record.to_dict(), separators=(",", ":")).encode("utf-8"), 6),
+                )
+                for session_id, record in batch.items()
+            ]
+            try:
+                db = await self._conn()
+                # Never overwrite a row another worker has already advanced past this version
+                cursor = await db.executemany(
+                    "INSERT INTO chat_sessions (session_id, version, updated_at, payload) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(session_id) DO UPDATE SET "
+                    "version = excluded.version, updated_at = excluded.updated_at, payload = excluded.payload "
+                    "WHERE excluded.version > chat_sessions.version",
+                    rows,
+                )
+                await db.commit()
+            except Exception:
+                # Re-queue anything that was not superseded while the write was in flight
+                for session_id, record in batch.items():
+                    self._pending.setdefault(session_id, record)
+                raise
+            written = cursor.rowcount if cursor.rowcount is not None and cursor.rowcount >= 0 else len(rows)
+            if written < len(rows):
+                self._stale_writes += len(rows) - written
+                logger.warning(f"Skipped {len(rows) - written} stale session write(s) superseded by another worker")
+                for session_id in batch:
+                    await self._cache.delete(session_id)
+            self._flushes += 1
+            self._rows_written += written
+            return written
+
+    async def sweep(self) -> int:
+        """Delete sessions idle for longer than ``idle_ttl`` from the database and local cache."""
+        self._cache.sweep()
+        if not self.idle_ttl:
+            return 0
+        db = await self._conn()
+        cursor = await db.execute("DELETE FROM chat_sessions WHERE updated_at < ?", (time.time() - self.idle_ttl,))
+        await db.commit()
+        removed = cursor.rowcount or 0
+        if removed:
+            logger.info(f"Session sweeper expired {removed} idle chat session(s) from {self.path}")
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        """Local cache statistics plus write-behind and database counters."""
+        return {
+            **self._cache.stats(),
+            "backend": "sqlite",
+            "path": self.path,
+            "pending_writes": len(self._pending),
+            "flushes": self._flushes,
+            "rows_written": self._rows_written,
+            "stale_writes_skipped": self._stale_writes,
+            "db_reads": self._db_reads,
+        }
+
+    def _ensure_flusher(self) -> None:
+        if self._flusher is not None and not self._flusher.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._wake = asyncio.Event()
+        self._flusher = loop.create_task(self._flush_forever())
+
+    async def _flush_forever(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+                if self.sweep_interval and time.monotonic() - self._last_sweep >= self.sweep_interval:
+                    self._last_sweep = time.monotonic()
+                    await self.sweep()
+            except Exception as e:  # pragma: no cover - keep flushing on transient errors
+                logger.warning(f"Session write-behind flush failed: {e}")
+
+    async def close(self) -> None:
+        """Flush queued writes, stop background tasks and close the database connection."""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        if self._pending:
+            await self.flush()
+        await self._cache.close()
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+
+def sqlite_path_from_url(database_url: str) -> str:
+    """Extract the file path from a ``sqlite:///`` or ``sqlite+aiosqlite:///`` URL."""
+    for prefix in ("sqlite+aiosqlite:///", "sqlite:///"):
+        if database_url.startswith(prefix):
+            path = database_url[len(prefix):]
+            if not path or path == ":memory:":
+                raise ValueError("DATABASE_URL must point at a SQLite file to share sessions between workers")
+            return path
+    raise ValueError(f"Unsupported DATABASE_URL for session storage: {database_url}")
+
+
+def create_session_store(settings: Any):
+    """Build the session store selected by ``SESSION_BACKEND`` ("memory" or "sqlite")."""
+    backend = (getattr(settings, "SESSION_BACKEND", "memory") or "memory").lower()
+    common = dict(
+        max_entries=settings.SESSION_MAX_ENTRIES,
+        idle_ttl=settings.SESSION_IDLE_TTL_SECONDS,
+        sweep_interval=settings.SESSION_SWEEP_INTERVAL_SECONDS,
+        compress_after_turns=settings.SESSION_COMPRESS_AFTER_TURNS,
+    )
+    if backend == "memory":
+        return InMemorySessionStore(shards=getattr(settings, "SESSION_SHARDS", 16), **common)
+    if backend == "sqlite":
+        return SqliteSessionStore(
+            sqlite_path_from_url(settings.DATABASE_URL),
+            flush_interval=settings.SESSION_FLUSH_INTERVAL_SECONDS,
+            batch_size=settings.SESSION_FLUSH_BATCH_SIZE,
+            **common,
+        )
+    raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
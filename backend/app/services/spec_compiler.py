@@ -0,0 +1,265 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+BASIC_TYPE_MAP_PG = {
+    "string": "TEXT",
+    "text": "TEXT",
+    "varchar": "VARCHAR",
+    "int": "INTEGER",
+    "integer": "INTEGER",
+    "bigint": "BIGINT",
+    "smallint": "SMALLINT",
+    "float": "DOUBLE PRECISION",
+    "double": "DOUBLE PRECISION",
+    "number": "DOUBLE PRECISION",
+    "decimal": "DECIMAL",
+    "numeric": "NUMERIC",
+    "bool": "BOOLEAN",
+    "boolean": "BOOLEAN",
+    "date": "DATE",
+    "datetime": "TIMESTAMP",
+    "timestamp": "TIMESTAMP",
+    "time": "TIME",
+    "json": "JSONB",
+    "jsonb": "JSONB",
+    "uuid": "UUID",
+    "inet": "INET",
+    "cidr": "CIDR",
+    "macaddr": "MACADDR",
+    "point": "POINT",
+    "polygon": "POLYGON",
+    "bytea": "BYTEA",
+    "array": "TEXT[]",
+    "enum": "TEXT",
+}
+
+JSON_TYPE_MAP = {
+    "string": "string",
+    "int": "integer",
+    "integer": "integer",
+    "float": "number",
+    "number": "number",
+    "bool": "boolean",
+    "boolean": "boolean",
+    "date": "string",
+    "datetime": "string",
+    "json": "object",
+    "uuid": "string",
+}
+
+DYNAMODB_NUMBER_TYPES = {"int", "integer", "float", "number"}
+
+# normalized type -> (PostgreSQL, JSON Schema, DynamoDB attribute) type
+_TYPE_TARGETS: Dict[str, Tuple[str, str, str]] = {
+    t: (pg, JSON_TYPE_MAP.get(t, "string"), "N" if t in DYNAMODB_NUMBER_TYPES else "S")
+    for t, pg in BASIC_TYPE_MAP_PG.items()
+}
+_normalized: Dict[Any, str] = {}
+
+# Types whose column type depends on more than the type name
+_SIZED_TYPES = frozenset(("enum", "varchar", "decimal", "numeric"))
+
+
+def _normalize_type(t: str) -> str:
+    t = (t or "").lower().strip()
+    return t if t in BASIC_TYPE_MAP_PG else "string"
+
+
+def _resolve_type(raw: Any) -> str:
+    """_normalize_type memoized on the raw spelling; specs repeat a handful of type names."""
+    t = _normalized.get(raw)
+    if t is None:
+        t = _normalize_type(raw)
+        if len(_normalized) < 256:  # model output can invent any spelling; keep the memo small
+            _normalized[raw] = t
+    return t
+
+
+def _index_column(c: Any) -> Tuple[Any, bool]:
+    """(field, descending) for an index entry; a plain string names an ascending field."""
+    if isinstance(c, str):
+        return c, False
+    return c.get("field"), c.get("order") == "desc"
+
+
+class CompiledField:
+    """One column with its type resolved for every target (PostgreSQL, JSON Schema, DynamoDB).
+
+    The flags the emitters branch on are read once; rarer column options (default, checks)
+    stay in ``spec``, the field's own dict.
+    """
+
+    __slots__ = (
+        "spec", "name", "raw_type", "type", "pg_type", "json_type", "dynamo_type", "values",
+        "required", "primary_key", "unique", "auto_increment", "has_foreign_key", "references",
+    )
+
+    def __init__(self, entity: str, name: Any, raw_type: Any, f: Dict[str, Any]) -> None:
+        get = f.get
+        self.spec = f
+        self.name = name
+        self.raw_type = raw_type
+        self.type = t = _normalized.get(raw_type) or _resolve_type(raw_type)
+        pg_type, self.json_type, self.dynamo_type = _TYPE_TARGETS[t]
+        self.values: Tuple[Any, ...] = ()
+        self.required = bool(get("required"))
+        self.primary_key = bool(get("primary_key"))
+        self.unique = bool(get("unique"))
+        self.auto_increment = auto = bool(get("auto_increment"))
+        fk = get("foreign_key")
+        self.has_foreign_key = bool(fk)
+        # (table, field) when the foreign key names both, which is all the DDL and digest express
+        self.references: Optional[Tuple[Any, Any]] = None
+        if fk and isinstance(fk, dict) and fk.get("table") and fk.get("field"):
+            self.references = (fk["table"], fk["field"])
+
+        if t in _SIZED_TYPES:
+            if t == "enum":
+                values = get("values")
+                if values:
+                    self.values = tuple(values)
+                    pg_type = f"{entity}_{name}_enum"
+            elif t == "varchar":
+                if get("length"):
+                    pg_type = f"VARCHAR({f['length']})"
+            elif get("precision"):
+                pg_type = f"{pg_type}({f['precision']},{get('scale', 0)})"
+        if auto:
+            if t in ("int", "integer"):
+                pg_type = "SERIAL"
+            elif t == "bigint":
+                pg_type = "BIGSERIAL"
+        self.pg_type = pg_type
+
+    @property
+    def declares_enum(self) -> bool:
+        """Whether the DDL creates a type for this column (only for a literal ``"enum"`` type)."""
+        return self.raw_type == "enum" and bool(self.values)
+
+
+class CompiledIndex:
+    __slots__ = ("position", "name", "columns", "unique", "type")
+
+    def __init__(self, position: int, idx: Dict[str, Any], columns: List[Tuple[Any, bool]]) -> None:
+        self.position = position  # place in the entity's list, used for generated names
+        self.name = idx.get("name")
+        self.columns: Tuple[Tuple[Any, bool], ...] = tuple(columns)  # (field, descending)
+        self.unique = bool(idx.get("unique"))
+        self.type = idx.get("type")
+
+
+class CompiledEntity:
+    """One table: its fields in spec order plus the key, constraint and lookup indexes built from them."""
+
+    __slots__ = (
+        "name", "fields", "field_by_name", "pk_fields", "fk_fields", "table_primary_key", "primary_key",
+        "unique_constraints", "foreign_keys", "indexes", "read_capacity", "write_capacity",
+    )
+
+    def __init__(self, name: Any, ent: Dict[str, Any], errors: List[str]) -> None:
+        self.name = name
+        fields: List[CompiledField] = []
+        pk_fields: List[CompiledField] = []
+        fk_fields: List[CompiledField] = []
+        self.field_by_name: Dict[Any, CompiledField] = {}
+        raw_fields = ent.get("fields") or []
+        if not isinstance(raw_fields, list) or not raw_fields:
+            errors.append(f"{name}: fields must be a non-empty list")
+            raw_fields = []
+        for raw in raw_fields:
+            if not isinstance(raw, dict):
+                errors.append(f"{name}: field must be an object")
+                continue
+            field_name, raw_type = raw.get("name"), raw.get("type")
+            if not field_name:
+                errors.append(f"{name}: field.name is required")
+            if not raw_type:
+                errors.append(f"{name}.{raw.get('name','?')}: field.type is required")
+            elif not isinstance(raw_type, str):
+                errors.append(f"{name}.{raw.get('name','?')}: field.type must be a string")
+                raw_type = None  # emitted as a string column
+            if not field_name:
+                continue
+            f = CompiledField(name, field_name, raw_type, raw)
+            fields.append(f)
+            self.field_by_name.setdefault(field_name, f)  # the first of duplicated names wins
+            if f.primary_key:
+                pk_fields.append(f)
+            if f.has_foreign_key:
+                fk_fields.append(f)
+        self.fields: Tuple[CompiledField, ...] = tuple(fields)
+        self.pk_fields = tuple(pk_fields)
+        self.fk_fields = tuple(fk_fields)
+        pk = ent.get("primary_key")
+        self.table_primary_key: Tuple[Any, ...] = tuple(pk) if isinstance(pk, list) else ()
+        # Column-level keys win; the entity-level list is the composite-key form
+        self.primary_key = tuple(f.name for f in self.pk_fields) or self.table_primary_key
+        self.unique_constraints = tuple(
+            tuple(uq) for uq in ent.get("unique", []) or [] if isinstance(uq, list) and uq
+        )
+        self.foreign_keys: List[Tuple[Tuple[Any, ...], Any, Tuple[Any, ...]]] = []
+        for fk in ent.get("foreign_keys", []) or []:
+            cols, ref_table, ref_cols = fk.get("columns") or [], fk.get("ref_table"), fk.get("ref_columns") or []
+            if cols and ref_table and ref_cols:
+                self.foreign_keys.append((tuple(cols), ref_table, tuple(ref_cols)))
+        self.indexes: List[CompiledIndex] = []
+        for i, idx in enumerate(ent.get("indexes", []) or []):
+            if not isinstance(idx, dict):
+                continue
+            columns = [_index_column(c) for c in idx.get("fields") or [] if isinstance(c, (str, dict))]
+            if columns:
+                self.indexes.append(CompiledIndex(i, idx, columns))
+        self.read_capacity = ent.get("read_capacity")
+        self.write_capacity = ent.get("write_capacity")
+
+
+class CompiledSpec:
+    """A spec checked and resolved in one pass; every schema_generator emitter renders from it.
+
+    ``errors`` are validate_spec's messages. Entities and fields without a name are reported
+    there and left out of the IR, so emitters never see them. Renderings are memoized on the
+    instance: compile again after editing ``spec``.
+    """
+
+    __slots__ = (
+        "spec", "entities", "entity_by_name", "errors", "audit_trail", "read_capacity", "write_capacity", "_rendered",
+    )
+
+    def __init__(self, spec: Any) -> None:
+        self.spec = spec
+        self.entities: List[CompiledEntity] = []
+        self.entity_by_name: Dict[Any, CompiledEntity] = {}
+        self.errors: List[str] = []
+        self._rendered: Dict[str, Any] = {}
+        if not isinstance(spec, dict):
+            self.errors.append("spec must be a dict")
+            self.audit_trail, self.read_capacity, self.write_capacity = False, None, None
+            return
+        self.audit_trail = bool(spec.get("audit_trail"))
+        aws = spec.get("aws") or {}
+        self.read_capacity = aws.get("read_capacity")
+        self.write_capacity = aws.get("write_capacity")
+        entities = spec.get("entities") or []
+        if not isinstance(entities, list) or not entities:
+            self.errors.append("spec.entities must be a non-empty list")
+        for ent in entities:
+            self._compile_entity(ent)
+
+    def _compile_entity(self, ent: Any) -> None:
+        name = ent.get("name") if isinstance(ent, dict) else None
+        if not name:
+            self.errors.append("entity.name is required")
+            return
+        entity = CompiledEntity(name, ent, self.errors)
+        self.entities.append(entity)
+        self.entity_by_name.setdefault(name, entity)
+
+    def rendered(self, key: str, render: Callable[["CompiledSpec"], Any]) -> Any:
+        """Memoize an immutable rendering (e.g. the DDL text) on this compiled spec."""
+        if key not in self._rendered:
+            self._rendered[key] = render(self)
+        return self._rendered[key]
+
+
+def compile_spec(spec: Any) -> CompiledSpec:
+    """Compile ``spec``, or return it unchanged if it is already compiled."""
+    return spec if isinstance(spec, CompiledSpec) else CompiledSpec(spec)
@@ -0,0 +1,179 @@
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+
+PATCH_OPS = (
+    "set",
+    "add_entity",
+    "update_entity",
+    "remove_entity",
+    "add_field",
+    "update_field",
+    "remove_field",
+)
+
+
+class SpecIndex:
+    """Name lookups over a spec's entity and field lists.
+
+    Entity lookups are built once per spec; field maps are built lazily, only for entities a
+    patch actually touches. Kept alongside the session's spec so edit turns cost O(changes)
+    instead of rebuilding every list by name the way a full merge does.
+    """
+
+    __slots__ = ("spec", "entities", "_fields")
+
+    def __init__(self, spec: Dict[str, Any]) -> None:
+        self.spec = spec
+        if not isinstance(spec.get("entities"), list):
+            spec["entities"] = []
+        self.entities: Dict[str, Dict[str, Any]] = {
+            e["name"]: e for e in spec["entities"] if isinstance(e, dict) and e.get("name")
+        }
+        self._fields: Dict[str, Dict[str, Dict[str, Any]]] = {}
+
+    def fields(self, entity_name: str) -> Dict[str, Dict[str, Any]]:
+        """Return the field-name map for an entity, building it on first use."""
+        fmap = self._fields.get(entity_name)
+        if fmap is None:
+            entity = self.entities[entity_name]
+            if not isinstance(entity.get("fields"), list):
+                entity["fields"] = []
+            fmap = {f["name"]: f for f in entity["fields"] if isinstance(f, dict) and f.get("name")}
+            self._fields[entity_name] = fmap
+        return fmap
+
+    def forget_fields(self, entity_name: str) -> None:
+        self._fields.pop(entity_name, None)
+
+
+def apply_spec_patch(spec: Dict[str, Any], ops: List[Dict[str, Any]], index: Optional[SpecIndex] = None) -> SpecIndex:
+    """Apply patch operations to ``spec`` in place and return the (possibly reused) index.
+
+    Supported operations (all keyed by entity/field name):
+
+    - ``{"op": "set", "key": "app_type", "value": ...}`` sets a top-level key other than entities
+    - ``{"op": "add_entity", "entity": {...}}`` adds an entity (or upserts into an existing one)
+    - ``{"op": "update_entity", "entity": "orders", "changes": {...}}`` updates entity attributes
+    - ``{"op": "remove_entity", "entity": "orders"}``
+    - ``{"op": "add_field", "entity": "orders", "field": {...}}`` adds or replaces a field
+    - ``{"op": "update_field", "entity": "orders", "field": "status", "changes": {...}}``
+    - ``{"op": "remove_field", "entity": "orders", "field": "status"}``
+
+    Malformed operations or ones that reference unknown names are skipped with a warning so a
+    single bad op from the model does not discard the rest of the turn.
+    """
+    if index is None or index.spec is not spec:
+        index = SpecIndex(spec)
+    removed_entities = False
+    touched_fields: set = set()
+
+    for op in ops or []:
+        if not isinstance(op, dict):
+            logger.warning(f"Skipping malformed spec patch op: {op!r}")
+            continue
+        kind = op.get("op")
+        entity_name = op.get("entity") if isinstance(op.get("entity"), str) else None
+
+        if kind == "set":
+            key = op.get("key")
+            if not key or key == "entities":
+                logger.warning(f"Skipping spec patch 'set' without a usable key: {op}")
+                continue
+            spec[key] = op.get("value")
+
+        elif kind == "add_entity":
+            entity = op.get("entity")
+            if not isinstance(entity, dict) or not entity.get("name"):
+                logger.warning(f"Skipping add_entity without a named entity: {op}")
+                continue
+            existing = index.entities.get(entity["name"])
+            if existing is None:
+                entity.setdefault("fields", [])
+                spec["entities"].append(entity)
+                index.entities[entity["name"]] = entity
+                continue
+            fmap = index.fields(entity["name"])
+            for field in entity.get("fields") or []:
+                _upsert_field(existing, fmap, field)
+            existing.update({k: v for k, v in entity.items() if k != "fields"})
+
+        elif kind == "update_entity":
+            existing = index.entities.get(entity_name)
+            changes = op.get("changes")
+            if existing is None or not isinstance(changes, dict):
+                logger.warning(f"Skipping update_entity for unknown entity or missing changes: {op}")
+                continue
+            changes = {k: v for k, v in changes.items() if k != "fields"}
+            new_name = changes.get("name")
+            if new_name and new_name != entity_name:
+                del index.entities[entity_name]
+                index.entities[new_name] = existing
+                fmap = index._fields.pop(entity_name, None)
+                if fmap is not None:
+                    index._fields[new_name] = fmap
+            existing.update(changes)
+
+        elif kind == "remove_entity":
+            existing = index.entities.pop(entity_name, None)
+            if existing is None:
+                logger.warning(f"Skipping remove_entity for unknown entity: {op}")
+                continue
+            index.forget_fields(entity_name)
+            existing["__removed__"] = True
+            removed_entities = True
+
+        elif kind in ("add_field", "update_field", "remove_field"):
+            existing = index.entities.get(entity_name)
+            if existing is None:
+                logger.warning(f"Skipping {kind} for unknown entity: {op}")
+                continue
+            fmap = index.fields(entity_name)
+            if kind == "add_field":
+                field = op.get("field")
+                if not isinstance(field, dict) or not field.get("name"):
+                    logger.warning(f"Skipping add_field without a named field: {op}")
+                    continue
+                _upsert_field(existing, fmap, field)
+            elif kind == "update_field":
+                field = fmap.get(op.get("field"))
+                changes = op.get("changes")
+                if field is None or not isinstance(changes, dict):
+                    logger.warning(f"Skipping update_field for unknown field or missing changes: {op}")
+                    continue
+                old_name = field["name"]
+                field.update(changes)
+                if field.get("name") != old_name:
+                    del fmap[old_name]
+                    fmap[field["name"]] = field
+            else:
+                field = fmap.pop(op.get("field"), None)
+                if field is None:
+                    logger.warning(f"Skipping remove_field for unknown field: {op}")
+                    continue
+                field["__removed__"] = True
+                touched_fields.add(entity_name)
+
+        else:
+            logger.warning(f"Skipping unknown spec patch op: {op}")
+
+    # Removals are only marked above; compact each affected list once at the end
+    if removed_entities:
+        spec["entities"] = [e for e in spec["entities"] if not (isinstance(e, dict) and e.pop("__removed__", False))]
+    for entity_name in touched_fields:
+        entity = index.entities.get(entity_name)
+        if entity is not None:
+            entity["fields"] = [f for f in entity["fields"] if not (isinstance(f, dict) and f.pop("__removed__", False))]
+    return index
+
+
+def _upsert_field(entity: Dict[str, Any], fmap: Dict[str, Dict[str, Any]], field: Dict[str, Any]) -> None:
+    name = field.get("name")
+    if not name:
+        return
+    existing = fmap.get(name)
+    if existing is None:
+        entity["fields"].append(field)
+        fmap[name] = field
+    else:
+        existing.update(field)
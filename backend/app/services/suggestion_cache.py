@@ -0,0 +1,101 @@
+import asyncio
+import copy
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+
+def suggestion_key(schema: Dict[str, Any], rejected: Optional[Iterable[str]] = None, previously: Optional[Iterable[str]] = None) -> str:
+    """Canonical hash of a suggestions request.
+
+    Key order in the schema and the order or duplication of the exclusion lists do not change
+    the key, so repeated clicks on an unchanged schema map to the same entry.
+    """
+    payload = {
+        "schema": schema,
+        "rejected": sorted(set(rejected or [])),
+        "previously": sorted(set(previously or [])),
+    }
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class SuggestionCache:
+    """LRU + TTL cache of schema suggestions with single-flight request coalescing.
+
+    Concurrent requests for the same key share one in-flight model call. The call runs as its
+    own task so a caller that disconnects does not cancel it for the others. Failures are
+    never cached; every waiter sees the exception.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 900.0) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._inflight: Dict[str, "asyncio.Future[Dict[str, Any]]"] = {}
+        self._hits = 0
+        self._misses = 0
+        self._coalesced = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a copy of the cached value, or None if absent or expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        if self.ttl and time.monotonic() - stored_at > self.ttl:
+            del self._entries[key]
+            self._expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return copy.deepcopy(value)
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        self._entries[key] = (time.monotonic(), copy.deepcopy(value))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """Return the cached value for ``key``, joining or starting the model call on a miss."""
+        value = self.get(key)
+        if value is not None:
+            self._hits += 1
+            return value
+        task = self._inflight.get(key)
+        if task is None:
+            self._misses += 1
+            task = asyncio.ensure_future(self._fill(key, compute))
+            self._inflight[key] = task
+        else:
+            self._coalesced += 1
+        return copy.deepcopy(await asyncio.shield(task))
+
+    async def _fill(self, key: str, compute: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        try:
+            value = await compute()
+            self.put(key, value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "inflight": len(self._inflight),
+            "hits": self._hits,
+            "misses": self._misses,
+            "coalesced": self._coalesced,
+            "evictions": self._evictions,
+            "expirations": self._expirations,
+        }
@@ -0,0 +1,170 @@
+"""Agent baseline benchmark: turn latency, parse cost, merge cost and memory per session.
+
+Run from the repository root:
+
+    python -m backend.scripts.bench_agent [--sessions 50] [--cassette PATH] [--latency 0]
+                                          [--output bench.json] [--baseline bench.json]
+
+Replays a conversation through AIAgentService with no network access. The source is either a
+cassette recorded with AGENT_MODEL_CLIENT_MODE=record or the bakery fixture
+(backend/tests/fixtures/recorded_responses.json). ``--latency`` sets a fixed simulated model
+latency per call in seconds. By default nothing is slept, so the turn timings are the agent's
+own overhead. Retry backoff is counted rather than slept.
+
+``--output`` saves the results as JSON. ``--baseline`` prints each metric's change against
+an earlier saved run.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Dict, List
+
+from backend.app.services import ai_agent
+from backend.app.services.ai_agent import AIAgentService
+from backend.app.services.model_client import RecordedResponseClient
+from backend.app.services.session_store import InMemorySessionStore
+
+RECORDED_PATH = Path(__file__).resolve().parent.parent / "tests" / "fixtures" / "recorded_responses.json"
+
+
+def load_conversation(cassette: Path, mode: str):
+    """Return (answers, responses) for one conversation."""
+    if cassette:
+        data = json.loads(cassette.read_text())
+        interactions = data.get("interactions", [])
+        answers = [_last_user_text(item["request"]) for item in interactions]
+        return answers, [item["response"] for item in interactions]
+    turns = json.loads(RECORDED_PATH.read_text())["turns"]
+    # Failed text-mode attempts are retried with the same answer, so only one answer per turn
+    return [turn["answer"] for turn in turns], [r for turn in turns for r in turn[mode]]
+
+
+def _last_user_text(request: Dict[str, Any]) -> str:
+    content = (request.get("messages") or [{}])[-1].get("content", "")
+    if isinstance(content, list):
+        content = "".join(block.get("text", "") for block in content if isinstance(block, dict))
+    return str(content).split("User answer:\n")[-1].strip() or "Continue."
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+async def bench_turns(answers, responses, sessions: int, latency: float) -> Dict[str, Any]:
+    client = RecordedResponseClient(responses * sessions, time_scale=1.0 if latency else 0.0, latency_s=latency)
+    agent = AIAgentService(client=client)
+    agent._sessions = InMemorySessionStore(max_entries=sessions + 1, sweep_interval=0)
+    real_sleep, backoff = asyncio.sleep, []
+
+    async def counted_sleep(seconds):
+        backoff.append(seconds)
+
+    ai_agent.asyncio.sleep = counted_sleep
+    turn_seconds: List[float] = []
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    try:
+        for _ in range(sessions):
+            session = await agent.start_session("Bench")
+            for answer in answers:
+                started = time.perf_counter()
+                result = await agent.next_turn(session["session_id"], answer)
+                turn_seconds.append(time.perf_counter() - started)
+                if result["done"]:
+                    break
+        stored = tracemalloc.take_snapshot().compare_to(before, "filename")
+    finally:
+        tracemalloc.stop()
+        ai_agent.asyncio.sleep = real_sleep
+        await agent.close()
+    retained = sum(stat.size_diff for stat in stored)
+    return {
+        "sessions": sessions,
+        "turns": len(turn_seconds),
+        "model_calls": client.calls,
+        "turn_p50_ms": percentile(turn_seconds, 0.5) * 1000,
+        "turn_p95_ms": percentile(turn_seconds, 0.95) * 1000,
+        "turn_mean_ms": statistics.mean(turn_seconds) * 1000,
+        "backoff_s": sum(backoff),
+        "memory_per_session_kb": retained / sessions / 1024,
+    }
+
+
+def bench_parse_and_merge(responses, repeat: int) -> Dict[str, Any]:
+    agent = AIAgentService(client=RecordedResponseClient([]))
+    texts = [r["text"] for r in responses if r.get("text")]
+    controls = [r["tool_input"] for r in responses if r.get("tool_input") is not None]
+    controls += [c for c in (agent._parse_json_response(t) for t in texts) if c]
+    partials = [c.get("partial_spec") or {} for c in controls]
+
+    # Text replies go through JSON extraction; tool replies only through control decoding
+    if texts:
+        parse, items = agent._parse_json_with_strategy, texts
+    else:
+        parse, items = agent._control_from_tool_input, [r["tool_input"] for r in responses if r.get("tool_input") is not None]
+    parse_us = None
+    if items:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for item in items:
+                parse(item)
+        parse_us = (time.perf_counter() - started) / (repeat * len(items)) * 1e6
+
+    merge_us = None
+    if partials:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            merged: Dict[str, Any] = {}
+            for partial in partials:
+                merged = agent._merge_partial(merged, partial)
+        merge_us = (time.perf_counter() - started) / (repeat * len(partials)) * 1e6
+    return {"parse_us": parse_us, "merge_us": merge_us}
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    print(f"\n{'metric':<24} {'baseline':>12} {'now':>12} {'change':>8}")
+    for key, value in results.items():
+        old = baseline.get(key)
+        if not isinstance(value, (int, float)) or not isinstance(old, (int, float)):
+            continue
+        change = f"{(value - old) / old:+.1%}" if old else "n/a"
+        print(f"{key:<24} {old:>12.3f} {value:>12.3f} {change:>8}")
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    ai_agent.settings.AGENT_STRUCTURED_OUTPUT = args.mode == "tool_mode"
+    answers, responses = load_conversation(args.cassette, args.mode)
+    results = {
+        "source": str(args.cassette or RECORDED_PATH.name),
+        "mode": args.mode,
+        **await bench_turns(answers, responses, args.sessions, args.latency),
+        **bench_parse_and_merge(responses, args.repeat),
+    }
+    for key, value in results.items():
+        print(f"{key:<24} {value:.3f}" if isinstance(value, float) else f"{key:<24} {value}")
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+    if args.baseline:
+        compare(results, json.loads(args.baseline.read_text()))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--cassette", type=Path, default=None, help="Cassette recorded with AGENT_MODEL_CLIENT_MODE=record")
+    parser.add_argument("--mode", choices=("tool_mode", "text_mode"), default="tool_mode", help="Fixture output mode")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated model latency per call, seconds")
+    parser.add_argument("--repeat", type=int, default=2000, help="Iterations for the parse/merge micro-benchmarks")
+    parser.add_argument("--output", type=Path, default=None)
+    parser.add_argument("--baseline", type=Path, default=None)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
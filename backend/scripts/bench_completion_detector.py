@@ -0,0 +1,95 @@
+"""Micro-benchmark: precomputed completion detector vs. the previous per-call TF-IDF scoring.
+
+Run from the repository root:
+
+    python -m backend.scripts.bench_completion_detector [--texts 5000]
+
+The previous implementation built a Counter/dict vector per call and recomputed every
+reference vector's norm inside each cosine comparison. The detector normalizes the reference
+vectors once; single texts are scored through postings over that matrix and, with NumPy
+installed, a whole batch is one matrix product.
+"""
+import argparse
+import random
+import time
+from typing import Callable, List
+
+from backend.app.services.completion_detector import (
+    COMPLETION_REFERENCE_PHRASES,
+    COMPLETION_SIMILARITY_THRESHOLD,
+    CompletionDetector,
+    build_idf,
+    cosine_similarity,
+    tfidf_vector,
+    tokenize,
+)
+
+_REFERENCE_TOKENS = [tokenize(p) for p in COMPLETION_REFERENCE_PHRASES]
+_IDF = build_idf(_REFERENCE_TOKENS)
+_REFERENCE_VECTORS = [tfidf_vector(tokens, _IDF) for tokens in _REFERENCE_TOKENS]
+
+_QUESTIONS = [
+    "What payment methods do you accept?",
+    "Do customers need accounts, or can they check out as guests?",
+    "How do you track inventory across your locations?",
+    "Should orders keep a history of status changes?",
+    "Which details do you store about each supplier?",
+    "Perfect! I have enough information to create your database design.",
+    "Great, I now have everything I need to design your database.",
+    "All set - I can build your schema now.",
+]
+
+
+def legacy_detect(text: str) -> bool:
+    """The pre-existing AIAgentService._detect_completion_phrases, unchanged."""
+    if not text or not text.strip():
+        return False
+    tokens = tokenize(text)
+    if not tokens:
+        return False
+    vec = tfidf_vector(tokens, _IDF)
+    max_similarity = max(
+        (cosine_similarity(vec, ref_vec) for ref_vec in _REFERENCE_VECTORS),
+        default=0.0,
+    )
+    return max_similarity >= COMPLETION_SIMILARITY_THRESHOLD
+
+
+def make_corpus(n: int, seed: int = 7) -> List[str]:
+    rng = random.Random(seed)
+    return [rng.choice(_QUESTIONS) + (" " + rng.choice(_QUESTIONS) if rng.random() < 0.3 else "") for _ in range(n)]
+
+
+def timed(fn: Callable[[], List[bool]], repeat: int) -> tuple:
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--texts", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.texts)
+    runs = [("legacy per-call", lambda: [legacy_detect(t) for t in corpus])]
+    python_detector = CompletionDetector(use_numpy=False)
+    runs.append(("per-call", lambda: [python_detector.detect(t) for t in corpus]))
+    runs.append(("python batch", lambda: python_detector.detect_batch(corpus)))
+    numpy_detector = CompletionDetector()
+    runs.append(("numpy batch", lambda: numpy_detector.detect_batch(corpus)))
+
+    results = [(name,) + timed(fn, args.repeat) for name, fn in runs]
+    baseline, expected = results[0][1], results[0][2]
+    print(f"{'implementation':<18} {'total ms':>9} {'us/text':>8} {'speedup':>8}")
+    for name, seconds, result in results:
+        assert result == expected, f"{name} disagrees with the legacy detector"
+        print(f"{name:<18} {seconds * 1e3:>9.2f} {seconds / len(corpus) * 1e6:>8.2f} {baseline / seconds:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Prompt-size comparison: full PostgreSQL DDL vs. the compact schema digest.
+
+Run from the repository root:
+
+    python -m backend.scripts.bench_schema_digest [--tables 10 40 120] [--columns 12]
+
+Builds synthetic specs (typed columns, foreign keys, uniques, checks, indexes, with and
+without audit_trail) and reports the estimated prompt tokens of the schema section that
+generate_schema_suggestions sends, plus the time to render each form.
+"""
+import argparse
+import time
+
+from backend.app.services.history_compactor import estimate_tokens
+from backend.app.services.schema_generator import SCHEMA_DIGEST_LEGEND, to_postgres_sql, to_schema_digest
+
+TYPES = ["string", "int", "decimal", "datetime", "bool", "text", "uuid", "json"]
+
+
+def make_spec(tables: int, columns: int, audit_trail: bool) -> dict:
+    entities = []
+    for t in range(tables):
+        fields = [{"name": "id", "type": "uuid", "primary_key": True}]
+        if t:
+            fields.append({"name": f"table_{t - 1}_id", "type": "uuid", "required": True,
+                           "foreign_key": {"table": f"table_{t - 1}", "field": "id"}})
+        for c in range(columns - len(fields)):
+            field = {"name": f"column_{c}", "type": TYPES[c % len(TYPES)], "required": c % 2 == 0}
+            if field["type"] == "decimal":
+                field.update(precision=12, scale=2, min_value=0)
+            if c == 1:
+                field["unique"] = True
+            fields.append(field)
+        entities.append({
+            "name": f"table_{t}",
+            "fields": fields,
+            "indexes": [{"fields": [{"field": "column_0"}, {"field": "column_3", "order": "desc"}]}],
+        })
+    return {"app_type": "Synthetic", "db_type": "postgresql", "audit_trail": audit_trail, "entities": entities}
+
+
+def timed(fn, spec, repeat: int = 20):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        out = fn(spec)
+    return out, (time.perf_counter() - started) / repeat * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tables", type=int, nargs="+", default=[10, 40, 120])
+    parser.add_argument("--columns", type=int, default=12)
+    args = parser.parse_args()
+    print(f"{'tables':>6} {'audit':>5} {'ddl tok':>8} {'digest tok':>10} {'saved':>6} {'ddl ms':>7} {'digest ms':>9}")
+    for tables in args.tables:
+        for audit in (False, True):
+            spec = make_spec(tables, args.columns, audit)
+            ddl, ddl_ms = timed(to_postgres_sql, spec)
+            digest, digest_ms = timed(to_schema_digest, spec)
+            ddl_tokens = estimate_tokens(ddl)
+            digest_tokens = estimate_tokens(SCHEMA_DIGEST_LEGEND + "\n\n" + digest)
+            print(
+                f"{tables:>6} {'yes' if audit else 'no':>5} {ddl_tokens:>8} {digest_tokens:>10} "
+                f"{1 - digest_tokens / ddl_tokens:>6.0%} {ddl_ms:>7.2f} {digest_ms:>9.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
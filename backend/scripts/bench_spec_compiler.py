@@ -0,0 +1,58 @@
+"""Spec compiler timing: one compile vs. rendering each artifact from the compiled IR.
+
+Run from the repository root:
+
+    python -m backend.scripts.bench_spec_compiler [--tables 10 40 400] [--columns 20]
+
+Uses the synthetic specs from bench_schema_digest and reports, per spec size, the time
+for generate_all on a raw spec, the compile itself, and each emitter run on an
+already-compiled spec (with its memoized text cleared).
+"""
+import argparse
+import time
+
+from backend.app.services.schema_generator import (
+    generate_all,
+    to_dynamodb_defs,
+    to_json_schema,
+    to_postgres_sql,
+    to_schema_digest,
+)
+from backend.app.services.spec_compiler import CompiledSpec
+from backend.scripts.bench_schema_digest import make_spec
+
+
+def best_ms(fn, repeat: int = 7, number: int = 5) -> float:
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        runs.append((time.perf_counter() - started) / number * 1000)
+    return min(runs)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tables", type=int, nargs="+", default=[10, 40, 400])
+    parser.add_argument("--columns", type=int, default=20)
+    args = parser.parse_args()
+    emitters = [("json", to_json_schema), ("sql", to_postgres_sql), ("dynamo", to_dynamodb_defs), ("digest", to_schema_digest)]
+    print(f"{'tables':>6} {'generate_all':>12} {'compile':>8} " + " ".join(f"{name:>7}" for name, _ in emitters) + "  (ms)")
+    for tables in args.tables:
+        spec = make_spec(tables, args.columns, audit_trail=True)
+        compiled = CompiledSpec(spec)
+
+        def render(fn):
+            def run():
+                compiled._rendered.clear()
+                fn(compiled)
+            return run
+
+        row = [best_ms(lambda: generate_all(spec)), best_ms(lambda: CompiledSpec(spec))]
+        row += [best_ms(render(fn)) for _, fn in emitters]
+        print(f"{tables:>6} {row[0]:>12.2f} {row[1]:>8.2f} " + " ".join(f"{ms:>7.2f}" for ms in row[2:]))
+
+
+if __name__ == "__main__":
+    main()
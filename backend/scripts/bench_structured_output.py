@@ -0,0 +1,81 @@
+"""Replay benchmark: free-text JSON replies vs. forced tool use for chat turns.
+
+Run from the repository root:
+
+    python -m backend.scripts.bench_structured_output [--time-scale 0]
+
+The same recorded bakery conversation (backend/tests/fixtures/recorded_responses.json) is
+replayed through AIAgentService once per output mode. Model latency comes from the recording;
+retry backoff is counted rather than slept. ``--time-scale 1`` replays in real time.
+"""
+import argparse
+import asyncio
+import json
+import time
+from pathlib import Path
+
+from backend.app.services import ai_agent
+from backend.app.services.ai_agent import AIAgentService
+from backend.app.services.model_client import RecordedResponseClient
+
+RECORDED_PATH = Path(__file__).resolve().parent.parent / "tests" / "fixtures" / "recorded_responses.json"
+
+
+async def replay(mode: str, turns, time_scale: float) -> dict:
+    ai_agent.settings.AGENT_STRUCTURED_OUTPUT = mode == "tool_mode"
+    backoff = []
+    real_sleep = asyncio.sleep
+
+    async def counted_sleep(seconds):
+        backoff.append(seconds)
+        if time_scale:
+            await real_sleep(seconds * time_scale)
+
+    client = RecordedResponseClient([r for turn in turns for r in turn[mode]], time_scale=time_scale)
+    agent = AIAgentService(client=client)
+    ai_agent.asyncio.sleep = counted_sleep
+    history, spec = [], None
+    started = time.perf_counter()
+    try:
+        for turn in turns:
+            control = await agent._call_model(history, turn["answer"], spec=spec)
+            spec = control.get("partial_spec")
+            history += [{"role": "user", "content": turn["answer"]}, {"role": "assistant", "content": json.dumps(control)}]
+    finally:
+        ai_agent.asyncio.sleep = real_sleep
+        await agent.close()
+    return {
+        "mode": mode,
+        "turns": len(turns),
+        "calls": client.calls,
+        "retries": client.calls - len(turns),
+        "model_latency_s": client.simulated_latency_s,
+        "backoff_s": sum(backoff),
+        "total_s": client.simulated_latency_s + sum(backoff),
+        "wall_s": time.perf_counter() - started,
+    }
+
+
+async def main_async(time_scale: float) -> None:
+    turns = json.loads(RECORDED_PATH.read_text())["turns"]
+    results = [await replay(mode, turns, time_scale) for mode in ("text_mode", "tool_mode")]
+    print(f"{'mode':<10} {'turns':>5} {'calls':>5} {'retries':>7} {'model s':>8} {'backoff s':>9} {'total s':>8} {'wall s':>7}")
+    for r in results:
+        print(
+            f"{r['mode']:<10} {r['turns']:>5} {r['calls']:>5} {r['retries']:>7} {r['model_latency_s']:>8.2f} "
+            f"{r['backoff_s']:>9.2f} {r['total_s']:>8.2f} {r['wall_s']:>7.3f}"
+        )
+    text, tool = results
+    print(f"\nretry rate: text {text['retries'] / text['turns']:.0%}, tool {tool['retries'] / tool['turns']:.0%}")
+    print(f"per-turn latency: text {text['total_s'] / text['turns']:.2f}s, tool {tool['total_s'] / tool['turns']:.2f}s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--time-scale", type=float, default=0.0, help="Fraction of recorded latency to actually sleep")
+    args = parser.parse_args()
+    asyncio.run(main_async(args.time_scale))
+
+
+if __name__ == "__main__":
+    main()
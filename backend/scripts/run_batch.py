@@ -0,0 +1,53 @@
+"""Push a batch of business descriptions through the schema-design agent with no human in the loop.
+
+Run from the repository root:
+
+    python -m backend.scripts.run_batch jobs.ndjson --output results.ndjson [--workers 4] [--rpm 50]
+
+Each input line is ``{"id": ..., "name": ..., "description": ..., "answers": [...]}``; only
+``description`` is required. One result line per job is appended to ``--output``; rerunning
+the same command skips jobs that already succeeded. ``--replay`` uses an offline scripted
+model client instead of the Anthropic API (no key needed).
+"""
+import argparse
+import asyncio
+import json
+from pathlib import Path
+
+from backend.app.services.ai_agent import AIAgentService
+from backend.app.services.batch_runner import DEFAULT_AUTO_ANSWER, BatchRunner, load_jobs
+from backend.app.services.model_client import ScriptedConversationClient
+from backend.app.services.rate_limiter import PRIORITY_BATCH
+
+
+async def main_async(args: argparse.Namespace) -> dict:
+    client = ScriptedConversationClient(args.replay_turns, args.replay_latency) if args.replay else None
+    agent = AIAgentService(client=client)
+    if args.rpm:
+        agent.cap_priority(PRIORITY_BATCH, args.rpm, burst=args.burst)
+    runner = BatchRunner(agent, workers=args.workers, max_turns=args.max_turns, auto_answer=args.auto_answer)
+    try:
+        return await runner.run(load_jobs(args.jobs), args.output, resume=not args.restart)
+    finally:
+        await agent.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("jobs", type=Path, help="NDJSON file of jobs")
+    parser.add_argument("--output", type=Path, required=True, help="NDJSON results file (appended to)")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rpm", type=float, default=0, help="shared model calls per minute (0 = unlimited)")
+    parser.add_argument("--burst", type=float, default=None, help="calls allowed back to back (default: 1 second's worth)")
+    parser.add_argument("--max-turns", type=int, default=8)
+    parser.add_argument("--auto-answer", default=DEFAULT_AUTO_ANSWER)
+    parser.add_argument("--restart", action="store_true", help="truncate --output instead of resuming")
+    parser.add_argument("--replay", action="store_true", help="use the offline scripted model client")
+    parser.add_argument("--replay-turns", type=int, default=3)
+    parser.add_argument("--replay-latency", type=float, default=0.0)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(main_async(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,582 @@
+"""Tests for the async Anthropic path in AIAgentService: awaitable turns and non-blocking retries."""
+import asyncio
+import json
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from backend.app.services import ai_agent
+from backend.app.services.ai_agent import AIAgentService
+from backend.app.services.model_client import RecordedResponseClient
+from backend.app.services.model_router import ModelRouter
+from backend.app.services.session_store import InMemorySessionStore
+
+
+class FakeMessages:
+    """Stand-in for AsyncAnthropic().messages that replays canned text responses."""
+
+    def __init__(self, responses, delay: float = 0.0):
+        self._responses = list(responses)
+        self._delay = delay
+        self.calls = 0
+        self.last_kwargs = None
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        self.last_kwargs = kwargs
+        if self._delay:
+            await asyncio.sleep(self._delay)
+        item = self._responses.pop(0) if len(self._responses) > 1 else self._responses[0]
+        if isinstance(item, Exception):
+            raise item
+        return SimpleNamespace(content=[SimpleNamespace(text=item)], usage=USAGE)
+
+    def stream(self, **kwargs):
+        return FakeStream(self._responses[0], chunk_size=5)
+
+
+class FakeStream:
+    """Async context manager mimicking AsyncMessageStreamManager with a chunked text_stream."""
+
+    def __init__(self, text: str, chunk_size: int):
+        self._chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    @property
+    async def text_stream(self):
+        for chunk in self._chunks:
+            yield chunk
+
+    async def __aiter__(self):
+        for chunk in self._chunks:
+            yield SimpleNamespace(type="text", text=chunk)
+
+    async def get_final_message(self):
+        return SimpleNamespace(content=[], usage=USAGE)
+
+
+def make_agent(messages: FakeMessages) -> AIAgentService:
+    agent = AIAgentService(client=SimpleNamespace(messages=messages))
+    agent._sessions = InMemorySessionStore(sweep_interval=0)
+    return agent
+
+
+USAGE = SimpleNamespace(input_tokens=40, output_tokens=12, cache_read_input_tokens=3000, cache_creation_input_tokens=0)
+CONTROL = json.dumps({"next_question": "Who are your users?", "done": False, "partial_spec": {"app_type": "Shop"}})
+
+
+@pytest.mark.asyncio
+async def test_call_model_retries_with_asyncio_sleep(monkeypatch):
+    sleeps = []
+
+    async def fake_sleep(seconds):
+        sleeps.append(seconds)
+
+    monkeypatch.setattr("backend.app.services.ai_agent.asyncio.sleep", fake_sleep)
+    messages = FakeMessages([RuntimeError("boom"), "not json at all", CONTROL])
+    agent = make_agent(messages)
+
+    control = await agent._call_model([], "We run a shop.")
+
+    assert control["next_question"] == "Who are your users?"
+    assert messages.calls == 3
+    assert sleeps == [0.5, 1.0]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_turns_do_not_block_each_other():
+    agent = make_agent(FakeMessages([CONTROL], delay=0.2))
+    first = await agent.start_session("a")
+    second = await agent.start_session("b")
+
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        agent.next_turn(first["session_id"], "We sell shoes."),
+        agent.next_turn(second["session_id"], "We sell hats."),
+    )
+    elapsed = time.perf_counter() - started
+
+    assert [r["partial_spec"]["app_type"] for r in results] == ["Shop", "Shop"]
+    assert elapsed < 0.35
+
+
+@pytest.mark.asyncio
+async def test_next_turn_stream_emits_deltas_then_final_state():
+    agent = make_agent(FakeMessages([CONTROL]))
+    session = await agent.start_session("shop")
+
+    events = [e async for e in agent.next_turn_stream(session["session_id"], "We sell shoes.")]
+
+    deltas = [e["data"]["text"] for e in events if e["event"] == "delta"]
+    assert len(deltas) > 1
+    assert "".join(deltas) == "Who are your users?"
+    assert events[-1] == {
+        "event": "final",
+        "data": {"prompt": "Who are your users?", "done": False, "partial_spec": {"app_type": "Shop"}},
+    }
+    assert (await agent._sessions.get(session["session_id"])).partial_spec == {"app_type": "Shop"}
+
+
+@pytest.mark.asyncio
+async def test_next_turn_stream_rejects_unknown_session():
+    agent = make_agent(FakeMessages([CONTROL]))
+    with pytest.raises(ValueError):
+        await agent.next_turn_stream("missing", "hello").__anext__()
+
+
+@pytest.mark.asyncio
+async def test_call_model_marks_system_and_history_prefix_cacheable():
+    messages = FakeMessages([CONTROL])
+    agent = make_agent(messages)
+    history = [
+        {"role": "assistant", "content": "Describe your business."},
+        {"role": "user", "content": "We sell shoes."},
+    ]
+
+    await agent._call_model(history, "Mostly online.")
+
+    system = messages.last_kwargs["system"]
+    assert system[0]["cache_control"] == {"type": "ephemeral"}
+    sent = messages.last_kwargs["messages"]
+    assert sent[-2]["content"] == [{"type": "text", "text": "We sell shoes.", "cache_control": {"type": "ephemeral"}}]
+    assert sent[-1] == {"role": "user", "content": "Mostly online."}
+    assert history[-1]["content"] == "We sell shoes."
+
+
+@pytest.mark.asyncio
+async def test_usage_totals_include_cache_token_counts():
+    agent = make_agent(FakeMessages([CONTROL]))
+    await agent._call_model([], "We sell shoes.")
+    await agent._call_model([], "We sell hats.")
+
+    totals = agent.usage_totals()
+    assert totals["input_tokens"] == 80
+    assert totals["cache_read_input_tokens"] == 6000
+    assert totals["cache_creation_input_tokens"] == 0
+
+
+RECORDED_PATH = Path(__file__).resolve().parent / "fixtures" / "recorded_responses.json"
+
+
+async def _replay(mode: str, monkeypatch):
+    """Replay the recorded conversation in one output mode; returns (client, controls, backoff seconds)."""
+    monkeypatch.setattr(ai_agent.settings, "AGENT_STRUCTURED_OUTPUT", mode == "tool_mode")
+    sleeps = []
+
+    async def fake_sleep(seconds):
+        sleeps.append(seconds)
+
+    monkeypatch.setattr(ai_agent.asyncio, "sleep", fake_sleep)
+    turns = json.loads(RECORDED_PATH.read_text())["turns"]
+    client = RecordedResponseClient([r for turn in turns for r in turn[mode]])
+    agent = make_agent(client.messages)
+    history, controls = [], []
+    for turn in turns:
+        control = await agent._call_model(history, turn["answer"], spec=controls[-1]["partial_spec"] if controls else None)
+        controls.append(control)
+        history += [{"role": "user", "content": turn["answer"]}, {"role": "assistant", "content": json.dumps(control)}]
+    return client, controls, sum(sleeps)
+
+
+@pytest.mark.asyncio
+async def test_structured_output_mode_avoids_parse_retries(monkeypatch):
+    text_client, text_controls, text_backoff = await _replay("text_mode", monkeypatch)
+    tool_client, tool_controls, tool_backoff = await _replay("tool_mode", monkeypatch)
+
+    assert tool_controls == text_controls
+    assert text_client.calls == 6 and tool_client.calls == 4
+    assert tool_backoff == 0 and text_backoff > 0
+    assert tool_client.simulated_latency_s + tool_backoff < text_client.simulated_latency_s + text_backoff
+
+    request = tool_client.last_request()
+    assert request["tool_choice"] == {"type": "tool", "name": "submit_turn"}
+    assert request["tools"][0]["input_schema"]["required"] == ["next_question", "done", "partial_spec"]
+    assert "tools" not in text_client.last_request()
+
+
+@pytest.mark.asyncio
+async def test_tool_input_with_stringified_spec_is_decoded(monkeypatch):
+    monkeypatch.setattr(ai_agent.settings, "AGENT_STRUCTURED_OUTPUT", True)
+    client = RecordedResponseClient([{
+        "tool_name": "submit_turn",
+        "tool_input": {"next_question": "Next?", "done": False, "partial_spec": '{"app_type": "Shop"}'},
+    }])
+    agent = make_agent(client.messages)
+
+    control = await agent._call_model([], "We sell shoes.")
+
+    assert control["partial_spec"] == {"app_type": "Shop"}
+
+
+class ToolStream(FakeStream):
+    """Stream of a forced tool call: partial JSON input events, then a tool_use final message."""
+
+    def __init__(self, tool_input):
+        super().__init__(json.dumps(tool_input), chunk_size=7)
+        self._tool_input = tool_input
+
+    async def __aiter__(self):
+        for chunk in self._chunks:
+            yield SimpleNamespace(type="input_json", partial_json=chunk)
+
+    async def get_final_message(self):
+        block = SimpleNamespace(type="tool_use", id="toolu_1", name="submit_turn", input=self._tool_input)
+        return SimpleNamespace(content=[block], usage=USAGE)
+
+
+@pytest.mark.asyncio
+async def test_stream_reads_question_from_tool_input_deltas(monkeypatch):
+    monkeypatch.setattr(ai_agent.settings, "AGENT_STRUCTURED_OUTPUT", True)
+    messages = FakeMessages([CONTROL])
+    messages.stream = lambda **kwargs: ToolStream(json.loads(CONTROL))
+    agent = make_agent(messages)
+    session = await agent.start_session("shop")
+
+    events = [e async for e in agent.next_turn_stream(session["session_id"], "We sell shoes.")]
+
+    assert "".join(e["data"]["text"] for e in events if e["event"] == "delta") == "Who are your users?"
+    assert events[-1]["data"]["partial_spec"] == {"app_type": "Shop"}
+    assert messages.calls == 0
+
+
+SUGGESTIONS = json.dumps({
+    "option_1": {"reasoning": "Track payments", "new_table": {"name": "payments", "fields": []}, "connections": []},
+    "option_2": {"reasoning": "Merge", "tables_to_merge": ["a", "b"], "merged_table": None, "connections": []},
+})
+
+
+@pytest.mark.asyncio
+async def test_suggest_for_schema_caches_and_coalesces_model_calls():
+    messages = FakeMessages([SUGGESTIONS], delay=0.05)
+    agent = make_agent(messages)
+    schema = {"entities": [{"name": "orders", "fields": [{"name": "id", "type": "uuid", "primary_key": True}]}]}
+
+    concurrent = await asyncio.gather(*(agent.suggest_for_schema(schema, ["x"], []) for _ in range(3)))
+    repeat = await agent.suggest_for_schema(schema, ["x"], [])
+    changed = await agent.suggest_for_schema(schema, ["x", "y"], [])
+
+    assert messages.calls == 2
+    assert all(r["option_1"]["reasoning"] == "Track payments" for r in concurrent + [repeat, changed])
+    prompt = messages.last_kwargs["messages"][0]["content"]
+    assert "orders: id uuid PK" in prompt and "CREATE TABLE" not in prompt
+
+
+@pytest.mark.asyncio
+async def test_suggest_for_schema_does_not_cache_fallback():
+    messages = FakeMessages([RuntimeError("boom"), SUGGESTIONS])
+    agent = make_agent(messages)
+    schema = {"entities": [{"name": "orders", "fields": [{"name": "id", "type": "uuid"}]}]}
+
+    first = await agent.suggest_for_schema(schema)
+    second = await agent.suggest_for_schema(schema)
+
+    assert first["option_1"]["new_table"] is None
+    assert second["option_1"]["reasoning"] == "Track payments"
+
+
+class PerModelMessages:
+    """Fake messages API whose latency (or timeout) depends on the requested model."""
+
+    def __init__(self, delays):
+        self._delays = delays
+        self.models = []
+        self.cancelled = []
+
+    async def create(self, **kwargs):
+        model = kwargs["model"]
+        self.models.append(model)
+        delay = self._delays[model]
+        if isinstance(delay, Exception):
+            raise delay
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled.append(model)
+            raise
+        return SimpleNamespace(content=[SimpleNamespace(text=CONTROL)], usage=USAGE)
+
+
+def make_hedging_agent(messages, **router):
+    agent = make_agent(messages)
+    agent._router = ModelRouter("primary", "fallback", **router)
+    return agent
+
+
+@pytest.mark.asyncio
+async def test_slow_primary_is_hedged_to_fallback_and_loser_cancelled():
+    messages = PerModelMessages({"primary": 1.0, "fallback": 0.01})
+    agent = make_hedging_agent(messages, min_delay=0.05, max_delay=0.05)
+
+    started = time.perf_counter()
+    control = await agent._call_model([], "We sell shoes.")
+
+    assert control["next_question"] == "Who are your users?"
+    assert time.perf_counter() - started < 0.5
+    assert messages.models == ["primary", "fallback"]
+    await asyncio.sleep(0)
+    assert messages.cancelled == ["primary"]
+    stats = agent.latency_stats()
+    assert stats["hedged"] == 1 and stats["hedge_wins"] == 1
+    assert stats["models"]["fallback"]["count"] == 1
+    assert stats["models"]["primary"]["count"] == 0  # cancelled loser is not observed
+
+
+@pytest.mark.asyncio
+async def test_fast_primary_is_not_hedged():
+    messages = PerModelMessages({"primary": 0.01, "fallback": 0.01})
+    agent = make_hedging_agent(messages, min_delay=0.2, max_delay=0.2)
+
+    await agent._call_model([], "We sell shoes.")
+
+    assert messages.models == ["primary"]
+    assert agent.latency_stats()["models"]["primary"]["count"] == 1
+
+
+@pytest.mark.asyncio
+async def test_repeated_primary_timeouts_switch_to_fallback(monkeypatch):
+    async def no_sleep(seconds):
+        pass
+
+    messages = PerModelMessages({"primary": asyncio.TimeoutError(), "fallback": 0.0})
+    agent = make_hedging_agent(messages, swap_after_timeouts=2)
+    monkeypatch.setattr(ai_agent.asyncio, "sleep", no_sleep)
+
+    await agent._call_model([], "We sell shoes.")
+    await agent._call_model([], "We sell hats.")
+
+    assert messages.models == ["primary", "primary", "fallback", "fallback"]
+    assert agent.latency_stats()["preferred_model"] == "fallback"
+
+
+@pytest.mark.asyncio
+async def test_concurrent_turns_on_one_session_keep_both_answers():
+    agent = make_agent(FakeMessages([CONTROL], delay=0.05))
+    session = await agent.start_session("shop")
+    sid = session["session_id"]
+
+    await asyncio.gather(agent.next_turn(sid, "We sell shoes."), agent.next_turn(sid, "Also socks."))
+
+    answers = [m["content"] for m in (await agent._sessions.get(sid)).history if m["role"] == "user"]
+    assert answers == ["We sell shoes.", "Also socks."]
+
+
+@pytest.mark.asyncio
+async def test_turns_on_different_sessions_do_not_wait_for_each_other():
+    agent = make_agent(FakeMessages([CONTROL], delay=0.1))
+    sessions = [await agent.start_session(f"shop {i}") for i in range(4)]
+
+    started = time.perf_counter()
+    await asyncio.gather(*(agent.next_turn(s["session_id"], "We sell shoes.") for s in sessions))
+
+    assert time.perf_counter() - started < 0.3
+
+
+@pytest.mark.asyncio
+async def test_call_attempts_are_accounted_per_session_and_in_finalize(monkeypatch):
+    async def no_sleep(seconds):
+        pass
+
+    monkeypatch.setattr(ai_agent.asyncio, "sleep", no_sleep)
+    agent = make_agent(FakeMessages(["not json", CONTROL]))
+    session = await agent.start_session("shop")
+    sid = session["session_id"]
+
+    await agent.next_turn(sid, "We sell shoes.")
+    finished = await agent.finalize(sid)
+
+    usage = finished["usage"]
+    assert usage["calls"] == 2 and usage["failures"] == 1 and usage["retries"] == 1
+    assert usage["parse_strategies"] == {"failed": 1, "direct": 1}
+    assert usage["input_tokens"] == 80 and usage["cache_read_input_tokens"] == 6000
+    assert 'shipdb_llm_calls_total{phase="chat_turn:question"' in agent.metrics_text()
+
+
+DONE_SPEC = {
+    "app_type": "Shop",
+    "db_type": "postgresql",
+    "entities": [{"name": "orders", "fields": [{"name": "id", "type": "uuid", "primary_key": True}]}],
+}
+DONE_CONTROL = json.dumps({"next_question": "Thanks, that's everything.", "done": True, "partial_spec": DONE_SPEC})
+
+
+@pytest.mark.asyncio
+async def test_artifacts_are_generated_in_background_when_done(monkeypatch):
+    calls = []
+    real_generate_all = ai_agent.generate_all
+
+    def counting_generate_all(spec):
+        calls.append(spec)
+        return real_generate_all(spec)
+
+    monkeypatch.setattr(ai_agent, "generate_all", counting_generate_all)
+    agent = make_agent(FakeMessages([DONE_CONTROL]))
+    sid = (await agent.start_session("shop"))["session_id"]
+
+    turn = await agent.next_turn(sid, "That's all.")
+    assert turn["done"] is True
+    finished = await agent.finalize(sid)
+
+    assert "CREATE TABLE" in finished["artifacts"]["postgres_sql"]
+    assert len(calls) == 1
+    state = await agent._sessions.get(sid)
+    assert state.artifacts == finished["artifacts"]
+    assert (await agent.finalize(sid))["artifacts"] == finished["artifacts"]
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_artifacts_are_invalidated_when_a_later_turn_changes_the_spec():
+    changed = dict(DONE_SPEC, entities=DONE_SPEC["entities"] + [{"name": "customers", "fields": [{"name": "id", "type": "uuid"}]}])
+    reopened = json.dumps({"next_question": "Added customers.", "done": True, "partial_spec": changed})
+    agent = make_agent(FakeMessages([DONE_CONTROL, reopened]))
+    sid = (await agent.start_session("shop"))["session_id"]
+
+    await agent.next_turn(sid, "That's all.")
+    first = await agent.finalize(sid)
+    await agent.next_turn(sid, "Actually, track customers too.")
+    second = await agent.finalize(sid)
+
+    assert "customers" not in first["artifacts"]["postgres_sql"]
+    assert "customers" in second["artifacts"]["postgres_sql"]
+
+
+@pytest.mark.asyncio
+async def test_no_artifacts_while_conversation_is_open():
+    agent = make_agent(FakeMessages([CONTROL]))
+    sid = (await agent.start_session("shop"))["session_id"]
+
+    await agent.next_turn(sid, "We sell shoes.")
+
+    assert agent._artifact_tasks == {}
+    assert (await agent.finalize(sid))["artifacts"] is None
+
+
+OUTLINE_CONTROL = json.dumps({
+    "next_question": "Perfect! I have enough information to create your database design.",
+    "done": True,
+    "partial_spec": {"app_type": "Shop", "db_type": "postgresql", "entities": [
+        {"name": "products", "description": "items for sale", "group": "catalog"},
+        {"name": "categories", "description": "product categories", "group": "catalog"},
+        {"name": "orders", "description": "customer orders", "group": "sales"},
+        {"name": "payments", "description": "order payments", "group": "billing"},
+    ]},
+})
+
+
+class FanOutMessages:
+    """Answers the done turn with an outline and each group call with that group's fields."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.groups = []
+        self.prompts = []
+
+    async def create(self, **kwargs):
+        prompt = kwargs["messages"][-1]["content"]
+        if "ONLY these entities: " not in prompt:
+            return SimpleNamespace(content=[SimpleNamespace(text=OUTLINE_CONTROL)], usage=USAGE)
+        self.prompts.append(prompt)
+        names = prompt.split("ONLY these entities: ")[1].split(". ")[0].split(", ")
+        self.groups.append(names)
+        await asyncio.sleep(self.delay)
+        entities = [{"name": n, "fields": [{"name": "id", "type": "uuid", "primary_key": True}]} for n in names]
+        return SimpleNamespace(content=[SimpleNamespace(text=json.dumps({"entities": entities}))], usage=USAGE)
+
+
+@pytest.mark.asyncio
+async def test_fanout_writes_entity_groups_concurrently(monkeypatch):
+    monkeypatch.setattr(ai_agent.settings, "AGENT_FANOUT_MODE", True, raising=False)
+    monkeypatch.setattr(ai_agent.settings, "AGENT_FANOUT_GROUP_SIZE", 6, raising=False)
+    messages = FanOutMessages(delay=0.2)
+    agent = make_agent(messages)
+    sid = (await agent.start_session("shop"))["session_id"]
+
+    started = time.perf_counter()
+    turn = await agent.next_turn(sid, "That's everything.")
+    elapsed = time.perf_counter() - started
+
+    assert sorted(messages.groups) == [["orders"], ["payments"], ["products", "categories"]]
+    assert elapsed < 0.4  # three 0.2s group calls ran side by side
+    entities = {e["name"]: e for e in turn["partial_spec"]["entities"]}
+    assert list(entities) == ["products", "categories", "orders", "payments"]
+    assert all(e["fields"] and "group" not in e for e in entities.values())
+    assert entities["orders"]["description"] == "customer orders"
+    await agent.close()
+
+
+@pytest.mark.asyncio
+async def test_fanout_splits_large_groups_and_skips_defined_entities(monkeypatch):
+    monkeypatch.setattr(ai_agent.settings, "AGENT_FANOUT_GROUP_SIZE", 1, raising=False)
+    messages = FanOutMessages(delay=0.0)
+    agent = make_agent(messages)
+    spec = {"entities": [{"name": "orders", "fields": [{"name": "total", "type": "decimal"}]}]}
+
+    control = await agent._fan_out(spec, json.loads(OUTLINE_CONTROL))
+
+    assert sorted(messages.groups) == [["categories"], ["payments"], ["products"]]
+    assert all("orders: total decimal" in prompt for prompt in messages.prompts)
+    orders = next(e for e in control["partial_spec"]["entities"] if e["name"] == "orders")
+    assert "fields" not in orders  # kept from the session spec when the turn is merged
+
+
+class ProfileMessages:
+    """Records each call's model and budget; replies are truncated until max_tokens reaches ``fits_at``."""
+
+    def __init__(self, fits_at: int = 0):
+        self.fits_at = fits_at
+        self.calls = []
+
+    async def create(self, **kwargs):
+        self.calls.append((kwargs["model"], kwargs["max_tokens"], kwargs["timeout"]))
+        if kwargs["max_tokens"] < self.fits_at:
+            return SimpleNamespace(content=[SimpleNamespace(text=CONTROL[:30])], usage=USAGE, stop_reason="max_tokens")
+        return SimpleNamespace(content=[SimpleNamespace(text=CONTROL)], usage=USAGE, stop_reason="end_turn")
+
+
+@pytest.mark.asyncio
+async def test_question_and_spec_turns_use_their_profiles(monkeypatch):
+    monkeypatch.setattr(ai_agent.settings, "AGENT_DOMAIN_TEMPLATES", False, raising=False)
+    monkeypatch.setattr(ai_agent.settings, "AGENT_QUESTION_MODEL", "fast-model", raising=False)
+    monkeypatch.setattr(ai_agent.settings, "AGENT_QUESTION_MAX_TOKENS", 1000, raising=False)
+    monkeypatch.setattr(ai_agent.settings, "AGENT_SPEC_MAX_TOKENS", 8000, raising=False)
+    messages = ProfileMessages()
+    agent = make_agent(messages)
+    sid = (await agent.start_session("shop"))["session_id"]
+
+    await agent.next_turn(sid, "We sell shoes.")
+    await agent.next_turn(sid, "That's everything.")
+
+    assert messages.calls[0][:2] == ("fast-model", 1000)
+    assert messages.calls[1][:2] == (agent._model_name, 8000)
+    stats = agent.phase_stats()
+    assert stats["question"]["turns"] == 1 and stats["spec"]["turns"] == 1
+    assert stats["question"]["latency"]["count"] == 1
+    assert 'phase="chat_turn:spec"' in agent.metrics_text()
+
+
+@pytest.mark.asyncio
+async def test_truncated_question_turn_escalates_to_spec_profile(monkeypatch):
+    monkeypatch.setattr(ai_agent.settings, "AGENT_QUESTION_MAX_TOKENS", 1000, raising=False)
+    monkeypatch.setattr(ai_agent.settings, "AGENT_SPEC_MAX_TOKENS", 8000, raising=False)
+    sleeps = []
+
+    async def fake_sleep(seconds):
+        sleeps.append(seconds)
+
+    monkeypatch.setattr(ai_agent.asyncio, "sleep", fake_sleep)
+    messages = ProfileMessages(fits_at=4000)
+    agent = make_agent(messages)
+
+    control = await agent._call_model([], "We sell shoes.", profile=agent._profiles["question"])
+
+    assert control["next_question"] == "Who are your users?"
+    assert [budget for _, budget, _ in messages.calls] == [1000, 8000]
+    assert sleeps == []
+    assert agent.phase_stats()["question"]["escalations"] == 1
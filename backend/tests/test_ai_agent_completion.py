@@ -11,11 +11,13 @@ from backend.app.services.ai_agent import (
     _tfidf_vector,
     _cosine_similarity,
 )
+from backend.app.services.model_client import RecordedResponseClient
+from backend.app.services.session_store import InMemorySessionStore, SessionRecord
 
 
 def make_agent() -> AIAgentService:
-    """Construct an AIAgentService without running __init__ (which requires a live API key)."""
-    return AIAgentService.__new__(AIAgentService)
+    """Construct an AIAgentService on an empty offline client (no API key or network needed)."""
+    return AIAgentService(client=RecordedResponseClient([]))
 
 
 # ---- module-level TF-IDF helpers ----
@@ -89,30 +91,28 @@ def test_empty_or_whitespace_text_is_not_complete():
     assert agent._detect_completion_phrases("   ") is False
 
 
-def test_completion_detection_is_called_from_next_turn(monkeypatch):
+@pytest.mark.asyncio
+async def test_completion_detection_is_called_from_next_turn(monkeypatch):
     """next_turn() should mark done=True when the model's text matches via TF-IDF
     even if it didn't set done=true itself, preserving prior substring-matcher behavior."""
     agent = make_agent()
-    agent._sessions = {}
+    agent._sessions = InMemorySessionStore(sweep_interval=0)
     agent._lock = __import__("threading").Lock()
-    agent._sessions["s1"] = {
-        "history": [{"role": "assistant", "content": "Describe your business."}],
-        "partial_spec": {},
-        "done": False,
-        "project_id": None,
-    }
+    await agent._sessions.put(
+        SessionRecord("s1", "Bakery", history=[{"role": "assistant", "content": "Describe your business."}])
+    )
 
-    monkeypatch.setattr(
-        agent,
-        "_call_model",
-        lambda history, user_msg: {
+    async def fake_call_model(history, user_msg, **kwargs):
+        return {
             "next_question": "Great, I now have all the details required to build this out.",
             "done": False,
             "partial_spec": {"app_type": "Bakery", "db_type": "postgresql", "entities": []},
-        },
-    )
+        }
+
+    monkeypatch.setattr(agent, "_call_model", fake_call_model)
 
-    result = agent.next_turn("s1", "We sell bread and pastries.")
+    result = await agent.next_turn("s1", "We sell bread and pastries.")
+    await agent.close()
     assert result["done"] is True
 
 
@@ -0,0 +1,114 @@
+"""Tests for the offline batch runner: worker bound, shared rate limit, NDJSON output and resume."""
+import asyncio
+import json
+import time
+
+import pytest
+
+from backend.app.services.ai_agent import AIAgentService
+from backend.app.services.batch_runner import BatchJob, BatchRunner, completed_job_ids, load_jobs
+from backend.app.services.model_client import ScriptedConversationClient
+from backend.app.services.session_store import InMemorySessionStore
+
+
+def make_agent(client):
+    agent = AIAgentService(client=client)
+    agent._sessions = InMemorySessionStore(sweep_interval=0)
+    return agent
+
+
+def make_jobs(n):
+    return [BatchJob(f"job-{i}", f"Shop {i}", f"Shop {i} sells handmade goods online") for i in range(n)]
+
+
+def read_rows(path):
+    return [json.loads(line) for line in path.read_text().splitlines() if line.strip()]
+
+
+@pytest.mark.asyncio
+async def test_batch_writes_one_row_per_job_with_artifacts(tmp_path):
+    client = ScriptedConversationClient(turns_to_done=3)
+    agent = make_agent(client)
+    output = tmp_path / "out.ndjson"
+
+    summary = await BatchRunner(agent, workers=3).run(make_jobs(5), output)
+    await agent.close()
+
+    rows = read_rows(output)
+    assert summary["ok"] == 5 and summary["error"] == 0
+    assert sorted(r["id"] for r in rows) == [f"job-{i}" for i in range(5)]
+    for row in rows:
+        assert row["status"] == "ok" and row["done"] is True and row["turns"] == 3
+        assert row["spec"]["app_type"].startswith("Shop")
+        assert "CREATE TABLE" in row["artifacts"]["postgres_sql"]
+        assert row["usage"]["calls"] == 3
+    assert client.calls == 15
+
+
+@pytest.mark.asyncio
+async def test_worker_pool_is_bounded(tmp_path):
+    agent = make_agent(ScriptedConversationClient(turns_to_done=2, latency_s=0.01))
+    runner = BatchRunner(agent, workers=2)
+
+    await runner.run(make_jobs(6), tmp_path / "out.ndjson")
+    await agent.close()
+
+    assert runner.peak_active == 2
+
+
+@pytest.mark.asyncio
+async def test_resume_skips_finished_jobs_and_retries_failures(tmp_path):
+    output = tmp_path / "out.ndjson"
+    output.write_text(
+        json.dumps({"id": "job-0", "status": "ok"}) + "\n"
+        + json.dumps({"id": "job-1", "status": "error"}) + "\n"
+        + '{"id": "job-2", "sta'  # torn write from a killed run
+    )
+    client = ScriptedConversationClient(turns_to_done=1)
+    agent = make_agent(client)
+
+    summary = await BatchRunner(agent, workers=2).run(make_jobs(3), output)
+    await agent.close()
+
+    assert summary["skipped"] == 1 and summary["ran"] == 2
+    assert completed_job_ids(output) == {"job-0", "job-1", "job-2"}
+    assert client.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_failed_job_is_recorded_not_raised(tmp_path):
+    agent = make_agent(ScriptedConversationClient(turns_to_done=1))
+    jobs = [BatchJob("bad", "", "no name"), BatchJob("good", "Good", "A bakery")]
+
+    summary = await BatchRunner(agent, workers=2).run(jobs, tmp_path / "out.ndjson")
+    await agent.close()
+
+    rows = {r["id"]: r for r in read_rows(tmp_path / "out.ndjson")}
+    assert summary["ok"] == 1 and summary["error"] == 1
+    assert rows["bad"]["status"] == "error" and "name is required" in rows["bad"]["error"]
+
+
+@pytest.mark.asyncio
+async def test_max_turns_stops_conversations_that_never_finish(tmp_path):
+    agent = make_agent(ScriptedConversationClient(turns_to_done=50))
+
+    await BatchRunner(agent, workers=1, max_turns=2).run(make_jobs(1), tmp_path / "out.ndjson")
+    await agent.close()
+
+    row = read_rows(tmp_path / "out.ndjson")[0]
+    assert row["status"] == "error" and row["turns"] == 2
+    assert "entities" in row["error"]  # the unfinished spec cannot be generated
+
+
+def test_load_jobs_requires_description_and_unique_ids(tmp_path):
+    path = tmp_path / "jobs.ndjson"
+    path.write_text('{"id": "a", "description": "x"}\n\n{"description": "y"}\n')
+    jobs = load_jobs(path)
+    assert [j.job_id for j in jobs] == ["a", "job-2"] and jobs[1].name == "job-2"
+
+    path.write_text('{"id": "a", "description": "x"}\n{"id": "a", "description": "y"}\n')
+    with pytest.raises(ValueError):
+        load_jobs(path)
+    path.write_text('{"id": "a"}\n')
+    with pytest.raises(ValueError):
+        load_jobs(path)
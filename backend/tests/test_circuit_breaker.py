@@ -0,0 +1,135 @@
+"""Tests for the model-provider circuit breaker and the agent's pooled, pre-warmed HTTP client."""
+import asyncio
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from backend.app.services import ai_agent
+from backend.app.services.ai_agent import AIAgentService
+from backend.app.services.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+def test_opens_once_failure_rate_reached_with_enough_calls():
+    breaker = CircuitBreaker(failure_rate=0.5, min_calls=4, window=60, open_seconds=30)
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED  # only 3 calls so far
+    breaker.record_success()
+    assert breaker.state == CLOSED  # 2/4 failed, exactly the threshold is needed on a failure
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError) as err:
+        breaker.before_call()
+    assert 29 < err.value.retry_after <= 30
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_old_outcomes_leave_the_window():
+    breaker = CircuitBreaker(failure_rate=0.5, min_calls=2, window=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.stats()["window_failures"] == 0
+
+
+def test_half_open_lets_one_probe_through_and_closes_on_success():
+    breaker = CircuitBreaker(min_calls=1, open_seconds=0.02)
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    time.sleep(0.03)
+    breaker.before_call()  # the probe
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # no second probe while the first is in flight
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    breaker.before_call()
+
+
+def test_failed_probe_reopens_and_lost_probe_is_replaced():
+    breaker = CircuitBreaker(min_calls=1, open_seconds=0.02)
+    breaker.record_failure()
+    time.sleep(0.03)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == OPEN and breaker.stats()["opened"] == 2
+
+    time.sleep(0.03)
+    breaker.before_call()  # this probe never reports back
+    time.sleep(0.03)
+    breaker.before_call()  # replaced after open_seconds
+    assert breaker.state == HALF_OPEN
+
+
+class ProviderDown(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class FailingMessages:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.calls = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        raise ProviderDown(self.status_code)
+
+
+@pytest.mark.asyncio
+async def test_agent_fails_fast_once_the_circuit_opens(monkeypatch):
+    monkeypatch.setattr(ai_agent.settings, "AGENT_CIRCUIT_MIN_CALLS", 3)
+    messages = FailingMessages(529)
+    agent = AIAgentService(client=SimpleNamespace(messages=messages))
+
+    async def no_backoff(seconds):
+        pass
+
+    monkeypatch.setattr(ai_agent.asyncio, "sleep", no_backoff)
+    with pytest.raises(RuntimeError):
+        await agent._call_model([], "We bake.")  # three 529s open the circuit
+    assert agent.circuit_stats()["state"] == OPEN
+
+    with pytest.raises(CircuitOpenError):
+        await agent._call_model([], "We bake.")
+    assert messages.calls == 3
+
+
+@pytest.mark.asyncio
+async def test_client_errors_do_not_trip_the_circuit(monkeypatch):
+    monkeypatch.setattr(ai_agent.settings, "AGENT_CIRCUIT_MIN_CALLS", 1)
+    agent = AIAgentService(client=SimpleNamespace(messages=FailingMessages(400)))
+
+    async def no_backoff(seconds):
+        pass
+
+    monkeypatch.setattr(ai_agent.asyncio, "sleep", no_backoff)
+    with pytest.raises(RuntimeError):
+        await agent._call_model([], "We bake.")
+    assert agent.circuit_stats()["state"] == CLOSED
+    assert AIAgentService._is_provider_failure(asyncio.TimeoutError())
+    assert not AIAgentService._is_provider_failure(ValueError("bad json"))
+
+
+@pytest.mark.asyncio
+async def test_live_client_uses_a_tunable_pool_and_warm_up_opens_a_connection(monkeypatch):
+    monkeypatch.setattr(ai_agent.settings, "ANTHROPIC_API_KEY", "test-key")
+    monkeypatch.setattr(ai_agent.settings, "AGENT_MODEL_CLIENT_MODE", "live")
+    monkeypatch.setattr(ai_agent.settings, "ANTHROPIC_MAX_CONNECTIONS", 7)
+    agent = AIAgentService()
+    pool = agent._http_client._transport._pool
+    assert pool._max_connections == 7
+    assert agent._client.max_retries == 0
+    await agent.close()
+    assert agent._http_client.is_closed
+
+    seen = []
+    agent._http_client = httpx.AsyncClient(transport=httpx.MockTransport(lambda r: seen.append(r) or httpx.Response(404)))
+    await agent.warm_up()
+    assert seen and seen[0].url.host == agent._client.base_url.host
+    await agent._http_client.aclose()
@@ -0,0 +1,64 @@
+"""Tests for the precomputed TF-IDF completion detector and its batch API."""
+import pytest
+
+from backend.app.services.completion_detector import (
+    COMPLETION_REFERENCE_PHRASES,
+    COMPLETION_SIMILARITY_THRESHOLD,
+    CompletionDetector,
+    build_idf,
+    cosine_similarity,
+    default_detector,
+    detect_completion_batch,
+    tfidf_vector,
+    tokenize,
+)
+
+TEXTS = [
+    "Perfect! I have enough information to create your database design.",
+    "All set, I can design your database now.",
+    "Great, I now have everything I need to design your database!",
+    "What payment methods do you accept?",
+    "Do customers need accounts, or can they check out as guests?",
+    "Design design design schema schema, unknownword anotherunknown",
+    "information",
+    "",
+    "   ",
+    "!!! ???",
+]
+
+
+def legacy_score(text: str) -> float:
+    """The original per-call implementation: fresh vectors and norms for every comparison."""
+    reference_tokens = [tokenize(p) for p in COMPLETION_REFERENCE_PHRASES]
+    idf = build_idf(reference_tokens)
+    tokens = tokenize(text)
+    if not tokens:
+        return 0.0
+    vec = tfidf_vector(tokens, idf)
+    return max(cosine_similarity(vec, tfidf_vector(ref, idf)) for ref in reference_tokens)
+
+
+@pytest.mark.parametrize("use_numpy", [False, True])
+def test_scores_match_per_call_implementation(use_numpy):
+    detector = CompletionDetector(use_numpy=use_numpy)
+    for text in TEXTS:
+        assert detector.score(text) == pytest.approx(legacy_score(text), abs=1e-12)
+
+
+@pytest.mark.parametrize("use_numpy", [False, True])
+def test_batch_matches_single_calls(use_numpy):
+    detector = CompletionDetector(use_numpy=use_numpy)
+    assert detector.score_batch(TEXTS) == pytest.approx([detector.score(t) for t in TEXTS], abs=1e-12)
+    expected = [bool(t.strip()) and legacy_score(t) >= COMPLETION_SIMILARITY_THRESHOLD for t in TEXTS]
+    assert detector.detect_batch(TEXTS) == expected
+    assert detector.score_batch([]) == []
+
+
+def test_default_detector_uses_numpy():
+    assert default_detector.backend == "numpy"
+    assert CompletionDetector(use_numpy=False).backend == "python"
+
+
+def test_module_batch_api_flags_closing_messages():
+    flags = detect_completion_batch(TEXTS[:5])
+    assert flags == [True, True, True, False, False]
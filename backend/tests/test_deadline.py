@@ -0,0 +1,102 @@
+"""Tests for request deadlines and their propagation through AIAgentService retries."""
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from backend.app.services.ai_agent import AIAgentService
+from backend.app.services.deadline import Deadline, DeadlineExceeded
+from backend.app.services.session_store import InMemorySessionStore
+
+USAGE = SimpleNamespace(input_tokens=10, output_tokens=5, cache_read_input_tokens=0, cache_creation_input_tokens=0)
+CONTROL = json.dumps({"next_question": "Who are your users?", "done": False, "partial_spec": {"app_type": "Shop"}})
+
+
+class SlowMessages:
+    """Honours the per-call ``timeout`` like the SDK: calls slower than it raise TimeoutError."""
+
+    def __init__(self, delays):
+        self.delays = list(delays)
+        self.timeouts = []
+
+    async def create(self, **kwargs):
+        self.timeouts.append(kwargs.get("timeout"))
+        delay = self.delays.pop(0) if len(self.delays) > 1 else self.delays[0]
+        await asyncio.wait_for(asyncio.sleep(delay), kwargs.get("timeout"))
+        return SimpleNamespace(content=[SimpleNamespace(text=CONTROL)], usage=USAGE)
+
+
+def make_agent(messages) -> AIAgentService:
+    agent = AIAgentService(client=SimpleNamespace(messages=messages))
+    agent._sessions = InMemorySessionStore(sweep_interval=0)
+    return agent
+
+
+def test_from_header_defaults_clamps_and_rejects():
+    assert Deadline.from_header(None, default=90.0, maximum=300.0).budget == 90.0
+    assert Deadline.from_header(" 12.5 ", default=90.0, maximum=300.0).budget == 12.5
+    assert Deadline.from_header("9999", default=90.0, maximum=300.0).budget == 300.0
+    for bad in ("soon", "0", "-3", "nan"):
+        with pytest.raises(ValueError):
+            Deadline.from_header(bad, default=90.0, maximum=300.0)
+
+
+def test_timeout_is_cut_to_remaining_budget():
+    deadline = Deadline(5.0)
+    assert deadline.timeout(30.0) <= 5.0
+    assert deadline.timeout(1.0) == 1.0
+    report = deadline.report()
+    assert report["budget_seconds"] == 5.0 and report["used_seconds"] < 1.0
+    deadline.expires_at = time.monotonic() - 1
+    with pytest.raises(DeadlineExceeded):
+        deadline.timeout(30.0)
+
+
+@pytest.mark.asyncio
+async def test_turn_reports_budget_used():
+    agent = make_agent(SlowMessages([0.0]))
+    sid = (await agent.start_session("shop"))["session_id"]
+
+    out = await agent.next_turn(sid, "We sell shoes.", deadline=Deadline(10.0))
+
+    assert out["budget"]["budget_seconds"] == 10.0
+    assert 0 <= out["budget"]["used_seconds"] < 1.0
+
+
+@pytest.mark.asyncio
+async def test_attempt_timeouts_shrink_and_retries_stop_when_budget_is_spent():
+    messages = SlowMessages([5.0])
+    agent = make_agent(messages)
+
+    started = time.perf_counter()
+    with pytest.raises(DeadlineExceeded):
+        await agent._call_model([], "We sell shoes.", deadline=Deadline(0.3))
+    elapsed = time.perf_counter() - started
+
+    assert elapsed < 1.0  # not 3 attempts x the profile timeout
+    assert messages.timeouts[0] <= 0.3
+    assert len(messages.timeouts) <= 2
+
+
+@pytest.mark.asyncio
+async def test_without_deadline_the_profile_timeout_is_used():
+    messages = SlowMessages([0.0])
+    agent = make_agent(messages)
+
+    await agent._call_model([], "We sell shoes.", profile=agent._profiles["question"])
+
+    assert messages.timeouts == [agent._profiles["question"].timeout]
+
+
+@pytest.mark.asyncio
+async def test_suggestions_fall_back_when_budget_runs_out():
+    agent = make_agent(SlowMessages([5.0]))
+    schema = {"entities": [{"name": "orders", "fields": [{"name": "id", "type": "uuid", "primary_key": True}]}]}
+
+    started = time.perf_counter()
+    out = await agent.suggest_for_schema(schema, deadline=Deadline(0.2))
+
+    assert time.perf_counter() - started < 1.0
+    assert out == agent._fallback_suggestions()
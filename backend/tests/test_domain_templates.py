@@ -0,0 +1,186 @@
+"""Tests for the domain template library and the instant first turn it enables in AIAgentService."""
+import asyncio
+import json
+
+import pytest
+
+from backend.app.services import ai_agent
+from backend.app.services.ai_agent import AIAgentService
+from backend.app.services.deadline import Deadline
+from backend.app.services.generation_profile import PHASE_QUESTION
+from backend.app.services.domain_templates import DOMAIN_TEMPLATES, DomainTemplateMatcher
+from backend.app.services.model_client import RecordedResponseClient
+from backend.app.services.schema_generator import generate_all, validate_spec
+
+
+@pytest.fixture
+def matcher():
+    return DomainTemplateMatcher()
+
+
+@pytest.mark.parametrize("domain", sorted(DOMAIN_TEMPLATES))
+def test_every_template_is_a_complete_valid_spec(matcher, domain):
+    spec = matcher.template_spec(domain)
+    ok, errors = validate_spec(spec)
+    assert ok, errors
+    assert "CREATE TABLE" in generate_all(spec)["postgres_sql"]
+
+
+@pytest.mark.parametrize("text,domain", [
+    ("We run a medical clinic with doctors and patients", "healthcare"),
+    ("An online store that sells handmade jewelry", "e-commerce"),
+    ("A platform for rental apartments", "real-estate"),
+    ("A stock trading app", "stock-trading"),
+    ("An online school with courses for students", "education"),
+    ("A social media app where people post photos", "social"),
+])
+def test_matches_clear_descriptions(matcher, text, domain):
+    assert matcher.match(text)[0] == domain
+
+
+@pytest.mark.parametrize("text", [
+    "We run a bakery.",
+    "A marketplace for tutoring",  # e-commerce and education tie: no clear lead
+    "",
+])
+def test_unclear_descriptions_do_not_match(matcher, text):
+    assert matcher.match(text) is None
+
+
+@pytest.mark.parametrize("text", [
+    "We are a law firm tracking cases and clients",
+    "Fleet management for trucks and drivers",
+    "Gym membership with classes and trainers",
+    "a school for dogs with courses",
+])
+def test_unrelated_businesses_do_not_match(matcher, text):
+    assert matcher.match(text) is None
+
+
+def test_templates_are_off_by_default():
+    assert ai_agent.settings.AGENT_DOMAIN_TEMPLATES is False
+
+
+def test_template_spec_is_a_fresh_copy(matcher):
+    spec = matcher.template_spec("social")
+    spec["entities"].clear()
+    assert matcher.template_spec("social")["entities"]
+
+
+def _refined_reply() -> dict:
+    # A complete adapted spec: the clinic has no prescriptions table
+    entities = [
+        {"name": "patients", "fields": [{"name": "id", "type": "uuid"}, {"name": "blood_type", "type": "string"}]},
+        {"name": "doctors", "fields": [{"name": "id", "type": "uuid"}]},
+        {"name": "appointments", "fields": [{"name": "id", "type": "uuid"}]},
+    ]
+    control = {"next_question": "ignored", "done": False, "partial_spec": {"entities": entities}}
+    return {"text": json.dumps(control)}
+
+
+@pytest.mark.asyncio
+async def test_first_turn_answers_from_template_and_refines_in_background(monkeypatch):
+    monkeypatch.setattr(ai_agent.settings, "AGENT_DOMAIN_TEMPLATES", True, raising=False)
+    client = RecordedResponseClient([_refined_reply()], time_scale=1.0, latency_s=0.05)
+    agent = AIAgentService(client=client)
+    try:
+        session = await agent.start_session("Clinic")
+        out = await agent.next_turn(session["session_id"], "We run a medical clinic with doctors and patients")
+        assert out["template"] == "healthcare"
+        assert out["done"] is False
+        assert {e["name"] for e in out["partial_spec"]["entities"]} >= {"patients", "doctors", "appointments"}
+        assert session["session_id"] in agent._refine_tasks  # the model call is still in flight
+
+        await asyncio.wait([agent._refine_tasks[session["session_id"]]])
+        assert client.calls == 1
+        state = await agent._sessions.get(session["session_id"])
+        # The refined spec replaces the template, so unfitting tables can be dropped
+        assert [e["name"] for e in state.partial_spec["entities"]] == ["patients", "doctors", "appointments"]
+        assert [f["name"] for f in state.partial_spec["entities"][0]["fields"]] == ["id", "blood_type"]
+        assert state.partial_spec["app_type"] == "Healthcare Clinic Management"
+        # The follow-up question shown to the user stays in the history
+        assert "healthcare schema" in state.history[-1]["content"]
+    finally:
+        await agent.close()
+
+
+@pytest.mark.asyncio
+async def test_refinement_does_not_overwrite_a_changed_spec(monkeypatch):
+    monkeypatch.setattr(ai_agent.settings, "AGENT_DOMAIN_TEMPLATES", True, raising=False)
+    client = RecordedResponseClient([_refined_reply()], time_scale=1.0, latency_s=0.05)
+    agent = AIAgentService(client=client)
+    try:
+        session = await agent.start_session("Clinic")
+        await agent.next_turn(session["session_id"], "We run a medical clinic with doctors and patients")
+        state = await agent._sessions.get(session["session_id"])
+        state.partial_spec["entities"].append({"name": "rooms", "fields": [{"name": "id", "type": "uuid"}]})
+        await agent._sessions.put(state)
+
+        await asyncio.wait([agent._refine_tasks[session["session_id"]]])
+        assert client.calls == 1
+        state = await agent._sessions.get(session["session_id"])
+        assert {"prescriptions", "rooms"} <= {e["name"] for e in state.partial_spec["entities"]}
+    finally:
+        await agent.close()
+
+
+@pytest.mark.asyncio
+async def test_next_turn_does_not_wait_past_its_budget_for_the_refinement(monkeypatch):
+    monkeypatch.setattr(ai_agent.settings, "AGENT_DOMAIN_TEMPLATES", True, raising=False)
+    monkeypatch.setattr(ai_agent.settings, "AGENT_QUESTION_TIMEOUT_SECONDS", 0.2, raising=False)
+    agent = AIAgentService(client=RecordedResponseClient([]))
+    calls = []
+
+    async def model(history, answer, spec=None, session_id=None, priority=0, profile=None, deadline=None):
+        calls.append((profile.phase, priority))
+        if len(calls) == 1:  # the refinement hangs
+            await asyncio.sleep(30)
+        return {"next_question": "How many locations?", "done": False, "partial_spec": {}}
+
+    monkeypatch.setattr(agent, "_call_model", model)
+    try:
+        session = await agent.start_session("Clinic")
+        await agent.next_turn(session["session_id"], "We run a medical clinic with doctors and patients")
+        refinement = agent._refine_tasks[session["session_id"]]
+        out = await asyncio.wait_for(agent.next_turn(session["session_id"], "One", deadline=Deadline(0.5)), 1.0)
+        assert out["prompt"] == "How many locations?"
+        assert refinement.cancelled()
+        # The refinement is a question-sized call queued like the turn that waits on it
+        assert calls[0] == (PHASE_QUESTION, ai_agent.PRIORITY_INTERACTIVE)
+    finally:
+        await agent.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_refinement_keeps_template(monkeypatch):
+    monkeypatch.setattr(ai_agent.settings, "AGENT_DOMAIN_TEMPLATES", True, raising=False)
+    agent = AIAgentService(client=RecordedResponseClient([]))
+
+    async def unavailable(*args, **kwargs):
+        raise RuntimeError("AI service unavailable after multiple retries. Please try again later.")
+
+    monkeypatch.setattr(agent, "_call_model", unavailable)
+    try:
+        session = await agent.start_session("Shop")
+        out = await agent.next_turn(session["session_id"], "An online store that sells handmade jewelry")
+        await agent._wait_for_refinement(session["session_id"])
+        state = await agent._sessions.get(session["session_id"])
+        assert state.partial_spec == out["partial_spec"]
+    finally:
+        await agent.close()
+
+
+@pytest.mark.asyncio
+async def test_disabled_templates_first_turn_calls_the_model(monkeypatch):
+    reply = {"text": json.dumps({"next_question": "How many locations?", "done": False, "partial_spec": {}})}
+    monkeypatch.setattr(ai_agent.settings, "AGENT_DOMAIN_TEMPLATES", False, raising=False)
+    client = RecordedResponseClient([reply])
+    agent = AIAgentService(client=client)
+    try:
+        session = await agent.start_session("Clinic")
+        out = await agent.next_turn(session["session_id"], "We run a medical clinic with doctors and patients")
+        assert "template" not in out
+        assert out["prompt"] == "How many locations?"
+        assert client.calls == 1
+    finally:
+        await agent.close()
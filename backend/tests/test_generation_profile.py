@@ -0,0 +1,50 @@
+"""Tests for per-phase generation profile selection."""
+import json
+
+from backend.app.services.generation_profile import PHASE_QUESTION, PHASE_SPEC, GenerationProfile, select_phase
+
+OPENING = [{"role": "assistant", "content": "Describe and explain your business."}]
+
+
+def _turn(question: str, answer: str):
+    return [
+        {"role": "user", "content": answer},
+        {"role": "assistant", "content": json.dumps({"next_question": question, "done": False, "partial_spec": {}})},
+    ]
+
+
+def test_first_answer_is_a_question_turn():
+    assert select_phase(OPENING, "We sell handmade shoes online.") == PHASE_QUESTION
+
+
+def test_second_answer_is_a_spec_turn_by_default():
+    # The prompt asks the model to finish after one or two answers, so the second may complete the spec
+    history = OPENING + _turn("Who are your customers?", "We sell shoes.")
+    assert select_phase(history, "Mostly retail buyers.") == PHASE_SPEC
+    assert select_phase(history, "Mostly retail buyers.", spec_after_turns=4) == PHASE_QUESTION
+
+
+def test_turn_count_switches_to_spec():
+    history = OPENING + _turn("Q1?", "a1") + _turn("Q2?", "a2")
+    assert select_phase(history, "a3", spec_after_turns=4) == PHASE_QUESTION
+    history += _turn("Q3?", "a3")
+    assert select_phase(history, "a4", spec_after_turns=4) == PHASE_SPEC
+    assert select_phase(history, "a4", spec_after_turns=0) == PHASE_QUESTION
+
+
+def test_user_completion_answer_switches_to_spec():
+    assert select_phase(OPENING + _turn("Anything else?", "We sell shoes."), "No, that's everything.") == PHASE_SPEC
+
+
+def test_assistant_completion_phrase_switches_to_spec():
+    history = OPENING + _turn("Perfect! I have enough information to create your database design.", "We sell shoes.")
+    assert select_phase(history, "Sounds good") == PHASE_SPEC
+
+
+def test_done_sessions_are_spec_turns():
+    assert select_phase(OPENING, "Add a reviews table", done=True) == PHASE_SPEC
+
+
+def test_profile_without_model_uses_router_default():
+    assert GenerationProfile(PHASE_QUESTION, model="").model is None
+    assert GenerationProfile(PHASE_SPEC, "m", 8000, 60.0).describe() == {"model": "m", "max_tokens": 8000, "timeout_seconds": 60.0}
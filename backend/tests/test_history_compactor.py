@@ -0,0 +1,95 @@
+"""Tests for conversation-history compaction applied before each model call."""
+import json
+
+from backend.app.services.history_compactor import compact_history, estimate_tokens
+
+
+def spec_with_entities(count: int) -> dict:
+    return {
+        "app_type": "Shop",
+        "db_type": "postgresql",
+        "entities": [
+            {"name": f"table_{i}", "fields": [{"name": "id", "type": "uuid", "primary_key": True, "required": True}]}
+            for i in range(count)
+        ],
+    }
+
+
+def build_history(turns: int) -> list:
+    history = [{"role": "assistant", "content": "Describe your business."}]
+    for i in range(turns):
+        history.append({"role": "user", "content": f"Answer number {i}"})
+        control = {"next_question": f"Question {i}?", "done": False, "partial_spec": spec_with_entities(i + 1)}
+        history.append({"role": "assistant", "content": json.dumps(control)})
+    return history
+
+
+def test_assistant_turns_are_reduced_to_their_question():
+    result = compact_history(build_history(3), last_user="More details")
+    assistant = [m["content"] for m in result.messages if m["role"] == "assistant"]
+    assert assistant == ["Describe your business.", "Question 0?", "Question 1?", "Question 2?"]
+
+
+def test_latest_spec_is_sent_once_on_the_final_user_turn():
+    spec = spec_with_entities(4)
+    result = compact_history(build_history(3), last_user="More details", spec=spec)
+    final = result.messages[-1]
+    assert final["role"] == "user"
+    assert json.dumps(spec, separators=(",", ":")) in final["content"]
+    assert final["content"].endswith("More details")
+    assert sum("table_3" in m["content"] for m in result.messages) == 1
+
+
+def test_trailing_duplicate_user_turn_is_not_repeated():
+    history = build_history(1) + [{"role": "user", "content": "We sell shoes."}]
+    result = compact_history(history, last_user="We sell shoes.")
+    assert [m["content"] for m in result.messages].count("We sell shoes.") == 1
+
+
+def test_savings_grow_with_conversation_length():
+    short = compact_history(build_history(2), last_user="ok", spec=spec_with_entities(2))
+    long = compact_history(build_history(10), last_user="ok", spec=spec_with_entities(10))
+    assert long.saved_tokens > short.saved_tokens > 0
+    assert long.compacted_tokens < long.raw_tokens / 3
+
+
+def test_older_turns_are_summarized_when_over_budget():
+    history = [{"role": "assistant", "content": "Describe your business."}]
+    for i in range(12):
+        history.append({"role": "user", "content": f"Detailed answer {i} " + "lorem ipsum " * 40})
+        history.append({"role": "assistant", "content": f"Follow-up question {i}?"})
+
+    result = compact_history(history, last_user="final", token_budget=400, keep_recent=4)
+
+    # 26 messages: the cut moves in chunks of 4, so 20 are summarized and 6 kept
+    assert result.summarized_messages == 20
+    assert result.messages[0]["content"].startswith("Summary of the earlier conversation")
+    assert len(result.messages) == 7
+    assert result.messages[-1] == {"role": "user", "content": "final"}
+
+
+def test_summary_prefix_is_stable_across_consecutive_over_budget_turns():
+    history = [{"role": "assistant", "content": "Describe your business."}]
+    for i in range(11):
+        history.append({"role": "user", "content": f"Detailed answer {i} " + "lorem ipsum " * 40})
+        history.append({"role": "assistant", "content": f"Follow-up question {i}?"})
+
+    first = compact_history(history, last_user="next", token_budget=400, keep_recent=6)
+    history += [{"role": "user", "content": "next"}, {"role": "assistant", "content": "And then?"}]
+    second = compact_history(history, last_user="more", token_budget=400, keep_recent=6)
+
+    assert first.summarized_messages == second.summarized_messages > 0
+    # Everything before the previous turn's final message is unchanged, so it is a prompt-cache hit
+    assert second.messages[: len(first.messages) - 1] == first.messages[:-1]
+
+
+def test_plain_history_without_budget_is_unchanged():
+    history = [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}]
+    result = compact_history(history)
+    assert result.messages == history
+    assert result.saved_tokens == 0
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcd" * 10) == 10
@@ -0,0 +1,42 @@
+"""Corpus tests for the single-pass tolerant JSON extractor used to parse model output."""
+import json
+from pathlib import Path
+
+import pytest
+
+from backend.app.services.ai_agent import AIAgentService
+from backend.app.services.json_extract import extract_json_object, scan_json_object
+
+CORPUS = json.loads((Path(__file__).parent / "fixtures" / "malformed_model_outputs.json").read_text(encoding="utf-8"))
+
+
+@pytest.mark.parametrize("case", CORPUS, ids=[c["name"] for c in CORPUS])
+def test_corpus_case(case):
+    assert extract_json_object(case["text"], required_key="next_question") == case["expected"]
+
+
+@pytest.mark.parametrize("case", CORPUS, ids=[c["name"] for c in CORPUS])
+def test_agent_parse_json_response_matches_corpus(case):
+    agent = AIAgentService.__new__(AIAgentService)
+    assert agent._parse_json_response(case["text"]) == case["expected"]
+
+
+def test_strategy_reports_how_the_object_was_found():
+    clean = '{"next_question": "q", "done": false}'
+    assert scan_json_object(clean, "next_question")[1] == "direct"
+    assert scan_json_object("  " + clean + "\n", "next_question")[1] == "direct"
+    assert scan_json_object("```json\n" + clean + "\n```", "next_question")[1] == "extracted"
+    assert scan_json_object('{"next_question": "a\nb"}', "next_question") == ({"next_question": "a\nb"}, "direct")
+    assert scan_json_object("nothing here", "next_question") == (None, "failed")
+
+
+def test_without_required_key_returns_first_object():
+    assert extract_json_object('prefix {"a": 1} {"b": 2}') == {"a": 1}
+
+
+def test_suggestion_payload_is_found_by_its_own_key():
+    text = 'Here are my ideas:\n```json\n{"option_1": {"reasoning": "x"}, "option_2": {"reasoning": "y"}}\n```'
+    assert extract_json_object(text, required_key="option_1") == {
+        "option_1": {"reasoning": "x"},
+        "option_2": {"reasoning": "y"},
+    }
@@ -0,0 +1,38 @@
+"""Tests for the incremental next_question reader used by the streaming chat endpoint."""
+import json
+
+from backend.app.services.json_stream import StreamingFieldReader
+
+
+def feed_in_chunks(text: str, size: int) -> tuple:
+    reader = StreamingFieldReader("next_question")
+    pieces = [reader.feed(text[i:i + size]) for i in range(0, len(text), size)]
+    return reader, pieces
+
+
+def test_decodes_field_across_arbitrary_chunk_boundaries():
+    control = {"next_question": 'Do you sell "gift cards"?\nAnd café vouchers 🎁', "done": False, "partial_spec": {}}
+    text = json.dumps(control)
+    for size in (1, 2, 3, 7, len(text)):
+        reader, pieces = feed_in_chunks(text, size)
+        assert "".join(pieces) == control["next_question"]
+        assert reader.complete is True
+
+
+def test_emits_question_before_object_is_complete():
+    reader = StreamingFieldReader()
+    assert reader.feed('```json\n{"done": true, "next_question": "Perfect! I have') == "Perfect! I have"
+    assert reader.complete is False
+    assert reader.feed(' enough.", "partial_spec": {"entities": [') == " enough."
+    assert reader.complete is True
+
+
+def test_ignores_nested_keys_with_the_same_name():
+    text = '{"partial_spec": {"next_question": "nested"}, "next_question": "top"}'
+    reader, pieces = feed_in_chunks(text, 4)
+    assert "".join(pieces) == "top"
+
+
+def test_tolerates_raw_newlines_inside_strings():
+    reader = StreamingFieldReader()
+    assert reader.feed('{"next_question": "line one\nline two", "done": false}') == "line one\nline two"
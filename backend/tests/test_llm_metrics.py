@@ -0,0 +1,44 @@
+"""Tests for per-call LLM usage/latency accounting and its Prometheus rendering."""
+from backend.app.services.llm_metrics import CallRecord, LLMMetrics
+
+TOKENS = {"input_tokens": 100, "output_tokens": 20, "cache_read_input_tokens": 3000, "cache_creation_input_tokens": 0}
+
+
+def test_records_aggregate_globally_and_per_session():
+    metrics = LLMMetrics()
+    metrics.record(CallRecord("chat_turn", "m1", 1, 2.0, TOKENS, "failed", ok=False, session_id="s1"))
+    metrics.record(CallRecord("chat_turn", "m1", 2, 1.5, TOKENS, "direct", session_id="s1"))
+    metrics.record(CallRecord("suggestions", "m1", 1, 3.0, TOKENS, "tool"))
+
+    s1 = metrics.session_summary("s1")
+    assert s1["calls"] == 2 and s1["failures"] == 1 and s1["retries"] == 1
+    assert s1["wall_seconds"] == 3.5
+    assert s1["input_tokens"] == 200
+    assert s1["parse_strategies"] == {"failed": 1, "direct": 1}
+    assert metrics.session_summary("unknown") is None
+
+    snap = metrics.snapshot()
+    assert snap["total"]["calls"] == 3 and snap["total"]["cache_read_input_tokens"] == 9000
+    assert [(row["phase"], row["calls"]) for row in snap["by_phase_model"]] == [("chat_turn", 2), ("suggestions", 1)]
+
+
+def test_session_summaries_are_bounded():
+    metrics = LLMMetrics(max_sessions=2)
+    for session_id in ("a", "b", "c"):
+        metrics.record(CallRecord("chat_turn", "m1", 1, 1.0, TOKENS, session_id=session_id))
+    assert metrics.session_summary("a") is None
+    assert metrics.snapshot()["tracked_sessions"] == 2
+
+
+def test_prometheus_text_format():
+    metrics = LLMMetrics()
+    metrics.record(CallRecord("chat_turn", 'model"x', 1, 1.2, TOKENS, "direct"))
+
+    text = metrics.prometheus()
+    assert "# TYPE shipdb_llm_calls_total counter" in text
+    assert 'shipdb_llm_calls_total{phase="chat_turn",model="model\\"x",outcome="ok"} 1' in text
+    assert 'shipdb_llm_tokens_total{phase="chat_turn",model="model\\"x",kind="input_tokens"} 100' in text
+    assert 'shipdb_llm_call_duration_seconds_bucket{phase="chat_turn",model="model\\"x",le="2.0"} 1' in text
+    assert 'shipdb_llm_call_duration_seconds_bucket{phase="chat_turn",model="model\\"x",le="1.0"} 0' in text
+    assert 'shipdb_llm_call_duration_seconds_count{phase="chat_turn",model="model\\"x"} 1' in text
+    assert text.endswith("\n")
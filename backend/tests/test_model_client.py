@@ -0,0 +1,91 @@
+"""Tests for the offline model clients: cassette recording, replay and latency simulation."""
+import json
+
+import pytest
+
+from backend.app.services import ai_agent
+from backend.app.services.ai_agent import AIAgentService
+from backend.app.services.model_client import (
+    RecordedResponseClient,
+    RecordingClient,
+    build_message,
+    dump_message,
+)
+from backend.app.services.session_store import InMemorySessionStore
+
+USAGE = {"input_tokens": 10, "output_tokens": 5, "cache_read_input_tokens": 2, "cache_creation_input_tokens": 0}
+TURNS = [
+    {"text": json.dumps({"next_question": "Who orders?", "done": False, "partial_spec": {"app_type": "Bakery"}}), "usage": USAGE},
+    {"text": json.dumps({"next_question": "Anything else?", "done": False, "partial_spec": {"entities": [{"name": "customers", "fields": [{"name": "id", "type": "uuid", "primary_key": True}]}]}}), "usage": USAGE},
+]
+
+
+def make_agent(client):
+    agent = AIAgentService(client=client)
+    agent._sessions = InMemorySessionStore(sweep_interval=0)
+    return agent
+
+
+async def play(agent, answers):
+    session = await agent.start_session("Bakery")
+    return [await agent.next_turn(session["session_id"], answer) for answer in answers]
+
+
+def test_dump_message_round_trips_text_and_tool_replies():
+    text = {"text": "hello", "usage": USAGE, "stop_reason": "end_turn"}
+    tool = {"tool_name": "submit_turn", "tool_use_id": "toolu_1", "tool_input": {"done": True}, "usage": USAGE, "stop_reason": "tool_use"}
+    assert dump_message(build_message(text)) == text
+    assert dump_message(build_message(tool)) == tool
+
+
+@pytest.mark.asyncio
+async def test_recorded_cassette_replays_the_same_conversation(tmp_path):
+    cassette = tmp_path / "cassettes" / "bakery.json"
+    recorder = RecordingClient(RecordedResponseClient(TURNS), cassette)
+    recorded = await play(make_agent(recorder), ["We bake.", "Customers order cakes."])
+
+    data = json.loads(cassette.read_text())
+    assert data["version"] == 1 and len(data["interactions"]) == 2
+    assert data["interactions"][1]["request"]["messages"][-1]["role"] == "user"
+    assert data["interactions"][0]["response"]["usage"] == USAGE
+
+    replayer = RecordedResponseClient.from_cassette(cassette, time_scale=0)
+    replayed = await play(make_agent(replayer), ["We bake.", "Customers order cakes."])
+    assert replayed == recorded
+    assert replayer.remaining == 0
+
+
+@pytest.mark.asyncio
+async def test_recording_client_saves_failed_calls_as_errors(tmp_path):
+    cassette = tmp_path / "c.json"
+    recorder = RecordingClient(RecordedResponseClient([{"error": "overloaded"}]), cassette)
+    with pytest.raises(RuntimeError):
+        await recorder.messages.create(model="m", messages=[])
+
+    replayer = RecordedResponseClient.from_cassette(cassette, time_scale=0)
+    with pytest.raises(RuntimeError, match="overloaded"):
+        await replayer.messages.create(model="m", messages=[])
+
+
+@pytest.mark.asyncio
+async def test_replay_latency_override_is_simulated_and_scaled():
+    client = RecordedResponseClient([dict(t, latency_s=3.0) for t in TURNS], time_scale=0.001, latency_s=0.5)
+    await client.messages.create(model="m", messages=[])
+    await client.messages.create(model="m", messages=[])
+    assert client.simulated_latency_s == pytest.approx(1.0)
+
+
+def test_replay_mode_builds_the_client_from_settings(tmp_path, monkeypatch):
+    cassette = tmp_path / "c.json"
+    cassette.write_text(json.dumps({"version": 1, "interactions": [{"request": {}, "response": TURNS[0]}]}))
+    monkeypatch.setattr(ai_agent.settings, "AGENT_MODEL_CLIENT_MODE", "replay")
+    monkeypatch.setattr(ai_agent.settings, "AGENT_MODEL_CASSETTE_PATH", str(cassette))
+    monkeypatch.setattr(ai_agent.settings, "AGENT_REPLAY_LATENCY_SECONDS", 0.0)
+
+    agent = AIAgentService()
+    assert isinstance(agent._client, RecordedResponseClient)
+    assert agent._client.remaining == 1
+
+    monkeypatch.setattr(ai_agent.settings, "AGENT_MODEL_CASSETTE_PATH", None)
+    with pytest.raises(RuntimeError):
+        AIAgentService()
@@ -0,0 +1,54 @@
+"""Tests for per-model latency histograms, hedge delays and timeout-driven model swaps."""
+from backend.app.services.model_router import LatencyHistogram, ModelRouter
+
+
+def test_histogram_buckets_and_percentiles():
+    hist = LatencyHistogram(buckets=(1.0, 2.0, 4.0))
+    for seconds in (0.5, 1.5, 1.5, 3.0, 9.0):
+        hist.observe(seconds)
+
+    snap = hist.snapshot()
+    assert snap["buckets"] == {"1.0": 1, "2.0": 3, "4.0": 4, "+Inf": 5}
+    assert snap["count"] == 5 and snap["sum_seconds"] == 15.5
+    assert hist.percentile(0.5) == 1.5
+    assert hist.percentile(0.95, min_samples=10) is None
+
+
+def test_hedge_delay_tracks_percentile_within_bounds():
+    router = ModelRouter("primary", "fallback", hedge_percentile=0.9, min_delay=1.0, max_delay=8.0, min_samples=5)
+    assert router.hedge_delay("primary") == 8.0  # not enough samples yet
+
+    for seconds in (2.0, 2.5, 3.0, 3.5, 4.0):
+        router.record_success("primary", seconds)
+    assert router.hedge_delay("primary") == 4.0
+
+    for _ in range(5):
+        router.record_success("primary", 0.1)
+    assert router.hedge_delay("primary") == 3.5
+    for _ in range(50):
+        router.record_success("primary", 0.1)
+    assert router.hedge_delay("primary") == 1.0
+
+
+def test_no_fallback_means_no_alternate():
+    router = ModelRouter("primary", None)
+    assert router.order() == ("primary", None)
+    assert ModelRouter("primary", "primary").order() == ("primary", None)
+
+
+def test_repeated_timeouts_swap_then_fail_back(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr("backend.app.services.model_router.time.monotonic", lambda: clock[0])
+    router = ModelRouter("primary", "fallback", swap_after_timeouts=2, failback_after=60)
+
+    router.record_timeout("primary")
+    router.record_success("primary", 1.0)
+    router.record_timeout("primary")
+    assert router.order() == ("primary", "fallback")  # streak was reset by the success
+
+    router.record_timeout("primary")
+    assert router.order() == ("fallback", "primary")
+    assert router.stats()["model_swaps"] == 1
+
+    clock[0] += 61
+    assert router.order() == ("primary", "fallback")
@@ -0,0 +1,203 @@
+"""Tests for the shared model-call rate limiter: RPM/TPM budgets, priorities, deadlines and 429 pauses."""
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from backend.app.services import ai_agent
+from backend.app.services.ai_agent import AIAgentService
+from backend.app.services.batch_runner import BatchJob, BatchRunner
+from backend.app.services.model_client import RecordedResponseClient, ScriptedConversationClient
+from backend.app.services.rate_limiter import (
+    PRIORITY_BATCH,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_SUGGESTIONS,
+    PriorityRateLimiter,
+    RateLimitTimeout,
+)
+from backend.app.services.session_store import InMemorySessionStore
+
+
+def drained(rpm=0, tpm=0):
+    limiter = PriorityRateLimiter(requests_per_minute=rpm, tokens_per_minute=tpm)
+    if limiter._requests:
+        limiter._requests.tokens = 0
+    if limiter._tokens:
+        limiter._tokens.tokens = 0
+    return limiter
+
+
+@pytest.mark.asyncio
+async def test_disabled_limiter_admits_immediately():
+    limiter = PriorityRateLimiter()
+    assert not limiter.enabled
+    assert await limiter.acquire(10_000, priority=PRIORITY_BATCH) == 0.0
+    assert limiter.try_acquire(10_000)
+
+
+@pytest.mark.asyncio
+async def test_interactive_calls_jump_ahead_of_queued_background_work():
+    limiter = drained(rpm=1200)  # one request every 50ms
+    admitted = []
+
+    async def call(name, priority):
+        await limiter.acquire(priority=priority)
+        admitted.append(name)
+
+    batch = asyncio.ensure_future(call("batch", PRIORITY_BATCH))
+    await asyncio.sleep(0)
+    suggestions = asyncio.ensure_future(call("suggestions", PRIORITY_SUGGESTIONS))
+    await asyncio.sleep(0)
+    interactive = asyncio.ensure_future(call("interactive", PRIORITY_INTERACTIVE))
+    await asyncio.gather(batch, suggestions, interactive)
+
+    assert admitted == ["interactive", "suggestions", "batch"]
+
+
+@pytest.mark.asyncio
+async def test_priority_cap_spaces_out_batch_calls_but_not_interactive_ones():
+    limiter = PriorityRateLimiter()
+    limiter.cap_priority(PRIORITY_BATCH, 3000, burst=2)  # 50 batch calls/s past a burst of 2
+    assert limiter.enabled
+    started = time.monotonic()
+    await asyncio.gather(*(limiter.acquire(priority=PRIORITY_BATCH) for _ in range(5)))
+    assert time.monotonic() - started >= 0.055  # 3 calls past the burst at 50/s
+
+    batch = asyncio.ensure_future(limiter.acquire(priority=PRIORITY_BATCH))  # waits for its cap
+    await asyncio.sleep(0)
+    assert await asyncio.wait_for(limiter.acquire(priority=PRIORITY_INTERACTIVE), 0.01) < 0.01
+    assert not limiter.try_acquire(priority=PRIORITY_BATCH)
+    await batch
+    assert limiter.stats()["priority_caps"][PRIORITY_BATCH]["requests_per_minute"] == 3000
+
+    limiter.cap_priority(PRIORITY_BATCH, 0)
+    assert not limiter.enabled
+
+
+@pytest.mark.asyncio
+async def test_tokens_per_minute_budget_and_settle_refund():
+    limiter = PriorityRateLimiter(tokens_per_minute=6000)  # 100 tokens/s
+    await limiter.acquire(6000)
+    started = time.monotonic()
+    limiter.settle(6000, 5990)  # the call used 10 fewer tokens than estimated
+    await limiter.acquire(10)
+    assert time.monotonic() - started < 0.05
+    assert limiter.stats()["available_tokens"] <= 1
+
+    limiter.refund(3000)  # a failed call reported no usage
+    assert limiter.stats()["available_tokens"] >= 3000
+
+
+@pytest.mark.asyncio
+async def test_call_that_cannot_start_before_its_deadline_fails_fast():
+    limiter = drained(rpm=60)  # next slot in ~1s
+    started = time.monotonic()
+    with pytest.raises(RateLimitTimeout):
+        await limiter.acquire(deadline=time.monotonic() + 0.05)
+    assert time.monotonic() - started < 0.05
+    assert limiter.stats()["queued"] == 0 and limiter.counters["deadline_exceeded"] == 1
+
+
+@pytest.mark.asyncio
+async def test_queued_call_behind_others_gives_up_at_its_deadline():
+    limiter = drained(rpm=60)
+    head = asyncio.ensure_future(limiter.acquire(priority=PRIORITY_INTERACTIVE))
+    await asyncio.sleep(0)
+    with pytest.raises(RateLimitTimeout):
+        await limiter.acquire(priority=PRIORITY_BATCH, deadline=time.monotonic() + 0.03)
+    head.cancel()
+    await asyncio.gather(head, return_exceptions=True)
+    assert head.cancelled()
+    assert limiter.stats()["queued"] == 0
+
+
+@pytest.mark.asyncio
+async def test_penalize_pauses_admissions_and_blocks_hedges():
+    limiter = PriorityRateLimiter(requests_per_minute=600)
+    limiter.penalize(0.08)
+    assert limiter.try_acquire() is False
+    started = time.monotonic()
+    await limiter.acquire()
+    assert time.monotonic() - started >= 0.07
+    assert limiter.counters["rate_limited"] == 1
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+    def __init__(self, retry_after):
+        super().__init__("rate limited")
+        self.response = SimpleNamespace(headers={"retry-after": str(retry_after)})
+
+
+class FlakyMessages:
+    def __init__(self):
+        self.calls = []
+
+    async def create(self, **kwargs):
+        self.calls.append(time.monotonic())
+        if len(self.calls) == 1:
+            raise RateLimited(0.06)
+        text = json.dumps({"next_question": "Q?", "done": False, "partial_spec": {}})
+        return SimpleNamespace(content=[SimpleNamespace(text=text)], usage=None)
+
+
+@pytest.mark.asyncio
+async def test_429_retry_waits_for_retry_after_through_the_limiter(monkeypatch):
+    monkeypatch.setattr(ai_agent.settings, "ANTHROPIC_REQUESTS_PER_MINUTE", 600)
+    messages = FlakyMessages()
+    agent = AIAgentService(client=SimpleNamespace(messages=messages))
+    slept = []
+
+    async def no_backoff(seconds):
+        slept.append(seconds)
+
+    monkeypatch.setattr(ai_agent.asyncio, "sleep", no_backoff)
+    control = await agent._call_model([], "We bake.")
+
+    assert control["next_question"] == "Q?"
+    assert slept == [0.0]  # no fixed backoff on top of retry-after
+    assert messages.calls[1] - messages.calls[0] >= 0.05
+    assert agent.rate_limit_stats()["rate_limited"] == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_call_refunds_its_token_estimate(monkeypatch):
+    monkeypatch.setattr(ai_agent.settings, "ANTHROPIC_TOKENS_PER_MINUTE", 60_000)
+    messages = FlakyMessages()
+    agent = AIAgentService(client=SimpleNamespace(messages=messages))
+    try:
+        with pytest.raises(RateLimited):
+            await agent._create_message(model="m", max_tokens=100, messages=[{"role": "user", "content": "x" * 4000}])
+        # The 429 reported no usage, so the 1000-token estimate goes back to the bucket
+        assert agent.rate_limit_stats()["available_tokens"] >= 59_999
+        assert len(messages.calls) == 1
+    finally:
+        await agent.close()
+
+
+@pytest.mark.asyncio
+async def test_429_without_limiter_sleeps_retry_after(monkeypatch):
+    agent = AIAgentService(client=RecordedResponseClient([]))
+    assert agent._retry_delay(RateLimited(7), 0.5) == 7.0
+    assert agent._retry_delay(RuntimeError("boom"), 0.5) == 0.5
+
+
+@pytest.mark.asyncio
+async def test_batch_turns_queue_at_batch_priority(tmp_path):
+    agent = AIAgentService(client=ScriptedConversationClient(turns_to_done=1))
+    agent._sessions = InMemorySessionStore(sweep_interval=0)
+    seen = []
+    real_acquire = agent._rate_limiter.acquire
+
+    async def spy(tokens=0, priority=PRIORITY_INTERACTIVE, deadline=None):
+        seen.append((priority, deadline))
+        return await real_acquire(tokens, priority=priority, deadline=deadline)
+
+    agent._rate_limiter.acquire = spy
+    await BatchRunner(agent, workers=1).run([BatchJob("a", "A", "A bakery")], tmp_path / "out.ndjson")
+    await agent.close()
+
+    assert seen == [(PRIORITY_BATCH, None)]
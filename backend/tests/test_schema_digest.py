@@ -0,0 +1,54 @@
+"""Tests for the compact schema digest used in model prompts."""
+from backend.app.services.history_compactor import estimate_tokens
+from backend.app.services.schema_generator import to_postgres_sql, to_schema_digest
+
+SPEC = {
+    "audit_trail": True,
+    "entities": [
+        {
+            "name": "customers",
+            "fields": [
+                {"name": "id", "type": "uuid", "primary_key": True},
+                {"name": "email", "type": "string", "required": True, "unique": True, "max_length": 320},
+                {"name": "status", "type": "enum", "values": ["active", "closed"], "default": "active"},
+            ],
+            "indexes": [{"fields": [{"field": "email"}, {"field": "status", "order": "desc"}], "unique": True, "type": "gin"}],
+        },
+        {
+            "name": "orders",
+            "fields": [
+                {"name": "id", "type": "int", "primary_key": True, "auto_increment": True},
+                {"name": "customer_id", "type": "uuid", "required": True, "foreign_key": {"table": "customers", "field": "id"}},
+                {"name": "total", "type": "decimal", "precision": 10, "scale": 2, "min_value": 0},
+                {"name": "code", "type": "varchar", "length": 12},
+            ],
+            "unique": [["customer_id", "code"]],
+        },
+        {
+            "name": "order_tags",
+            "primary_key": ["order_id", "tag"],
+            "fields": [{"name": "order_id", "type": "int"}, {"name": "tag", "type": "mystery"}],
+            "foreign_keys": [{"columns": ["order_id"], "ref_table": "orders", "ref_columns": ["id"]}],
+        },
+    ],
+}
+
+
+def test_digest_lists_columns_keys_constraints_and_indexes():
+    assert to_schema_digest(SPEC).splitlines() == [
+        "customers: id uuid PK, email string! UQ len[..320], status enum(active|closed) =active"
+        " | IDX(email,-status) unique gin",
+        "orders: id int! PK auto, customer_id uuid! ->customers.id, total decimal(10,2) [0..], code varchar(12)"
+        " | UQ(customer_id,code)",
+        "order_tags: order_id int, tag string | PK(order_id,tag); FK(order_id)->orders(id)",
+        "AUDIT: customers, orders, order_tags",
+    ]
+
+
+def test_digest_is_deterministic_and_empty_for_no_entities():
+    assert to_schema_digest(SPEC) == to_schema_digest({**SPEC})
+    assert to_schema_digest({"entities": []}) == ""
+
+
+def test_digest_is_much_smaller_than_the_ddl():
+    assert estimate_tokens(to_schema_digest(SPEC)) * 5 < estimate_tokens(to_postgres_sql(SPEC))
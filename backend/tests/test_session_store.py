@@ -0,0 +1,121 @@
+"""Tests for the bounded in-memory chat session store."""
+import asyncio
+import sys
+
+import pytest
+
+from backend.app.services.session_store import InMemorySessionStore, SessionLocks, SessionRecord
+
+
+def make_record(session_id: str, turns: int = 0) -> SessionRecord:
+    history = [{"role": "assistant", "content": "Describe your business."}]
+    for i in range(turns):
+        history.append({"role": "user", "content": f"answer {i} " * 20})
+        history.append({"role": "assistant", "content": f"question {i} " * 20})
+    return SessionRecord(session_id, "shop", history=history)
+
+
+def test_session_record_has_no_instance_dict():
+    record = make_record("s1")
+    assert not hasattr(record, "__dict__")
+    assert sys.getsizeof(record) < 200
+
+
+@pytest.mark.asyncio
+async def test_lru_evicts_least_recently_used_session():
+    store = InMemorySessionStore(max_entries=2, idle_ttl=0)
+    await store.put(make_record("a"))
+    await store.put(make_record("b"))
+    assert await store.get("a") is not None  # "b" is now least recently used
+    await store.put(make_record("c"))
+
+    assert await store.get("b") is None
+    assert await store.get("a") is not None
+    assert store.stats()["evictions"] == 1
+
+
+@pytest.mark.asyncio
+async def test_idle_sessions_expire_on_access_and_sweep(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr("backend.app.services.session_store.time.monotonic", lambda: clock[0])
+    store = InMemorySessionStore(idle_ttl=60, sweep_interval=0)
+    await store.put(make_record("old"))
+    clock[0] += 30
+    await store.put(make_record("fresh"))
+    clock[0] += 45
+
+    assert store.sweep() == 1
+    assert await store.get("old") is None
+    assert await store.get("fresh") is not None
+    clock[0] += 61
+    assert await store.get("fresh") is None
+    assert store.stats()["expirations"] == 2
+
+
+@pytest.mark.asyncio
+async def test_long_histories_are_compressed_and_round_trip():
+    store = InMemorySessionStore(compress_after_turns=2, idle_ttl=0)
+    record = make_record("s1", turns=3)
+    expected = record.history
+    uncompressed_bytes = record.approx_bytes()
+
+    await store.put(record)
+
+    assert record.compressed is True
+    assert record.history == expected
+    assert record.approx_bytes() < uncompressed_bytes
+    stats = store.stats()
+    assert stats["compressed_entries"] == 1
+    assert stats["approx_bytes"] == record.approx_bytes()
+
+
+@pytest.mark.asyncio
+async def test_short_histories_stay_uncompressed():
+    store = InMemorySessionStore(compress_after_turns=2, idle_ttl=0)
+    record = make_record("s1", turns=2)
+    await store.put(record)
+    assert record.compressed is False
+
+
+@pytest.mark.asyncio
+async def test_large_store_is_sharded_and_stats_aggregate():
+    store = InMemorySessionStore(max_entries=10000, sweep_interval=0, shards=8)
+    for i in range(100):
+        await store.put(make_record(f"s{i}"))
+    for i in range(100):
+        assert await store.get(f"s{i}") is not None
+
+    stats = store.stats()
+    assert stats["shards"] == 8
+    assert stats["entries"] == 100 and stats["hits"] == 100
+
+
+@pytest.mark.asyncio
+async def test_get_returns_the_stored_record_and_put_bumps_its_version():
+    # In-process sessions are updated in place under SessionLocks; there is no stale copy to reject
+    store = InMemorySessionStore(sweep_interval=0)
+    await store.put(make_record("s1"))
+    record = await store.get("s1")
+    read_version = record.version
+
+    await store.put(record, expected_version=read_version)
+    assert await store.get("s1") is record
+    assert record.version == read_version + 1
+
+
+@pytest.mark.asyncio
+async def test_session_locks_serialize_in_arrival_order_and_clean_up():
+    locks = SessionLocks()
+    order = []
+
+    async def turn(session_id, label, delay):
+        async with locks.hold(session_id):
+            order.append(f"{label}-start")
+            await asyncio.sleep(delay)
+            order.append(f"{label}-end")
+
+    await asyncio.gather(turn("s1", "a", 0.03), turn("s1", "b", 0.0), turn("s2", "c", 0.0))
+
+    assert order.index("a-end") < order.index("b-start")
+    assert order.index("c-end") < order.index("a-end")  # other sessions never wait
+    assert len(locks) == 0
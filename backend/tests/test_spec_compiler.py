@@ -0,0 +1,108 @@
+"""Tests for the compiled spec IR that validate_spec, generate_all and the emitters share."""
+from backend.app.services.schema_generator import (
+    generate_all,
+    to_dynamodb_defs,
+    to_json_schema,
+    to_postgres_sql,
+    to_schema_digest,
+    validate_spec,
+)
+from backend.app.services.spec_compiler import CompiledSpec, compile_spec
+
+SPEC = {
+    "security": {"encryption": "at-rest"},
+    "entities": [
+        {
+            "name": "items",
+            "fields": [
+                {"name": "id", "type": " INT ", "primary_key": True, "auto_increment": True},
+                {"name": "sku", "type": "varchar", "length": 12, "required": True, "unique": True},
+                {"name": "state", "type": "Enum", "values": ["new", "old"]},
+                {"name": "kind", "type": "enum", "values": ["a", "b"], "default": "a"},
+                {"name": "price", "type": "numeric", "precision": 8, "min_value": 0},
+                {"name": "owner_id", "type": "uuid", "foreign_key": {"table": "owners", "field": "id"}},
+                {"name": "id", "type": "string"},
+            ],
+            "indexes": [{"fields": []}, {"fields": [{"field": "price", "order": "desc"}], "type": "gist"}],
+        },
+        {
+            "name": "owners",
+            "primary_key": ["id", "region"],
+            "fields": [{"name": "id", "type": "uuid"}, {"name": "region", "type": "mystery"}],
+        },
+    ],
+}
+
+
+def test_compile_resolves_types_keys_and_lookups_once():
+    compiled = compile_spec(SPEC)
+    items, owners = compiled.entities
+    assert compiled.entity_by_name["owners"] is owners
+    assert [(f.type, f.pg_type, f.json_type, f.dynamo_type) for f in items.fields[:2]] == [
+        ("int", "SERIAL", "integer", "N"),
+        ("varchar", "VARCHAR(12)", "string", "S"),
+    ]
+    assert items.field_by_name["id"] is items.fields[0]  # the first of a duplicated name wins
+    assert [f.name for f in items.pk_fields] == ["id"]
+    assert items.fk_fields[0].references == ("owners", "id")
+    assert [i.position for i in items.indexes] == [1]
+    assert owners.primary_key == ("id", "region")
+    assert owners.fields[1].type == "string"
+
+
+def test_emitters_keep_the_existing_output():
+    sql = to_postgres_sql(SPEC)
+    # Only a literal "enum" type declares the enum; "Enum" still references it
+    assert sql.startswith("CREATE TYPE IF NOT EXISTS items_kind_enum AS ENUM ('a', 'b');\n")
+    assert '  "state" items_state_enum,\n  "kind" items_kind_enum  DEFAULT a,\n  "price" NUMERIC(8,0),\n' in sql
+    assert '  PRIMARY KEY ("id"),\n  UNIQUE ("sku"),\n  FOREIGN KEY ("owner_id") REFERENCES "owners"("id"),\n' in sql
+    assert 'CREATE INDEX IF NOT EXISTS "items_idx_1" ON "items" USING GIST ("price" DESC);' in sql
+    assert 'PRIMARY KEY ("id", "region")' in sql
+
+    (items,) = to_dynamodb_defs(SPEC)  # owners has no column-level key
+    assert [a["AttributeName"] for a in items["AttributeDefinitions"]] == ["id", "id", "owner_id", "price"]
+    assert [g["IndexName"] for g in items["GlobalSecondaryIndexes"]] == ["items_owner_id_gsi", "items_gsi_1"]
+
+
+def test_generate_all_accepts_a_compiled_spec_and_memoizes_text_renderings():
+    compiled = compile_spec(SPEC)
+    assert compile_spec(compiled) is compiled
+    out = generate_all(compiled)
+    assert out == generate_all(SPEC)
+    assert out["security"] == {"encryption": "at-rest"}
+    assert to_postgres_sql(compiled) is out["postgres_sql"]
+    assert to_schema_digest(compiled) is to_schema_digest(compiled)
+    # Dict artifacts are rendered fresh, so callers may mutate them
+    assert to_dynamodb_defs(compiled) is not to_dynamodb_defs(compiled)
+
+
+def test_validation_errors_come_from_the_same_pass():
+    spec = {"entities": [{"fields": []}, {"name": "x"}, {"name": "y", "fields": [{"type": "int"}, {"name": "z"}, "junk"]}]}
+    assert validate_spec(spec) == (False, [
+        "entity.name is required",
+        "x: fields must be a non-empty list",
+        "y: field.name is required",
+        "y.z: field.type is required",
+        "y: field must be an object",
+    ])
+    assert validate_spec([]) == (False, ["spec must be a dict"])
+    assert validate_spec({}) == (False, ["spec.entities must be a non-empty list"])
+    # Nameless fields are reported but kept out of the IR
+    assert [f.name for f in CompiledSpec(spec).entity_by_name["y"].fields] == ["z"]
+
+
+def test_malformed_types_and_index_entries_do_not_crash():
+    spec = {"entities": [{
+        "name": "t",
+        "fields": [{"name": "x", "type": "string", "primary_key": True}, {"name": "y", "type": 5}, {"name": "z", "type": ["int"]}],
+        "indexes": [{"fields": ["x"]}, "junk", {"fields": [{"field": "y", "order": "desc"}, 3]}],
+    }]}
+    assert validate_spec(spec) == (False, ["t.y: field.type must be a string", "t.z: field.type must be a string"])
+    assert [f.type for f in compile_spec(spec).entities[0].fields] == ["string", "string", "string"]
+    # Plain-string index fields name ascending columns
+    sql = to_postgres_sql(spec)
+    assert 'CREATE INDEX IF NOT EXISTS "t_idx_0" ON "t" ("x" ASC);' in sql
+    assert 'CREATE INDEX IF NOT EXISTS "t_idx_2" ON "t" ("y" DESC);' in sql
+    assert to_json_schema(spec)["definitions"]["t"]["properties"]["y"] == {"type": "string"}
+    (table,) = to_dynamodb_defs(spec)
+    assert [g["KeySchema"][0]["AttributeName"] for g in table["GlobalSecondaryIndexes"]] == ["x", "y"]
@@ -0,0 +1,118 @@
+"""Tests for the spec_patch applier used by the optional patch response mode."""
+import copy
+from types import SimpleNamespace
+
+import pytest
+
+from backend.app.services.ai_agent import AIAgentService
+from backend.app.services.session_store import InMemorySessionStore, SessionRecord
+from backend.app.services.spec_patch import SpecIndex, apply_spec_patch
+
+
+def base_spec() -> dict:
+    return {
+        "app_type": "Social",
+        "db_type": "postgresql",
+        "entities": [
+            {"name": "users", "fields": [
+                {"name": "id", "type": "uuid", "primary_key": True, "required": True},
+                {"name": "email", "type": "string", "unique": True, "required": True},
+                {"name": "bio", "type": "text"},
+            ]},
+            {"name": "posts", "fields": [
+                {"name": "id", "type": "uuid", "primary_key": True, "required": True},
+                {"name": "user_id", "type": "uuid", "foreign_key": {"table": "users", "field": "id"}},
+            ]},
+        ],
+    }
+
+
+def field_names(spec: dict, entity: str) -> list:
+    return [f["name"] for e in spec["entities"] if e["name"] == entity for f in e["fields"]]
+
+
+def test_add_update_and_remove_fields_and_entities():
+    spec = base_spec()
+    apply_spec_patch(spec, [
+        {"op": "add_entity", "entity": {"name": "stories", "fields": [{"name": "id", "type": "uuid"}]}},
+        {"op": "add_field", "entity": "users", "field": {"name": "is_admin", "type": "boolean"}},
+        {"op": "update_field", "entity": "users", "field": "email", "changes": {"type": "varchar", "length": 320}},
+        {"op": "remove_field", "entity": "users", "field": "bio"},
+        {"op": "remove_entity", "entity": "posts"},
+        {"op": "set", "key": "app_type", "value": "Social network"},
+    ])
+
+    assert [e["name"] for e in spec["entities"]] == ["users", "stories"]
+    assert field_names(spec, "users") == ["id", "email", "is_admin"]
+    email = next(f for f in spec["entities"][0]["fields"] if f["name"] == "email")
+    assert email == {"name": "email", "type": "varchar", "unique": True, "required": True, "length": 320}
+    assert spec["app_type"] == "Social network"
+    assert "__removed__" not in str(spec)
+
+
+def test_add_entity_for_existing_name_upserts_fields():
+    spec = base_spec()
+    apply_spec_patch(spec, [{"op": "add_entity", "entity": {"name": "posts", "fields": [
+        {"name": "user_id", "type": "uuid", "required": True},
+        {"name": "body", "type": "text"},
+    ]}}])
+    assert field_names(spec, "posts") == ["id", "user_id", "body"]
+    user_id = next(f for e in spec["entities"] if e["name"] == "posts" for f in e["fields"] if f["name"] == "user_id")
+    assert user_id["required"] is True
+    assert user_id["foreign_key"] == {"table": "users", "field": "id"}
+
+
+def test_rename_entity_and_field_keeps_index_consistent():
+    spec = base_spec()
+    index = apply_spec_patch(spec, [
+        {"op": "update_entity", "entity": "posts", "changes": {"name": "articles"}},
+        {"op": "update_field", "entity": "articles", "field": "user_id", "changes": {"name": "author_id"}},
+    ])
+    index = apply_spec_patch(spec, [{"op": "remove_field", "entity": "articles", "field": "author_id"}], index)
+    assert field_names(spec, "articles") == ["id"]
+    assert set(index.entities) == {"users", "articles"}
+
+
+def test_invalid_ops_are_skipped_without_touching_the_spec():
+    spec = base_spec()
+    before = copy.deepcopy(spec)
+    apply_spec_patch(spec, [
+        {"op": "remove_field", "entity": "missing", "field": "id"},
+        {"op": "update_field", "entity": "users", "field": "missing", "changes": {"type": "text"}},
+        {"op": "explode"},
+        "not-a-dict",
+        {"op": "set", "key": "entities", "value": []},
+    ])
+    assert spec == before
+
+
+def test_index_is_reused_for_the_same_spec_and_rebuilt_for_another():
+    spec = base_spec()
+    index = SpecIndex(spec)
+    assert apply_spec_patch(spec, [], index) is index
+    assert apply_spec_patch(base_spec(), [], index) is not index
+
+
+@pytest.mark.asyncio
+async def test_next_turn_applies_spec_patch_to_the_stored_spec(monkeypatch):
+    agent = AIAgentService(client=SimpleNamespace(messages=None))
+    agent._sessions = InMemorySessionStore(sweep_interval=0)
+    await agent._sessions.put(SessionRecord("s1", "Social", partial_spec=base_spec()))
+
+    async def fake_call_model(history, user_msg, **kwargs):
+        return {
+            "next_question": "Added stories.",
+            "done": True,
+            "partial_spec": {},
+            "spec_patch": [{"op": "add_entity", "entity": {"name": "stories", "fields": [{"name": "id", "type": "uuid"}]}}],
+        }
+
+    monkeypatch.setattr(agent, "_call_model", fake_call_model)
+    try:
+        result = await agent.next_turn("s1", "add stories feature")
+
+        assert [e["name"] for e in result["partial_spec"]["entities"]] == ["users", "posts", "stories"]
+        record = await agent._sessions.get("s1")
+        assert record.spec_index is not None and "stories" in record.spec_index.entities
+    finally:
+        await agent.close()  # the finished spec starts background artifact generation
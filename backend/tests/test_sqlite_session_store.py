@@ -0,0 +1,285 @@
+"""Tests for the shared SQLite session backend (write-behind batching, read-through cache)."""
+import asyncio
+
+import pytest
+
+from backend.app.core.config import Settings
+from backend.app.services import ai_agent
+from backend.app.services.ai_agent import AIAgentService
+from backend.app.services.session_store import (
+    InMemorySessionStore,
+    SessionConflictError,
+    SessionRecord,
+    SqliteSessionStore,
+    create_session_store,
+    sqlite_path_from_url,
+)
+
+
+def make_record(session_id: str) -> SessionRecord:
+    return SessionRecord(session_id, "shop", history=[{"role": "assistant", "content": "Describe your business."}])
+
+
+@pytest.mark.asyncio
+async def test_session_written_by_one_worker_is_visible_to_another(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    worker_a = SqliteSessionStore(path, flush_interval=60, sweep_interval=0)
+    worker_b = SqliteSessionStore(path, flush_interval=60, sweep_interval=0)
+    try:
+        await worker_a.put(make_record("s1"), durable=True)
+
+        record = await worker_b.get("s1")
+        assert record is not None
+        record.history = record.history + [{"role": "user", "content": "We sell shoes."}]
+        record.partial_spec = {"app_type": "Shoe shop"}
+        await worker_b.put(record, durable=True)
+
+        # worker_a still has the stale copy cached; the version check must force a reload
+        reloaded = await worker_a.get("s1")
+        assert reloaded.partial_spec == {"app_type": "Shoe shop"}
+        assert reloaded.history[-1]["content"] == "We sell shoes."
+    finally:
+        await worker_a.close()
+        await worker_b.close()
+
+
+@pytest.mark.asyncio
+async def test_writes_are_batched_behind_the_caller(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    store = SqliteSessionStore(path, flush_interval=60, sweep_interval=0)
+    reader = SqliteSessionStore(path, flush_interval=60, sweep_interval=0)
+    try:
+        for i in range(25):
+            await store.put(make_record(f"s{i}"))
+        assert store.stats()["pending_writes"] == 25
+        assert await store.get("s3") is not None  # served from the local write queue
+        assert await reader.get("s3") is None  # not flushed yet
+
+        assert await store.flush() == 25
+        stats = store.stats()
+        assert stats["flushes"] == 1
+        assert stats["pending_writes"] == 0
+        assert (await reader.get("s3")).session_id == "s3"
+    finally:
+        await store.close()
+        await reader.close()
+
+
+@pytest.mark.asyncio
+async def test_close_flushes_pending_writes(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    store = SqliteSessionStore(path, flush_interval=60, sweep_interval=0)
+    await store.put(make_record("s1"))
+    await store.close()
+
+    reopened = SqliteSessionStore(path, sweep_interval=0)
+    try:
+        assert (await reopened.get("s1")).name == "shop"
+    finally:
+        await reopened.close()
+
+
+def test_create_session_store_selects_backend(tmp_path):
+    memory = create_session_store(Settings(SESSION_BACKEND="memory"))
+    assert isinstance(memory, InMemorySessionStore)
+
+    url = f"sqlite+aiosqlite:///{tmp_path}/shipdb.db"
+    sqlite = create_session_store(Settings(SESSION_BACKEND="sqlite", DATABASE_URL=url))
+    assert isinstance(sqlite, SqliteSessionStore)
+    assert sqlite.path == f"{tmp_path}/shipdb.db"
+
+
+def test_sqlite_path_from_url_rejects_non_sqlite_urls():
+    assert sqlite_path_from_url("sqlite+aiosqlite:///./shipdb.db") == "./shipdb.db"
+    with pytest.raises(ValueError):
+        sqlite_path_from_url("postgresql://localhost/shipdb")
+    with pytest.raises(ValueError):
+        sqlite_path_from_url("sqlite+aiosqlite:///:memory:")
+
+
+@pytest.mark.asyncio
+async def test_background_flusher_persists_without_explicit_flush(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    store = SqliteSessionStore(path, flush_interval=0.01, sweep_interval=0)
+    reader = SqliteSessionStore(path, sweep_interval=0)
+    try:
+        await store.put(make_record("s1"))
+        for _ in range(50):
+            if store.stats()["flushes"]:
+                break
+            await asyncio.sleep(0.01)
+        assert (await reader.get("s1")) is not None
+    finally:
+        await store.close()
+        await reader.close()
+
+
+@pytest.mark.asyncio
+async def test_stale_worker_put_conflicts_instead_of_overwriting(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    worker_a = SqliteSessionStore(path, flush_interval=60, sweep_interval=0)
+    worker_b = SqliteSessionStore(path, flush_interval=60, sweep_interval=0)
+    try:
+        await worker_a.put(make_record("s1"), durable=True)
+        stale = await worker_a.get("s1")
+        fresh = await worker_b.get("s1")
+        read_version = stale.version
+
+        fresh.partial_spec = {"app_type": "From B"}
+        await worker_b.put(fresh, durable=True, expected_version=read_version)
+        stale.partial_spec = {"app_type": "From A"}
+        with pytest.raises(SessionConflictError):
+            await worker_a.put(stale, expected_version=read_version)
+
+        assert (await worker_a.get("s1")).partial_spec == {"app_type": "From B"}
+    finally:
+        await worker_a.close()
+        await worker_b.close()
+
+
+@pytest.mark.asyncio
+async def test_flush_never_overwrites_a_newer_row(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    worker_a = SqliteSessionStore(path, flush_interval=60, sweep_interval=0)
+    worker_b = SqliteSessionStore(path, flush_interval=60, sweep_interval=0)
+    try:
+        await worker_a.put(make_record("s1"), durable=True)
+        a_copy = await worker_a.get("s1")
+        b_copy = await worker_b.get("s1")
+        b_copy.partial_spec = {"app_type": "Newer"}
+        await worker_b.put(b_copy, durable=True)
+        await worker_b.put(b_copy, durable=True)
+
+        a_copy.partial_spec = {"app_type": "Older"}
+        await worker_a.put(a_copy)  # queued without a version check
+        assert await worker_a.flush() == 0
+
+        assert (await worker_a.get("s1")).partial_spec == {"app_type": "Newer"}
+        assert worker_a.stats()["stale_writes_skipped"] == 1
+    finally:
+        await worker_a.close()
+        await worker_b.close()
+
+
+@pytest.mark.asyncio
+async def test_only_one_of_two_concurrent_versioned_puts_wins(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    worker_a = SqliteSessionStore(path, flush_interval=60, sweep_interval=0)
+    worker_b = SqliteSessionStore(path, flush_interval=60, sweep_interval=0)
+    reader = SqliteSessionStore(path, flush_interval=60, sweep_interval=0)
+    try:
+        await worker_a.put(make_record("s1"), durable=True)
+        a_copy, b_copy = await worker_a.get("s1"), await worker_b.get("s1")
+        read_version = a_copy.version
+        a_copy.partial_spec = {"app_type": "From A"}
+        b_copy.partial_spec = {"app_type": "From B"}
+
+        outcomes = await asyncio.gather(
+            worker_a.put(a_copy, expected_version=read_version),
+            worker_b.put(b_copy, expected_version=read_version),
+            return_exceptions=True,
+        )
+
+        conflicts = [o for o in outcomes if isinstance(o, SessionConflictError)]
+        assert len(conflicts) == 1 and outcomes.count(None) == 1
+        winner = "From A" if outcomes[0] is None else "From B"
+        stored = await reader.get("s1")  # committed before put returned, no flush needed
+        assert stored.partial_spec == {"app_type": winner}
+        assert stored.version == read_version + 1
+    finally:
+        await worker_a.close()
+        await worker_b.close()
+        await reader.close()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_turns_on_two_workers_are_both_kept(tmp_path, monkeypatch):
+    monkeypatch.setattr(ai_agent.settings, "AGENT_DOMAIN_TEMPLATES", False, raising=False)
+    path = str(tmp_path / "sessions.db")
+    agents = [AIAgentService(client=None) for _ in range(2)]
+    for agent in agents:
+        await agent._sessions.close()
+        agent._sessions = SqliteSessionStore(path, flush_interval=60, sweep_interval=0)
+
+    def fake_call_model(entity):
+        async def call(history, user_msg, **kwargs):
+            await asyncio.sleep(0.05)  # both workers read the same version before either writes
+            return {
+                "next_question": "Anything else?",
+                "done": False,
+                "partial_spec": {"entities": [{"name": entity, "fields": [{"name": "id", "type": "uuid"}]}]},
+            }
+        return call
+
+    monkeypatch.setattr(agents[0], "_call_model", fake_call_model("orders"))
+    monkeypatch.setattr(agents[1], "_call_model", fake_call_model("customers"))
+    try:
+        sid = (await agents[0].start_session("shop"))["session_id"]
+        await asyncio.gather(
+            agents[0].next_turn(sid, "We take orders."),
+            agents[1].next_turn(sid, "We have customers."),
+        )
+
+        reader = SqliteSessionStore(path, flush_interval=60, sweep_interval=0)
+        try:
+            state = await reader.get(sid)
+        finally:
+            await reader.close()
+        answers = [m["content"] for m in state.history if m["role"] == "user"]
+        assert sorted(answers) == ["We have customers.", "We take orders."]
+        assert {e["name"] for e in state.partial_spec["entities"]} == {"orders", "customers"}
+    finally:
+        for agent in agents:
+            await agent.close()
+
+
+@pytest.mark.asyncio
+async def test_project_id_from_finalize_survives_a_concurrent_turn(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    agents = [AIAgentService(client=None) for _ in range(2)]
+    for agent in agents:
+        await agent._sessions.close()
+        agent._sessions = SqliteSessionStore(path, flush_interval=60, sweep_interval=0)
+    try:
+        sid = (await agents[0].start_session("shop"))["session_id"]
+        await agents[0]._sessions.flush()
+        stale = await agents[1]._sessions.get(sid)  # a turn on the other worker reads this version
+
+        project_id = (await agents[0].finalize(sid))["project_id"]
+        stale.partial_spec = {"app_type": "Shoe shop"}
+        with pytest.raises(SessionConflictError):
+            await agents[1]._sessions.put(stale, expected_version=stale.version)
+
+        await agents[0]._sessions.flush()
+        assert (await agents[1].finalize(sid))["project_id"] == project_id
+    finally:
+        for agent in agents:
+            await agent.close()
+
+
+@pytest.mark.asyncio
+async def test_artifacts_are_dropped_when_another_worker_wrote_first(tmp_path, monkeypatch):
+    path = str(tmp_path / "sessions.db")
+    agent = AIAgentService(client=None)
+    await agent._sessions.close()
+    agent._sessions = store = SqliteSessionStore(path, flush_interval=60, sweep_interval=0)
+    other = SqliteSessionStore(path, flush_interval=60, sweep_interval=0)
+    spec = {"entities": [{"name": "orders", "fields": [{"name": "id", "type": "uuid", "primary_key": True}]}]}
+    try:
+        record = SessionRecord("s1", "shop", partial_spec=spec, done=True)
+        await store.put(record, durable=True)
+        read = store.get
+
+        async def get_then_lose_the_race(session_id):
+            state = await read(session_id)
+            theirs = await other.get(session_id)
+            await other.put(theirs, expected_version=theirs.version)
+            return state
+
+        monkeypatch.setattr(store, "get", get_then_lose_the_race)
+        assert await agent._generate_artifacts("s1", spec, ai_agent.spec_hash(spec)) is None
+        monkeypatch.undo()
+        assert (await other.get("s1")).artifacts is None
+    finally:
+        await other.close()
+        await agent.close()
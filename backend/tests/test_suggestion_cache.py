@@ -0,0 +1,102 @@
+"""Tests for the schema-suggestion cache: canonical keys, LRU/TTL and single-flight coalescing."""
+import asyncio
+
+import pytest
+
+from backend.app.services.suggestion_cache import SuggestionCache, suggestion_key
+
+SCHEMA = {"entities": [{"name": "orders", "fields": [{"name": "id", "type": "uuid"}]}]}
+RESULT = {"option_1": {"reasoning": "add payments"}, "option_2": {"reasoning": "merge"}}
+
+
+def test_key_ignores_dict_and_exclusion_order():
+    reordered = {"entities": [{"fields": [{"type": "uuid", "name": "id"}], "name": "orders"}]}
+    assert suggestion_key(SCHEMA, ["a", "b"], ["c"]) == suggestion_key(reordered, ["b", "a", "a"], ["c"])
+    assert suggestion_key(SCHEMA, ["a"], []) != suggestion_key(SCHEMA, [], ["a"])
+    assert suggestion_key(SCHEMA) != suggestion_key({"entities": []})
+
+
+@pytest.mark.asyncio
+async def test_hit_skips_compute_and_returns_independent_copy():
+    cache = SuggestionCache()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return RESULT
+
+    first = await cache.get_or_compute("k", compute)
+    first["option_1"]["reasoning"] = "mutated"
+    second = await cache.get_or_compute("k", compute)
+
+    assert len(calls) == 1
+    assert second == RESULT
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_requests_share_one_call():
+    cache = SuggestionCache()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return RESULT
+
+    results = await asyncio.gather(*(cache.get_or_compute("k", compute) for _ in range(5)))
+
+    assert len(calls) == 1
+    assert all(r == RESULT for r in results)
+    assert cache.stats()["coalesced"] == 4
+    assert cache.stats()["inflight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_leader_does_not_cancel_shared_call():
+    cache = SuggestionCache()
+
+    async def compute():
+        await asyncio.sleep(0.05)
+        return RESULT
+
+    leader = asyncio.ensure_future(cache.get_or_compute("k", compute))
+    await asyncio.sleep(0)
+    follower = asyncio.ensure_future(cache.get_or_compute("k", compute))
+    await asyncio.sleep(0)
+    leader.cancel()
+
+    assert await follower == RESULT
+
+
+@pytest.mark.asyncio
+async def test_failures_are_not_cached():
+    cache = SuggestionCache()
+    outcomes = [RuntimeError("model down"), RESULT]
+
+    async def compute():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    with pytest.raises(RuntimeError):
+        await cache.get_or_compute("k", compute)
+    assert await cache.get_or_compute("k", compute) == RESULT
+
+
+def test_lru_eviction_and_ttl_expiry(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr("backend.app.services.suggestion_cache.time.monotonic", lambda: clock[0])
+    cache = SuggestionCache(max_entries=2, ttl=60)
+    cache.put("a", RESULT)
+    cache.put("b", RESULT)
+    assert cache.get("a") == RESULT
+    cache.put("c", RESULT)
+
+    assert cache.get("b") is None
+    assert cache.stats()["evictions"] == 1
+
+    clock[0] += 61
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1